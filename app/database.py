@@ -1,23 +1,100 @@
+import ipaddress
 import os
 import logging
-from datetime import datetime
-from sqlalchemy import create_engine, Column, String, Boolean, DateTime
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from importlib import import_module
+from typing import TYPE_CHECKING, Optional, Tuple
+from sqlalchemy import (
+    and_,
+    create_engine,
+    delete,
+    func,
+    insert,
+    inspect,
+    make_url,
+    select,
+    text,
+    Column,
+    String,
+    Boolean,
+    DateTime,
+    Integer,
+    LargeBinary,
+)
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.types import TypeDecorator
+
+if TYPE_CHECKING:
+    # imported on first use: the asyncio extension and the dialect
+    # modules are slow to import and most processes need only one of them
+    from sqlalchemy.ext.asyncio import AsyncSession
 
 
 Base = declarative_base()
 _engine = None
 _SessionLocal = None
+_async_engine = None
+_AsyncSessionLocal = None
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
 
 logger = logging.getLogger(__name__)
 
+_store_observer = None
+
+
+def set_store_observer(observer):
+    """
+    Registers `observer(store, operation, seconds)`, called after every
+    store operation; pass None to stop observing.
+    """
+    global _store_observer
+    _store_observer = observer
+
+
+def _timed(operation: str):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            observer = _store_observer
+            if observer is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                observer(type(self).__name__, operation, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
 
 def reset_engine():
-    global _engine, _SessionLocal
+    global _engine, _SessionLocal, _async_engine, _AsyncSessionLocal
     if _engine is not None:
         _engine.dispose()
     _engine = None
     _SessionLocal = None
+    _async_engine = None
+    _AsyncSessionLocal = None
+
+
+async def dispose_async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _AsyncSessionLocal = None
 
 
 def _build_database_url():
@@ -44,6 +121,20 @@ def _build_database_url():
         return "sqlite:///./app.db"
 
 
+def _build_pool_options(db_url) -> dict:
+    """Build connection pool settings from DB_POOL_* environment variables."""
+    url = make_url(db_url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", -1)),
+        "pool_pre_ping": bool(int(os.getenv("DB_POOL_PRE_PING", 1))),
+    }
+
+
 def get_engine():
     global _engine, _SessionLocal
     if _engine is None:
@@ -51,7 +142,9 @@ def get_engine():
         connect_args = {}
         if db_url.startswith("sqlite"):
             connect_args["check_same_thread"] = False
-        _engine = create_engine(db_url, connect_args=connect_args)
+        _engine = create_engine(
+            db_url, connect_args=connect_args, **_build_pool_options(db_url)
+        )
         _SessionLocal = sessionmaker(bind=_engine)
     return _engine
 
@@ -62,9 +155,260 @@ def get_session():
     return _SessionLocal()
 
 
-def init_db():
+def _build_async_database_url():
+    """Swap the driver of the configured database URL for its asyncio counterpart."""
+    url = make_url(_build_database_url())
+    async_driver = ASYNC_DRIVERS.get(url.drivername)
+    if async_driver is None:
+        return url
+    return url.set(drivername=async_driver)
+
+
+def get_async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        async_url = _build_async_database_url()
+        pool_options = _build_pool_options(async_url)
+        if pool_options and async_url.get_backend_name() == "sqlite":
+            pool_options["poolclass"] = AsyncAdaptedQueuePool
+        _async_engine = create_async_engine(async_url, **pool_options)
+        _AsyncSessionLocal = async_sessionmaker(bind=_async_engine, expire_on_commit=False)
+    return _async_engine
+
+
+def get_async_session() -> "AsyncSession":
+    if _AsyncSessionLocal is None:
+        get_async_engine()
+    return _AsyncSessionLocal()
+
+
+def _pool_stats(engine) -> dict:
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if method is not None:
+            stats[name] = method()
+    return stats
+
+
+def get_pool_stats() -> dict:
+    """Report size and checkout counts of the sync and async connection pools."""
+    stats = {}
+    if _engine is not None:
+        stats["sync"] = _pool_stats(_engine)
+    if _async_engine is not None:
+        stats["async"] = _pool_stats(_async_engine.sync_engine)
+    return stats
+
+
+# bump whenever init_db gains work that existing databases need
+SCHEMA_VERSION = 1
+
+
+def _schema_version(engine) -> Optional[int]:
+    try:
+        with engine.connect() as connection:
+            return connection.execute(
+                select(SchemaVersion.version).where(SchemaVersion.id == 1)
+            ).scalar()
+    except SQLAlchemyError:
+        # no marker table yet
+        return None
+
+
+def init_db() -> bool:
+    """
+    Creates missing tables and indexes and migrates old rows, then records
+    `SCHEMA_VERSION` in `schema_version`. When the marker is already
+    current all of that is skipped, so a warm start costs one query
+    instead of a catalog lookup per table and index. Returns whether the
+    schema work ran.
+    """
     engine = get_engine()
+    if _schema_version(engine) == SCHEMA_VERSION:
+        return False
     Base.metadata.create_all(bind=engine)
+    # create_all skips indexes of tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    packed = pack_legacy_ips(engine)
+    if packed:
+        logger.info(f"Packed {packed} legacy text IPs in successful_spell_ips")
+    try:
+        with engine.begin() as connection:
+            connection.execute(delete(SchemaVersion))
+            connection.execute(insert(SchemaVersion).values(id=1, version=SCHEMA_VERSION))
+    except IntegrityError:
+        # another worker recorded the marker first
+        pass
+    return True
+
+
+# marks non-IP hosts in a packed IP column; never part of UTF-8 text
+_TEXT_MARKER = b"\xff"
+_PACKED_LENGTHS = (4, 16)
+
+
+def _ip_address(ip: str):
+    """Parsed address without any zone id, IPv4-mapped IPv6 as IPv4; None if not an IP."""
+    try:
+        address = ipaddress.ip_address(ip.split("%", 1)[0])
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped is not None:
+        return address.ipv4_mapped
+    return address
+
+
+def normalize_ip(ip: str) -> str:
+    """
+    Canonical text form of an IP address ("::ffff:10.0.0.1" becomes
+    "10.0.0.1", IPv6 is compressed and lower-case); other strings are
+    returned unchanged.
+    """
+    address = _ip_address(ip)
+    return ip if address is None else str(address)
+
+
+def pack_ip(ip: str) -> bytes:
+    """
+    Packed bytes of an IP address: 4 for IPv4, 16 for IPv6. Hosts that
+    are not IP addresses (e.g. test clients) are stored as marked UTF-8,
+    padded so their length never collides with a packed address.
+    """
+    address = _ip_address(ip)
+    if address is not None:
+        return address.packed
+    data = _TEXT_MARKER + ip.encode()
+    return data + _TEXT_MARKER if len(data) in _PACKED_LENGTHS else data
+
+
+def unpack_ip(value) -> str:
+    if isinstance(value, str):
+        # a legacy text row not yet rewritten by pack_legacy_ips
+        return value
+    value = bytes(value)
+    if len(value) in _PACKED_LENGTHS:
+        return str(ipaddress.ip_address(value))
+    if value[:1] == _TEXT_MARKER:
+        return value.strip(_TEXT_MARKER).decode()
+    return value.decode()
+
+
+class PackedIP(TypeDecorator):
+    """
+    IP address column holding packed bytes (4 for IPv4, 16 for IPv6)
+    instead of text: rows and the primary key index are 2-3x smaller,
+    equal addresses always compare equal whatever their spelling, and
+    the addresses of a CIDR range are one contiguous key range (see
+    `ip_network_clause`). Values are bound and returned as normalized
+    strings, so callers never see the bytes.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else pack_ip(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else unpack_ip(value)
+
+
+def ip_network_bounds(network) -> Tuple[str, str]:
+    """First and last address of a CIDR network such as "10.0.0.0/24"."""
+    network = ipaddress.ip_network(network, strict=False)
+    return str(network.network_address), str(network.broadcast_address)
+
+
+def ip_prefix_network(ip: str, prefix_v4: int = 32, prefix_v6: int = 128) -> Optional[str]:
+    """
+    The network holding `ip` at the prefix length of its IP version
+    (e.g. "10.0.1.0/24"); None when that prefix is the whole address or
+    `ip` is not an IP address.
+    """
+    address = _ip_address(ip)
+    if address is None:
+        return None
+    prefix = prefix_v4 if address.version == 4 else prefix_v6
+    if prefix >= address.max_prefixlen:
+        return None
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+
+def ip_network_clause(column, network: str):
+    """
+    WHERE clause matching the `PackedIP` values of `column` in `network`.
+
+    Packed addresses of one family sort like the integers they encode, so
+    this is a BETWEEN over the network's first and last address, an index
+    range scan on any index of the column; the length check keeps IPv6
+    keys sharing the leading bytes of an IPv4 range out.
+    """
+    low, high = ip_network_bounds(network)
+    return and_(column.between(low, high), func.length(column) == len(pack_ip(low)))
+
+
+def pack_legacy_ips(engine) -> int:
+    """
+    Rewrites `successful_spell_ips` rows stored as text before the IP
+    column was packed; returns the number rewritten.
+
+    On SQLite text rows are told apart from packed ones with `typeof`.
+    On Postgres a VARCHAR column is first converted to BYTEA, after which
+    every row is legacy text. Spellings of one address (e.g. IPv4-mapped
+    IPv6) collapse to a single row.
+    """
+    table = SuccessfulSpellIP.__tablename__
+    dialect = engine.dialect.name
+    with engine.begin() as connection:
+        if dialect == "sqlite":
+            legacy = connection.execute(
+                text(f"SELECT ip FROM {table} WHERE typeof(ip) = 'text'")
+            ).scalars().all()
+        elif dialect == "postgresql":
+            column = next(c for c in inspect(connection).get_columns(table) if c["name"] == "ip")
+            if isinstance(column["type"], LargeBinary):
+                return 0
+            connection.execute(
+                text(f"ALTER TABLE {table} ALTER COLUMN ip TYPE bytea USING convert_to(ip, 'UTF8')")
+            )
+            legacy = connection.execute(text(f"SELECT ip FROM {table}")).scalars().all()
+        else:
+            return 0
+        if not legacy:
+            return 0
+        updates, duplicates, seen = [], [], set()
+        for old in legacy:
+            new = pack_ip(old if isinstance(old, str) else bytes(old).decode())
+            if new in seen:
+                duplicates.append({"old": old})
+            else:
+                seen.add(new)
+                updates.append({"old": old, "new": new})
+        if duplicates:
+            connection.execute(text(f"DELETE FROM {table} WHERE ip = :old"), duplicates)
+        # a packed row for the same address already holds the claim
+        connection.execute(
+            text(
+                f"DELETE FROM {table} WHERE ip = :old "
+                f"AND EXISTS (SELECT 1 FROM {table} WHERE ip = :new)"
+            ),
+            updates,
+        )
+        connection.execute(text(f"UPDATE {table} SET ip = :new WHERE ip = :old"), updates)
+    return len(legacy)
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
 
 
 class UserAccess(Base):
@@ -72,57 +416,411 @@ class UserAccess(Base):
 
     uuid = Column(String, primary_key=True)
     granted = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
 
 class SuccessfulSpellIP(Base):
     __tablename__ = "successful_spell_ips"
 
-    ip = Column(String, primary_key=True)
+    ip = Column(PackedIP, primary_key=True)
     user_uuid = Column(String)
-    cast_time = Column(DateTime, default=datetime.utcnow)
+    cast_time = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+_NOT_CACHED = object()
+
+UPSERT_DIALECTS = {
+    "postgresql": "sqlalchemy.dialects.postgresql",
+    "sqlite": "sqlalchemy.dialects.sqlite",
+}
+
+
+def _dialect_insert(session, model):
+    """Return the dialect's INSERT supporting ON CONFLICT, or None if unsupported."""
+    module = UPSERT_DIALECTS.get(session.get_bind().dialect.name)
+    return import_module(module).insert(model) if module is not None else None
+
+
+def _upsert(session, model, key_name: str, values: dict) -> bool:
+    """
+    Insert-or-update a row in one statement; False when the dialect lacks
+    ON CONFLICT and the caller must fall back to select-then-write.
+    """
+    stmt = _dialect_insert(session, model)
+    if stmt is None:
+        return False
+    stmt = stmt.values(**values).on_conflict_do_update(
+        index_elements=[key_name],
+        set_={name: value for name, value in values.items() if name != key_name},
+    )
+    session.execute(stmt)
+    return True
+
+
+def expiry_cutoff(ttl: float):
+    """Oldest timestamp still live for a TTL in seconds; None when `ttl` is 0."""
+    if not ttl:
+        return None
+    return datetime.utcnow() - timedelta(seconds=ttl)
+
+
+def remaining_ttl(ttl: float, created_at: Optional[datetime] = None) -> Optional[float]:
+    """
+    Seconds a row created at `created_at` (default: now) stays live under a
+    TTL in seconds; None when `ttl` is 0.
+    """
+    if not ttl:
+        return None
+    if created_at is None:
+        return ttl
+    return ttl - (datetime.utcnow() - created_at).total_seconds()
+
+
+def purge_expired(session, column, cutoff: datetime, batch_size: int = 1000) -> int:
+    """
+    Deletes up to `batch_size` rows whose `column` is older than `cutoff`,
+    oldest first, and commits; returns the number deleted.
+
+    The rows are picked with an indexed range scan on `column`, so each
+    call is a short transaction however large the backlog is.
+    """
+    table = column.table
+    key = table.primary_key.columns.values()[0]
+    expired = select(key).where(column < cutoff).order_by(column).limit(batch_size)
+    deleted = session.execute(delete(table).where(key.in_(expired))).rowcount
+    session.commit()
+    return deleted
 
 
 class AccessStore:
-    def __init__(self, session):
+    """
+    Dict-like view of `user_access`.
+
+    An optional read-through `cache` (see `cache.TTLCache`) is shared
+    between requests: lookups are served from it when possible, misses
+    are cached as positive or negative results, and writes update it
+    after commit. With a `write_behind` queue (see
+    `write_behind.SpellWriteBehind`) writes are queued for a batched
+    flush and queued values win over the database until then.
+
+    With `ttl` (seconds) grants older than that are treated as absent;
+    writing a grant again restarts its lifetime. Cached grants expire no
+    later than the grant itself.
+    """
+
+    def __init__(self, session, cache=None, write_behind=None, ttl: float = 0):
         self.session = session
+        self.cache = cache
+        self.write_behind = write_behind
+        self.ttl = ttl
 
+    def _lookup(self, key: str):
+        if self.write_behind is not None:
+            pending = self.write_behind.pending_access(key, _NOT_CACHED)
+            if pending is not _NOT_CACHED:
+                return pending
+        if self.cache is not None:
+            cached = self.cache.get(key, _NOT_CACHED)
+            if cached is not _NOT_CACHED:
+                return cached
+        query = self.session.query(UserAccess).filter_by(uuid=key)
+        cutoff = expiry_cutoff(self.ttl)
+        if cutoff is not None:
+            query = query.filter(UserAccess.created_at >= cutoff)
+        obj = query.first()
+        granted = obj.granted if obj else None
+        if self.cache is not None:
+            # a positive entry must not outlive the grant it caches
+            ttl = remaining_ttl(self.ttl, obj.created_at) if obj else None
+            self.cache.set(key, granted, ttl=ttl)
+        return granted
+
+    @_timed("contains")
     def __contains__(self, key: str) -> bool:
-        return self.session.query(UserAccess).filter_by(uuid=key).first() is not None
+        return self._lookup(key) is not None
 
+    @_timed("set")
     def __setitem__(self, key: str, value: bool) -> None:
-        obj = self.session.query(UserAccess).filter_by(uuid=key).first()
-        if obj is None:
-            obj = UserAccess(uuid=key, granted=value)
-            self.session.add(obj)
-        else:
-            obj.granted = value
+        if self.write_behind is not None and self.write_behind.enqueue_access(key, value):
+            if self.cache is not None:
+                self.cache.set(key, value, ttl=remaining_ttl(self.ttl))
+            return
+        row = {"uuid": key, "granted": value, "created_at": datetime.utcnow()}
+        if not _upsert(self.session, UserAccess, "uuid", row):
+            obj = self.session.query(UserAccess).filter_by(uuid=key).first()
+            if obj is None:
+                obj = UserAccess(**row)
+                self.session.add(obj)
+            else:
+                obj.granted = value
+                obj.created_at = row["created_at"]
         self.session.commit()
+        if self.cache is not None:
+            self.cache.set(key, value, ttl=remaining_ttl(self.ttl))
 
+    @_timed("get")
     def get(self, key: str, default=None):
-        obj = self.session.query(UserAccess).filter_by(uuid=key).first()
-        return obj.granted if obj else default
+        granted = self._lookup(key)
+        return default if granted is None else granted
 
 
 class SpellIPStore:
-    def __init__(self, session):
+    """
+    Dict-like view of `successful_spell_ips`.
+
+    An optional in-memory `ip_filter` (e.g. `bloom.BloomFilter`) holding
+    every recorded IP lets negative lookups skip the database; only
+    probable hits are confirmed with a query. The filter is per process,
+    so it must be loaded with `load_spell_ip_filter` before use and only
+    sees IPs written through this process. A `write_behind` queue works
+    as for `AccessStore`.
+
+    With `ttl` (seconds) claims cast longer ago than that are treated as
+    absent, and a new claim for the IP replaces the expired row.
+
+    Keys are normalized with `normalize_ip`. With `prefix_v4` / `prefix_v6`
+    below 32 / 128 the one-cast rule covers the whole network around an
+    IP (e.g. /24 or /64): `in` and `claim` also refuse an IP whose network
+    already holds a live claim. The network check is an indexed range
+    query, skipped when an `ip_filter` with `contains_network` (see
+    `ip_index.IPPrefixIndex`) knows the network is empty. Only the
+    per-IP claim is atomic; two first casts from one network at the same
+    instant can both win.
+    """
+
+    def __init__(
+        self,
+        session,
+        ip_filter=None,
+        write_behind=None,
+        ttl: float = 0,
+        prefix_v4: int = 32,
+        prefix_v6: int = 128,
+    ):
         self.session = session
+        self.ip_filter = ip_filter
+        self.write_behind = write_behind
+        self.ttl = ttl
+        self.prefix_v4 = prefix_v4
+        self.prefix_v6 = prefix_v6
+
+    def _live(self, query):
+        cutoff = expiry_cutoff(self.ttl)
+        if cutoff is not None:
+            query = query.filter(SuccessfulSpellIP.cast_time >= cutoff)
+        return query
+
+    def _query(self, key: str):
+        return self._live(self.session.query(SuccessfulSpellIP).filter_by(ip=key))
+
+    def _network_claimed(self, key: str) -> bool:
+        network = ip_prefix_network(key, self.prefix_v4, self.prefix_v6)
+        if network is None:
+            return False
+        contains_network = getattr(self.ip_filter, "contains_network", None)
+        if contains_network is not None and not contains_network(network):
+            return False
+        query = self.session.query(SuccessfulSpellIP.ip).filter(
+            ip_network_clause(SuccessfulSpellIP.ip, network)
+        )
+        return self._live(query).first() is not None
+
+    def _pending(self, key: str):
+        if self.write_behind is None:
+            return None
+        return self.write_behind.pending_spell_ip(key, None)
 
+    @_timed("contains")
     def __contains__(self, key: str) -> bool:
-        return self.session.query(SuccessfulSpellIP).filter_by(ip=key).first() is not None
+        key = normalize_ip(key)
+        if self._pending(key) is not None:
+            return True
+        if self._network_claimed(key):
+            return True
+        if self.ip_filter is not None and key not in self.ip_filter:
+            return False
+        return self._query(key).first() is not None
 
+    @_timed("set")
     def __setitem__(self, key: str, value: dict) -> None:
-        obj = self.session.query(SuccessfulSpellIP).filter_by(ip=key).first()
-        if obj is None:
-            obj = SuccessfulSpellIP(ip=key, user_uuid=value.get("user_uuid"), cast_time=value.get("cast_time"))
-            self.session.add(obj)
-        else:
-            obj.user_uuid = value.get("user_uuid")
-            obj.cast_time = value.get("cast_time")
+        key = normalize_ip(key)
+        if self.write_behind is not None and self.write_behind.enqueue_spell_ip(key, value):
+            if self.ip_filter is not None:
+                self.ip_filter.add(key)
+            return
+        row = {"ip": key, "user_uuid": value.get("user_uuid"), "cast_time": value.get("cast_time")}
+        if not _upsert(self.session, SuccessfulSpellIP, "ip", row):
+            obj = self.session.query(SuccessfulSpellIP).filter_by(ip=key).first()
+            if obj is None:
+                obj = SuccessfulSpellIP(**row)
+                self.session.add(obj)
+            else:
+                obj.user_uuid = row["user_uuid"]
+                obj.cast_time = row["cast_time"]
         self.session.commit()
+        if self.ip_filter is not None:
+            self.ip_filter.add(key)
 
+    @_timed("claim")
+    def claim(
+        self,
+        key: str,
+        value: dict,
+        access_cache=None,
+        access_ttl: float = 0,
+        queue: bool = True,
+    ) -> bool:
+        """
+        Atomically records `key` as having cast the spell and grants
+        `value["user_uuid"]` access, in one transaction. The grant is
+        cached in `access_cache` for no longer than `access_ttl`, the
+        `AccessStore` ttl.
+
+        Returns False when the IP already holds a live claim. The IP insert
+        uses `INSERT ... ON CONFLICT DO NOTHING RETURNING` on Postgres and
+        SQLite (`DO UPDATE ... WHERE` the existing claim has expired, with
+        a `ttl`), so concurrent casts from one IP produce exactly one
+        winner. Other dialects delete an expired row first and rely on the
+        primary key raising IntegrityError.
+        With a `write_behind` queue and `queue` set, the claim is decided
+        against the in-memory view and queued. That is only race-free when
+        the check and the enqueue run without yielding, i.e. for sync
+        sessions in a single process; `AsyncSpellIPStore` passes
+        `queue=False`. A full queue falls back to the direct transaction.
+        """
+        key = normalize_ip(key)
+        user_uuid = value.get("user_uuid")
+        cast_time = value.get("cast_time") or datetime.utcnow()
+        queued = False
+        if self.write_behind is not None and queue:
+            if key in self:
+                return False
+            queued = self.write_behind.enqueue_spell_ip(
+                key, {"user_uuid": user_uuid, "cast_time": cast_time}
+            )
+            if queued and not self.write_behind.enqueue_access(user_uuid, True):
+                self._grant(user_uuid, cast_time)
+                self.session.commit()
+        if not queued:
+            if self._pending(key) is not None or self._network_claimed(key):
+                return False
+            try:
+                won = self._claim_row(key, user_uuid, cast_time)
+                if won:
+                    self._grant(user_uuid, cast_time)
+                self.session.commit()
+            except IntegrityError:
+                self.session.rollback()
+                won = False
+            if not won:
+                return False
+        if self.ip_filter is not None:
+            self.ip_filter.add(key)
+        if access_cache is not None:
+            access_cache.set(user_uuid, True, ttl=remaining_ttl(access_ttl, cast_time))
+        return True
+
+    def _grant(self, user_uuid: str, cast_time) -> None:
+        grant = {"uuid": user_uuid, "granted": True, "created_at": cast_time}
+        if not _upsert(self.session, UserAccess, "uuid", grant):
+            self.session.merge(UserAccess(**grant))
+
+    def _claim_row(self, key: str, user_uuid: str, cast_time) -> bool:
+        row = {"ip": key, "user_uuid": user_uuid, "cast_time": cast_time}
+        cutoff = expiry_cutoff(self.ttl)
+        stmt = _dialect_insert(self.session, SuccessfulSpellIP)
+        if stmt is None:
+            if cutoff is not None:
+                self.session.execute(
+                    delete(SuccessfulSpellIP).where(
+                        SuccessfulSpellIP.ip == key, SuccessfulSpellIP.cast_time < cutoff
+                    )
+                )
+            self.session.add(SuccessfulSpellIP(**row))
+            self.session.flush()
+            return True
+        stmt = stmt.values(**row)
+        if cutoff is None:
+            stmt = stmt.on_conflict_do_nothing(index_elements=["ip"])
+        else:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["ip"],
+                set_={"user_uuid": stmt.excluded.user_uuid, "cast_time": stmt.excluded.cast_time},
+                where=SuccessfulSpellIP.cast_time < cutoff,
+            )
+        return self.session.execute(stmt.returning(SuccessfulSpellIP.ip)).first() is not None
+
+    @_timed("get")
     def get(self, key: str, default=None):
-        obj = self.session.query(SuccessfulSpellIP).filter_by(ip=key).first()
+        key = normalize_ip(key)
+        pending = self._pending(key)
+        if pending is not None:
+            return dict(pending)
+        if self.ip_filter is not None and key not in self.ip_filter:
+            return default
+        obj = self._query(key).first()
         if obj is None:
             return default
         return {"user_uuid": obj.user_uuid, "cast_time": obj.cast_time}
+
+
+def load_spell_ip_filter(session, ip_filter, batch_size: int = 10_000) -> int:
+    """Stream every recorded IP into `ip_filter`; returns the number loaded."""
+    loaded = 0
+    rows = session.execute(
+        select(SuccessfulSpellIP.ip).execution_options(yield_per=batch_size)
+    )
+    for ip in rows.scalars():
+        ip_filter.add(ip)
+        loaded += 1
+    return loaded
+
+
+class AsyncStore:
+    """
+    Awaitable counterpart of a sync store, bound to an `AsyncSession`.
+
+    Each call runs the sync store's logic through `AsyncSession.run_sync`,
+    so queries go through the asyncio driver (aiosqlite / asyncpg) without
+    blocking the event loop while sharing one implementation with the
+    sync stores.
+    """
+
+    sync_store_class = None
+
+    def __init__(self, session: "AsyncSession", **store_kwargs):
+        self.session = session
+        self.store_kwargs = store_kwargs
+
+    async def _run(self, method_name: str, *args, **kwargs):
+        def call(sync_session):
+            store = self.sync_store_class(sync_session, **self.store_kwargs)
+            return getattr(store, method_name)(*args, **kwargs)
+
+        return await self.session.run_sync(call)
+
+    async def contains(self, key: str) -> bool:
+        return await self._run("__contains__", key)
+
+    async def set(self, key: str, value) -> None:
+        await self._run("__setitem__", key, value)
+
+    async def get(self, key: str, default=None):
+        return await self._run("get", key, default)
+
+
+class AsyncAccessStore(AsyncStore):
+    sync_store_class = AccessStore
+
+
+class AsyncSpellIPStore(AsyncStore):
+    sync_store_class = SpellIPStore
+
+    async def claim(
+        self, key: str, value: dict, access_cache=None, access_ttl: float = 0
+    ) -> bool:
+        # the queued path's check would yield to the event loop between the
+        # lookup and the enqueue, so async claims always take the atomic one
+        return await self._run(
+            "claim", key, value, access_cache=access_cache, access_ttl=access_ttl, queue=False
+        )
@@ -1,47 +1,215 @@
 import argparse
+import csv
+import json
 import os
 import sys
-from sqlalchemy import text
+from datetime import datetime
+from sqlalchemy import delete, func, or_, select
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.database import get_session, SuccessfulSpellIP
+from app.database import get_session, ip_network_clause, SuccessfulSpellIP, UserAccess
+
+TABLES = {
+    SuccessfulSpellIP.__tablename__: SuccessfulSpellIP,
+    UserAccess.__tablename__: UserAccess,
+}
+# per table: primary key, UUID column, timestamp column, IP column
+TABLE_COLUMNS = {
+    SuccessfulSpellIP: ("ip", "user_uuid", "cast_time", "ip"),
+    UserAccess: ("uuid", "uuid", "created_at", None),
+}
+EXPORT_FORMATS = ("csv", "jsonl")
+BATCH_SIZE = 10_000
+# bound parameters per IN list, below SQLite's limit
+IN_LIST_CHUNK = 10_000
+
+
+def build_filters(model, ips=(), cidrs=(), uuids=(), since=None, until=None) -> list:
+    """
+    WHERE clauses for `model`; IP and CIDR filters only apply to
+    successful_spell_ips. Values within one filter are OR-ed, filters are
+    AND-ed.
+    """
+    _, uuid_name, time_name, ip_name = TABLE_COLUMNS[model]
+    clauses = []
+    if ips or cidrs:
+        if ip_name is None:
+            raise ValueError(f"{model.__tablename__} has no IP column")
+        column = getattr(model, ip_name)
+        matches = [column.in_(list(ips))] if ips else []
+        matches += [ip_network_clause(column, network) for network in cidrs]
+        clauses.append(or_(*matches))
+    if uuids:
+        clauses.append(getattr(model, uuid_name).in_(list(uuids)))
+    if since is not None:
+        clauses.append(getattr(model, time_name) >= since)
+    if until is not None:
+        clauses.append(getattr(model, time_name) < until)
+    return clauses
+
+
+def iter_rows(session, model, clauses=(), batch_size: int = BATCH_SIZE):
+    """
+    Yields rows ordered by primary key, one keyset page at a time
+    (`WHERE pk > last LIMIT batch_size`), so memory stays flat and each
+    page is an index range scan however deep the export has got.
+    """
+    key = getattr(model, TABLE_COLUMNS[model][0])
+    columns = [getattr(model, column.name) for column in model.__table__.columns]
+    last = None
+    while True:
+        query = select(*columns).where(*clauses).order_by(key).limit(batch_size)
+        if last is not None:
+            query = query.where(key > last)
+        rows = session.execute(query).all()
+        if not rows:
+            return
+        yield from rows
+        last = getattr(rows[-1], key.key)
+        if len(rows) < batch_size:
+            return
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def export_rows(model, out, fmt: str = "csv", batch_size: int = BATCH_SIZE, **filters) -> int:
+    """
+    Streams `model`'s rows matching `filters` to `out` as CSV (with a
+    header) or JSON lines; returns the number of rows written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'; expected one of {EXPORT_FORMATS}")
+    names = [column.name for column in model.__table__.columns]
+    session = get_session()
+    try:
+        clauses = build_filters(model, **filters)
+        if fmt == "csv":
+            writer = csv.writer(out)
+            writer.writerow(names)
+        count = 0
+        for row in iter_rows(session, model, clauses, batch_size):
+            if fmt == "csv":
+                writer.writerow(row)
+            else:
+                out.write(json.dumps({name: _json_value(value) for name, value in zip(names, row)}))
+                out.write("\n")
+            count += 1
+        return count
+    finally:
+        session.close()
+
+
+def _chunked_filters(filters: dict):
+    """
+    Splits long IP or UUID lists so each statement stays under the bound
+    parameter limit; short lists give a single statement.
+    """
+    for name in ("ips", "uuids"):
+        values = list(filters.get(name) or ())
+        if len(values) > IN_LIST_CHUNK:
+            for start in range(0, len(values), IN_LIST_CHUNK):
+                yield {**filters, name: values[start : start + IN_LIST_CHUNK]}
+            return
+    yield filters
+
+
+def erase_rows(model, dry_run: bool = False, **filters) -> int:
+    """
+    Deletes `model`'s rows matching `filters` with a set-based DELETE in
+    one transaction and returns how many rows matched. At least one filter
+    is required.
+    """
+    if not any(filters.values()):
+        raise ValueError("Refusing to erase without a filter")
+    session = get_session()
+    try:
+        total = 0
+        for chunk in _chunked_filters(filters):
+            clauses = build_filters(model, **chunk)
+            if dry_run:
+                total += session.execute(
+                    select(func.count()).select_from(model).where(*clauses)
+                ).scalar_one()
+            else:
+                total += session.execute(
+                    delete(model).where(*clauses), execution_options={"synchronize_session": False}
+                ).rowcount
+        if dry_run:
+            session.rollback()
+        else:
+            session.commit()
+        return total
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
 def list_ips():
     """Lists all IPs in the successful_spell_ips table."""
     session = get_session()
     try:
-        ips = session.query(SuccessfulSpellIP).all()
-        if not ips:
+        printed = False
+        for ip in iter_rows(session, SuccessfulSpellIP):
+            if not printed:
+                print(f"{'IP Address':<20} {'User UUID':<40} {'Cast Time':<30}")
+                print("-" * 90)
+                printed = True
+            print(f"{ip.ip:<20} {ip.user_uuid or '':<40} {str(ip.cast_time):<30}")
+        if not printed:
             print("No IPs found in the successful_spell_ips table.")
-            return
-
-        print(f"{'IP Address':<20} {'User UUID':<40} {'Cast Time':<30}")
-        print("-" * 90)
-        for ip in ips:
-            print(f"{ip.ip:<20} {ip.user_uuid:<40} {str(ip.cast_time):<30}")
     finally:
         session.close()
 
 def erase_ip(ip_address):
     """Erases an IP from the successful_spell_ips table."""
-    session = get_session()
     try:
-        record = session.query(SuccessfulSpellIP).filter_by(ip=ip_address).first()
-        if record:
-            session.delete(record)
-            session.commit()
-            print(f"Successfully erased IP address: {ip_address}")
-        else:
-            print(f"IP address not found: {ip_address}")
+        erased = erase_rows(SuccessfulSpellIP, ips=[ip_address])
     except Exception as e:
-        session.rollback()
         print(f"An error occurred: {e}")
-    finally:
-        session.close()
+        return
+    if erased:
+        print(f"Successfully erased IP address: {ip_address}")
+    else:
+        print(f"IP address not found: {ip_address}")
 
-if __name__ == "__main__":
+
+def _read_list(values, path):
+    items = []
+    for value in values or ():
+        items.extend(item.strip() for item in value.split(",") if item.strip())
+    if path:
+        with open(path) as f:
+            items.extend(line.strip() for line in f if line.strip())
+    return items
+
+
+def _filters_from_args(args) -> dict:
+    return {
+        "ips": _read_list(args.ip, args.ip_file),
+        "cidrs": _read_list(args.cidr, None),
+        "uuids": _read_list(args.uuid, args.uuid_file),
+        "since": args.since,
+        "until": args.until,
+    }
+
+
+def _add_filter_arguments(parser):
+    parser.add_argument("--table", choices=sorted(TABLES), default=SuccessfulSpellIP.__tablename__)
+    parser.add_argument("--ip", action="append", help="IP address(es), comma-separated or repeated.")
+    parser.add_argument("--ip-file", help="File with one IP address per line.")
+    parser.add_argument("--cidr", action="append", help="Network(s) such as 10.0.0.0/8.")
+    parser.add_argument("--uuid", action="append", help="User UUID(s), comma-separated or repeated.")
+    parser.add_argument("--uuid-file", help="File with one user UUID per line.")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Rows at or after this UTC time.")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Rows before this UTC time.")
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Devscripts DB Utils")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
@@ -52,9 +220,40 @@ if __name__ == "__main__":
     parser_erase = subparsers.add_parser("erase_ip", help="Erase an IP from the successful_spell_ips table.")
     parser_erase.add_argument("ip_address", type=str, help="The IP address to erase.")
 
-    args = parser.parse_args()
+    # Sub-parser for the export command
+    parser_export = subparsers.add_parser("export", help="Stream rows to CSV or JSON lines.")
+    _add_filter_arguments(parser_export)
+    parser_export.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser_export.add_argument("--output", "-o", help="Output file (default: stdout).")
+    parser_export.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    # Sub-parser for the erase command
+    parser_bulk_erase = subparsers.add_parser("erase", help="Erase all rows matching the filters.")
+    _add_filter_arguments(parser_bulk_erase)
+    parser_bulk_erase.add_argument("--dry-run", action="store_true", help="Only count matching rows.")
+
+    args = parser.parse_args(argv)
 
     if args.command == "list_ips":
         list_ips()
     elif args.command == "erase_ip":
         erase_ip(args.ip_address)
+    elif args.command == "export":
+        model = TABLES[args.table]
+        if args.output:
+            with open(args.output, "w", newline="") as out:
+                count = export_rows(model, out, args.format, args.batch_size, **_filters_from_args(args))
+        else:
+            count = export_rows(model, sys.stdout, args.format, args.batch_size, **_filters_from_args(args))
+        print(f"Exported {count} rows from {args.table}", file=sys.stderr)
+    elif args.command == "erase":
+        try:
+            count = erase_rows(TABLES[args.table], dry_run=args.dry_run, **_filters_from_args(args))
+        except ValueError as e:
+            parser.error(str(e))
+        verb = "Would erase" if args.dry_run else "Erased"
+        print(f"{verb} {count} rows from {args.table}")
+
+
+if __name__ == "__main__":
+    main()
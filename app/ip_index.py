@@ -0,0 +1,110 @@
+import ipaddress
+from typing import Dict, Optional, Tuple
+
+ADDRESS_BITS = {4: 32, 6: 128}
+
+
+def _parse(ip: str) -> Optional[Tuple[int, int]]:
+    try:
+        address = ipaddress.ip_address(ip.split("%", 1)[0])
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.version, int(address)
+
+
+class _Node:
+    __slots__ = ("prefix", "length", "children")
+
+    def __init__(self, prefix: int, length: int, children=None):
+        self.prefix = prefix
+        self.length = length
+        self.children = children
+
+
+class IPPrefixIndex:
+    """
+    In-memory radix (Patricia) tree of IP addresses, one per IP version.
+
+    Each node stores the bits shared by every address below it, so a
+    lookup walks at most one node per differing bit and costs
+    O(prefix length) regardless of how many addresses are stored.
+    `ip in index` tests an exact address; `contains_network` tests
+    whether any stored address lies in a CIDR range. Like
+    `bloom.BloomFilter` it only grows, so a hit for an address whose row
+    has since expired must still be confirmed by the database. Strings
+    that are not IP addresses are ignored by `add` and never found.
+    """
+
+    def __init__(self):
+        self._roots: Dict[int, Optional[_Node]] = {4: None, 6: None}
+        self.items_added = 0
+
+    def add(self, ip: str) -> None:
+        parsed = _parse(ip)
+        if parsed is None:
+            return
+        version, value = parsed
+        bits = ADDRESS_BITS[version]
+        node = self._roots[version]
+        if node is None:
+            self._roots[version] = _Node(value, bits)
+            self.items_added += 1
+            return
+
+        parent, side = None, 0
+        while True:
+            shift = bits - node.length
+            common = _common_length(value >> shift, node.prefix, node.length)
+            if common < node.length:
+                # split: a new branch node holds the shared bits
+                branch_shift = bits - common
+                branch = _Node(value >> branch_shift, common, [None, None])
+                new_bit = (value >> (branch_shift - 1)) & 1
+                branch.children[new_bit] = _Node(value, bits)
+                branch.children[1 - new_bit] = node
+                if parent is None:
+                    self._roots[version] = branch
+                else:
+                    parent.children[side] = branch
+                self.items_added += 1
+                return
+            if node.length == bits:
+                return
+            side = (value >> (shift - 1)) & 1
+            parent, node = node, node.children[side]
+
+    def contains_network(self, network: str) -> bool:
+        """
+        Whether any stored address lies in `network` (e.g. "10.0.0.0/24").
+        """
+        network = ipaddress.ip_network(network, strict=False)
+        return self._contains(network.version, int(network.network_address), network.prefixlen)
+
+    def _contains(self, version: int, value: int, prefix_length: int) -> bool:
+        bits = ADDRESS_BITS[version]
+        node = self._roots[version]
+        while node is not None:
+            checked = min(node.length, prefix_length)
+            if (value >> (bits - checked)) != (node.prefix >> (node.length - checked)):
+                return False
+            if node.length >= prefix_length:
+                return True
+            node = node.children[(value >> (bits - node.length - 1)) & 1]
+        return False
+
+    def __contains__(self, ip: str) -> bool:
+        parsed = _parse(ip)
+        if parsed is None:
+            return False
+        version, value = parsed
+        return self._contains(version, value, ADDRESS_BITS[version])
+
+    def stats(self) -> Dict[str, int]:
+        return {"items_added": self.items_added}
+
+
+def _common_length(a: int, b: int, length: int) -> int:
+    """Number of leading bits two `length`-bit values share."""
+    return length - (a ^ b).bit_length()
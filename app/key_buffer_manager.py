@@ -1,23 +1,515 @@
+import hashlib
+import json
 import logging
-from typing import Dict, List
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import accumulate, chain
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 
+MATCHER_BUFFER = "buffer"
+MATCHER_AUTOMATON = "automaton"
+MATCHERS = (MATCHER_BUFFER, MATCHER_AUTOMATON)
+
+_MISSING = object()
+
+SNAPSHOT_MAGIC = b"KBSN"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SEPARATOR = "\x00"
+
+# magic, version, matcher index, spell digest, written at (unix time),
+# session count, then the typecodes of the arrays that follow
+_SNAPSHOT_HEADER = struct.Struct("<4sHB8sdI2s")
+_SNAPSHOT_SECTION_LENGTH = struct.Struct("<Q")
+
+
+def build_spell_transitions(normalized_spell: List[str]) -> List[Dict[str, int]]:
+    """
+    Builds the KMP automaton for a normalized spell.
+
+    Row `i` maps a normalized key to the next match state when `i` keys of
+    the spell are currently matched; keys missing from a row go to state 0.
+    State `len(normalized_spell)` means the spell was just completed, and
+    its row continues matching so overlapping casts behave like a sliding
+    buffer.
+    """
+    spell_key_count = len(normalized_spell)
+    transitions: List[Dict[str, int]] = [{} for _ in range(spell_key_count + 1)]
+    restart = 0
+    for state in range(spell_key_count + 1):
+        if state > 0:
+            transitions[state] = dict(transitions[restart])
+        if state < spell_key_count:
+            key = normalized_spell[state]
+            transitions[state][key] = state + 1
+            if state > 0:
+                restart = transitions[restart].get(key, 0)
+    return transitions
+
+
+class KeyBufferStore(MutableMapping):
+    """
+    Interface for per-session matcher state, keyed by user UUID.
+
+    Values are the buffer (a list of keys) or the automaton state (an int).
+    Implementations are dict-like and additionally report eviction counters
+    and support an explicit idle sweep.
+    """
+
+    def sweep(self) -> None:
+        """
+        Evicts idle sessions without requiring a write.
+        """
+
+    def eviction_stats(self) -> Dict[str, int]:
+        """
+        Returns the session count and eviction counters; stores that never
+        evict report zero evictions.
+        """
+        return {"entries": len(self), "lru_evictions": 0, "idle_evictions": 0}
+
+    def modify(self, key: str, function: Callable[[Any], Any], default: Any = None) -> Any:
+        """
+        Stores `function(current value or default)` for `key` and returns it.
+        Stores shared between processes do this atomically.
+        """
+        value = function(self.get(key, default))
+        self[key] = value
+        return value
+
+    def bind_spell(self, fingerprint: str) -> None:
+        """
+        Called with the manager's matcher and spell fingerprint; stores
+        that outlive the process drop sessions saved under another one.
+        """
+
+    def dump(self) -> Tuple[List[str], List[Any]]:
+        """
+        Returns all sessions as parallel key and value lists.
+        """
+        items = list(self.items())
+        return [key for key, _ in items], [value for _, value in items]
+
+    def restore(self, sessions: "RestoredSessions") -> None:
+        """
+        Adds sessions loaded from a snapshot; sessions already present win.
+        """
+        for key, value in zip(*sessions.remaining()):
+            if key not in self:
+                self[key] = value
+
+    @property
+    def restored(self) -> Optional["RestoredSessions"]:
+        """
+        Snapshot sessions not yet moved into the store, if any.
+        """
+        return None
+
+
+class RestoredSessions:
+    """
+    Read-only sessions from a snapshot, sorted by UUID.
+
+    Building millions of dict entries at startup takes seconds, so the
+    snapshot is kept as written: a sorted list of UUIDs and a `decode`
+    callback that builds the value at a given index. A store looks a UUID
+    up by bisection the first time it misses and moves the session in;
+    each session can be taken once.
+    """
+
+    def __init__(self, uuids: List[str], decode: Callable[[int], Any]):
+        self.uuids = uuids
+        self.decode = decode
+        self.expires_at = float("inf")
+        self._taken = bytearray(len(uuids))
+        self._remaining = len(uuids)
+
+    def take(self, key: str) -> Any:
+        """
+        Returns and claims the value for `key`, or `_MISSING`.
+        """
+        uuids = self.uuids
+        index = bisect_left(uuids, key)
+        if index == len(uuids) or uuids[index] != key or self._taken[index]:
+            return _MISSING
+        self._taken[index] = 1
+        self._remaining -= 1
+        return self.decode(index)
+
+    def remaining(self) -> Tuple[List[str], List[Any]]:
+        """
+        Returns the sessions not taken yet as parallel UUID and value lists.
+        """
+        indices = [index for index, taken in enumerate(self._taken) if not taken]
+        return [self.uuids[index] for index in indices], [self.decode(index) for index in indices]
+
+    def active(self) -> bool:
+        """
+        Whether sessions are left and the snapshot has not expired.
+        """
+        return self._remaining > 0 and time.monotonic() <= self.expires_at
+
+    def __len__(self) -> int:
+        return self._remaining
+
+
+class InMemoryKeyBufferStore(KeyBufferStore):
+    """
+    Dict-like per-session state with LRU and idle-time eviction.
+
+    Writes move a session to the most-recently-used end and then evict from
+    the least-recently-used end while the store is over `max_entries` or
+    the oldest session has been idle longer than `idle_ttl` seconds. Both
+    checks only look at the front of the order, so eviction is amortized
+    O(1) per write. A limit of 0 disables that kind of eviction.
+    """
+
+    def __init__(self, max_entries: int = 0, idle_ttl: float = 0):
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._last_seen: Dict[str, float] = {}
+        self._restored: Optional[RestoredSessions] = None
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.lru_evictions = 0
+        self.idle_evictions = 0
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._entries.get(key, _MISSING)
+        if value is _MISSING and self._restored is not None:
+            value = self._take_restored(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default=None):
+        value = self._entries.get(key, _MISSING)
+        if value is _MISSING:
+            if self._restored is None:
+                return default
+            value = self._take_restored(key)
+            if value is _MISSING:
+                return default
+        return value
+
+    def _take_restored(self, key: str) -> Any:
+        restored = self._restored
+        if not restored.active():
+            self._restored = None
+            return _MISSING
+        value = restored.take(key)
+        if value is not _MISSING:
+            self[key] = value
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        entries = self._entries
+        entries[key] = value
+        entries.move_to_end(key)
+        now = time.monotonic()
+        self._last_seen[key] = now
+        self._evict(now)
+
+    def __delitem__(self, key: str) -> None:
+        del self._entries[key]
+        del self._last_seen[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: float) -> None:
+        entries = self._entries
+        if self.max_entries > 0:
+            while len(entries) > self.max_entries:
+                oldest, _ = entries.popitem(last=False)
+                del self._last_seen[oldest]
+                self.lru_evictions += 1
+        if self.idle_ttl > 0:
+            cutoff = now - self.idle_ttl
+            while entries:
+                oldest = next(iter(entries))
+                if self._last_seen[oldest] > cutoff:
+                    break
+                del entries[oldest]
+                del self._last_seen[oldest]
+                self.idle_evictions += 1
+
+    def sweep(self) -> None:
+        """
+        Evicts idle sessions without requiring a write.
+        """
+        self._evict(time.monotonic())
+
+    def eviction_stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "lru_evictions": self.lru_evictions,
+            "idle_evictions": self.idle_evictions,
+        }
+
+    def dump(self) -> Tuple[List[str], List[Any]]:
+        """
+        Returns the live sessions as parallel key and value lists, least
+        recently used first; see `restored` for the rest.
+        """
+        return list(self._entries), list(self._entries.values())
+
+    def restore(self, sessions: RestoredSessions) -> None:
+        """
+        Serves `sessions` from the snapshot until they are touched or
+        `idle_ttl` has passed; live sessions win.
+        """
+        if self.idle_ttl > 0:
+            sessions.expires_at = min(sessions.expires_at, time.monotonic() + self.idle_ttl)
+        self._restored = sessions
+
+    @property
+    def restored(self) -> Optional[RestoredSessions]:
+        restored = self._restored
+        return restored if restored is not None and restored.active() else None
+
+
+class SQLiteKeyBufferStore(KeyBufferStore):
+    """
+    Per-session state shared between processes through a local SQLite file.
+
+    Every uvicorn worker on a host opens the same file, so consecutive keys
+    for a session can land on any worker. WAL journaling with
+    `synchronous=NORMAL` keeps a read or write to tens of microseconds on
+    local disk. Eviction runs every `sweep_interval` writes as a single
+    set-based `DELETE` against the `last_seen` index.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        table: str = "key_buffers",
+        max_entries: int = 0,
+        idle_ttl: float = 0,
+        sweep_interval: int = 1024,
+    ):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.lru_evictions = 0
+        self.idle_evictions = 0
+        self._writes_since_sweep = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(uuid TEXT PRIMARY KEY, value TEXT NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_last_seen ON {table} (last_seen)"
+        )
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_meta "
+            "(name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._select_sql = f"SELECT value FROM {table} WHERE uuid = ?"
+        self._upsert_sql = (
+            f"INSERT INTO {table} (uuid, value, last_seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(uuid) DO UPDATE SET "
+            "value = excluded.value, last_seen = excluded.last_seen"
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            row = self._conn.execute(self._select_sql, (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute(self._select_sql, (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        encoded = json.dumps(value)
+        with self._lock:
+            self._conn.execute(self._upsert_sql, (key, encoded, time.time()))
+            self._count_write()
+
+    def _count_write(self) -> None:
+        self._writes_since_sweep += 1
+        if self._writes_since_sweep >= self.sweep_interval:
+            self._evict()
+
+    @contextmanager
+    def _immediate(self):
+        """
+        Write transaction taking SQLite's write lock up front, so a
+        read-modify-write never interleaves with another process's.
+        Callers hold `_lock`.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def modify(self, key: str, function: Callable[[Any], Any], default: Any = None) -> Any:
+        with self._lock:
+            with self._immediate():
+                row = self._conn.execute(self._select_sql, (key,)).fetchone()
+                value = function(default if row is None else json.loads(row[0]))
+                self._conn.execute(self._upsert_sql, (key, json.dumps(value), time.time()))
+            self._count_write()
+        return value
+
+    def bind_spell(self, fingerprint: str) -> None:
+        """
+        Deletes every session when the file was last used with another
+        matcher or spell: automaton states index that spell's table and
+        buffers hold its keys.
+        """
+        with self._lock:
+            with self._immediate():
+                row = self._conn.execute(
+                    f"SELECT value FROM {self.table}_meta WHERE name = 'spell'"
+                ).fetchone()
+                if row is not None and row[0] == fingerprint:
+                    return
+                cursor = self._conn.execute(f"DELETE FROM {self.table}")
+                self._conn.execute(
+                    f"INSERT INTO {self.table}_meta (name, value) VALUES ('spell', ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+                    (fingerprint,),
+                )
+        if cursor.rowcount > 0:
+            logger.info(
+                f"Discarded {cursor.rowcount} key buffer sessions saved for another spell"
+            )
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE uuid = ?", (key,)
+            )
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT uuid FROM {self.table}").fetchall()
+        return (row[0] for row in rows)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _evict(self) -> None:
+        self._writes_since_sweep = 0
+        if self.idle_ttl > 0:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE last_seen < ?",
+                (time.time() - self.idle_ttl,),
+            )
+            self.idle_evictions += max(cursor.rowcount, 0)
+        if self.max_entries > 0:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE uuid IN ("
+                f"SELECT uuid FROM {self.table} ORDER BY last_seen DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.lru_evictions += max(cursor.rowcount, 0)
+
+    def sweep(self) -> None:
+        with self._lock:
+            self._evict()
+
+    def eviction_stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self),
+            "lru_evictions": self.lru_evictions,
+            "idle_evictions": self.idle_evictions,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
 class KeyBufferManager:
     """
     Manages user-specific keypress buffers and checks for a secret spell sequence.
+
+    Two matchers are available:
+
+    - ``"buffer"`` keeps the last N keys per user and compares them with
+      the spell on every check.
+    - ``"automaton"`` keeps a single integer per user: the state of a KMP
+      automaton built once from the normalized spell. Each key costs one
+      dict lookup regardless of the spell length.
     """
 
-    def __init__(self, parsed_secret_spell: List[str]):
+    def __init__(
+        self,
+        parsed_secret_spell: List[str],
+        matcher: str = MATCHER_BUFFER,
+        max_entries: int = 0,
+        idle_ttl: float = 0,
+        store: Optional[KeyBufferStore] = None,
+    ):
         """
         Initializes the KeyBufferManager with the secret spell.
+
+        `max_entries` and `idle_ttl` (seconds) bound the default in-process
+        state; 0 leaves that limit off. Pass `store` to keep the active
+        matcher's state elsewhere, e.g. a `SQLiteKeyBufferStore` shared by
+        several worker processes.
         """
-        self._user_key_buffers: Dict[str, List[str]] = {}
+        if matcher not in MATCHERS:
+            raise ValueError(
+                f"Unknown spell matcher '{matcher}'; expected one of {MATCHERS}"
+            )
+        if store is None:
+            store = InMemoryKeyBufferStore(max_entries, idle_ttl)
+        if matcher == MATCHER_AUTOMATON:
+            self._user_key_buffers: KeyBufferStore = InMemoryKeyBufferStore()
+            self._user_match_states: KeyBufferStore = store
+        else:
+            self._user_key_buffers = store
+            self._user_match_states = InMemoryKeyBufferStore()
         self._parsed_secret_spell: List[str] = parsed_secret_spell
         self._spell_key_count: int = len(parsed_secret_spell)
+        self._normalized_spell: List[str] = [key.lower() for key in parsed_secret_spell]
+        self._matcher: str = matcher
+        self._transitions: List[Dict[str, int]] = []
+        self._spell_prefixes: List[List[str]] = []
+        if matcher == MATCHER_AUTOMATON:
+            self._transitions = build_spell_transitions(self._normalized_spell)
+            self._spell_prefixes = [
+                parsed_secret_spell[:state] for state in range(self._spell_key_count + 1)
+            ]
+        store.bind_spell(f"{matcher}:{spell_digest(parsed_secret_spell).hex()}")
         logger.info(
             f"KeyBufferManager initialized with spell: {self._parsed_secret_spell} "
+            f"(matcher: {self._matcher})"
         )
 
     def add_key(self, user_uuid: str, key: str) -> List[str]:
@@ -26,27 +518,122 @@ class KeyBufferManager:
 
         The buffer is trimmed to the length of the secret spell. If the spell
         length is zero, the buffer will be emptied.
+
+        With the automaton matcher the returned list is the matched prefix of
+        the spell; it is shared between users and must not be mutated.
         """
-        current_buffer = self._user_key_buffers.get(user_uuid, [])
-        current_buffer.append(key)
+        if self._matcher == MATCHER_AUTOMATON:
+            return self._advance_state(user_uuid, key)
 
-        if self._spell_key_count > 0:
-            current_buffer = current_buffer[-self._spell_key_count :]
-        elif self._spell_key_count == 0:
-            current_buffer = []
+        def append(current_buffer):
+            if not isinstance(current_buffer, list):
+                current_buffer = []
+            current_buffer.append(key)
+            if self._spell_key_count > 0:
+                return current_buffer[-self._spell_key_count :]
+            return []
 
-        self._user_key_buffers[user_uuid] = current_buffer
+        current_buffer = self._user_key_buffers.modify(user_uuid, append, [])
         logger.debug(
-            f"Buffer for UUID {user_uuid} updated. Key '{key}' added. New buffer: {current_buffer}"
+            "Buffer for UUID %s updated. Key '%s' added. New buffer: %s",
+            user_uuid,
+            key,
+            current_buffer,
         )
         return current_buffer
 
+    def _advance_state(self, user_uuid: str, key: str) -> List[str]:
+        """
+        Moves a user's automaton state forward by one key.
+        """
+        if self._spell_key_count == 0:
+            return self._spell_prefixes[0]
+
+        def advance(state):
+            row = self._transitions[self._valid_state(state)]
+            next_state = row.get(key)
+            if next_state is None:
+                next_state = row.get(key.lower(), 0)
+            return next_state
+
+        return self._spell_prefixes[self._user_match_states.modify(user_uuid, advance, 0)]
+
+    def _valid_state(self, state) -> int:
+        """
+        `state` when it is a state of this spell's automaton, else 0.
+        """
+        if type(state) is int and 0 <= state <= self._spell_key_count:
+            return state
+        return 0
+
     def get_buffer(self, user_uuid: str) -> List[str]:
         """
         Retrieves the current key buffer for a specific user.
+
+        With the automaton matcher this is the matched prefix of the spell.
         """
+        if self._matcher == MATCHER_AUTOMATON:
+            state = self._user_match_states.get(user_uuid, 0)
+            return self._spell_prefixes[self._valid_state(state)]
         return self._user_key_buffers.get(user_uuid, [])
 
+    def add_key_and_check(self, user_uuid: str, key: str) -> bool:
+        """
+        Adds a key for a user and returns whether the spell is now complete.
+        """
+        self.add_key(user_uuid, key)
+        return self.check_spell(user_uuid)
+
+    @property
+    def matcher(self) -> str:
+        return self._matcher
+
+    @property
+    def spell(self) -> List[str]:
+        return self._parsed_secret_spell
+
+    @property
+    def _state_store(self) -> KeyBufferStore:
+        if self._matcher == MATCHER_AUTOMATON:
+            return self._user_match_states
+        return self._user_key_buffers
+
+    def export_state(self, include_restored: bool = True) -> Tuple[List[str], List[Any]]:
+        """
+        Returns the active matcher's sessions as parallel UUID and value
+        lists: buffers (lists of keys) or automaton states (ints).
+
+        Restored snapshot sessions nobody has touched yet come first.
+        """
+        store = self._state_store
+        uuids, values = store.dump()
+        restored = store.restored if include_restored else None
+        if restored is not None:
+            restored_uuids, restored_values = restored.remaining()
+            uuids = restored_uuids + uuids
+            values = restored_values + values
+        return uuids, values
+
+    def restore_state(self, sessions: RestoredSessions) -> None:
+        """
+        Serves `sessions` loaded from a snapshot; live sessions win.
+        """
+        self._state_store.restore(sessions)
+
+    def sweep(self) -> None:
+        """
+        Evicts idle sessions of the active matcher without requiring a write.
+        """
+        self._state_store.sweep()
+
+    def eviction_stats(self) -> Dict[str, int]:
+        """
+        Returns the session count and eviction counters for the active matcher.
+        """
+        if self._matcher == MATCHER_AUTOMATON:
+            return self._user_match_states.eviction_stats()
+        return self._user_key_buffers.eviction_stats()
+
     def check_spell(self, user_uuid: str) -> bool:
         """
         Checks if the buffer for a user [case-insenstive] matches the secret spell.
@@ -54,11 +641,313 @@ class KeyBufferManager:
         if not self._parsed_secret_spell:
             return False
 
+        if self._matcher == MATCHER_AUTOMATON:
+            state = self._user_match_states.get(user_uuid, 0)
+            return self._valid_state(state) == self._spell_key_count
+
         current_buffer = self.get_buffer(user_uuid)
         logger.debug(
-            f"Checking spell for UUID {user_uuid}. Original Buffer: {current_buffer}, Original Spell: {self._parsed_secret_spell}"
+            "Checking spell for UUID %s. Original Buffer: %s, Original Spell: %s",
+            user_uuid,
+            current_buffer,
+            self._parsed_secret_spell,
         )
 
         buffer_lower = [key.lower() for key in current_buffer]
-        spell_lower = [key.lower() for key in self._parsed_secret_spell]
-        return buffer_lower == spell_lower
+        return buffer_lower == self._normalized_spell
+
+
+class ShardedKeyBufferManager:
+    """
+    Thread-safe `KeyBufferManager` with lock striping by UUID.
+
+    Sessions are spread over `shards` independent managers, each guarded
+    by its own lock and picked by the UUID's hash, so threads working on
+    different sessions rarely contend. This lets one manager be driven
+    from a thread pool, or across cores under free-threaded CPython.
+    `max_entries` is split evenly between the shards. Buffers are
+    returned as copies, since the shard may update them after the lock is
+    released.
+    """
+
+    def __init__(
+        self,
+        parsed_secret_spell: List[str],
+        shards: int = 16,
+        matcher: str = MATCHER_BUFFER,
+        max_entries: int = 0,
+        idle_ttl: float = 0,
+    ):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        shard_max_entries = -(-max_entries // shards) if max_entries > 0 else 0
+        self._shards: List[KeyBufferManager] = [
+            KeyBufferManager(
+                parsed_secret_spell,
+                matcher=matcher,
+                max_entries=shard_max_entries,
+                idle_ttl=idle_ttl,
+            )
+            for _ in range(shards)
+        ]
+        self._locks: List[threading.Lock] = [threading.Lock() for _ in range(shards)]
+        self._copy_buffers: bool = matcher == MATCHER_BUFFER
+        self.matcher: str = matcher
+        self.spell: List[str] = parsed_secret_spell
+        self._restored: Optional[RestoredSessions] = None
+
+    def _index(self, user_uuid: str) -> int:
+        return hash(user_uuid) % len(self._shards)
+
+    def add_key(self, user_uuid: str, key: str) -> List[str]:
+        index = self._index(user_uuid)
+        with self._locks[index]:
+            buffer = self._shards[index].add_key(user_uuid, key)
+            return list(buffer) if self._copy_buffers else buffer
+
+    def get_buffer(self, user_uuid: str) -> List[str]:
+        index = self._index(user_uuid)
+        with self._locks[index]:
+            buffer = self._shards[index].get_buffer(user_uuid)
+            return list(buffer) if self._copy_buffers else buffer
+
+    def check_spell(self, user_uuid: str) -> bool:
+        index = self._index(user_uuid)
+        with self._locks[index]:
+            return self._shards[index].check_spell(user_uuid)
+
+    def add_key_and_check(self, user_uuid: str, key: str) -> bool:
+        """
+        Adds a key and checks the spell under one lock, so a concurrent key
+        for the same session cannot land in between.
+        """
+        index = self._index(user_uuid)
+        with self._locks[index]:
+            shard = self._shards[index]
+            shard.add_key(user_uuid, key)
+            return shard.check_spell(user_uuid)
+
+    def sweep(self) -> None:
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.sweep()
+
+    def eviction_stats(self) -> Dict[str, int]:
+        """
+        Returns the session count and eviction counters summed over the shards.
+        """
+        totals: Dict[str, int] = {}
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                stats = shard.eviction_stats()
+            for name, value in stats.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def export_state(self) -> Tuple[List[str], List[Any]]:
+        uuids: List[str] = []
+        values: List[Any] = []
+        restored = self._restored
+        if restored is not None and restored.active():
+            uuids, values = restored.remaining()
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard_uuids, shard_values = shard.export_state(include_restored=False)
+            uuids.extend(shard_uuids)
+            values.extend(shard_values)
+        return uuids, values
+
+    def restore_state(self, sessions: RestoredSessions) -> None:
+        """
+        Shares `sessions` between the shards; each UUID is only ever looked
+        up by its own shard.
+        """
+        self._restored = sessions
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.restore_state(sessions)
+
+
+
+def spell_digest(spell: List[str]) -> bytes:
+    """
+    Fingerprint of the normalized spell; state saved for another spell is
+    meaningless and is not restored.
+    """
+    normalized = SNAPSHOT_SEPARATOR.join(key.lower() for key in spell)
+    return hashlib.blake2b(normalized.encode(), digest_size=8).digest()
+
+
+def _typecode(largest: int) -> str:
+    return "B" if largest < 1 << 8 else "H" if largest < 1 << 16 else "I"
+
+
+def _array_bytes(typecode: str, values) -> bytes:
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _array_from(typecode: str, data: bytes) -> array:
+    packed = array(typecode)
+    packed.frombytes(data)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed
+
+
+def _encode(matcher: str, values: List[Any]) -> Tuple[str, str, List[bytes]]:
+    if matcher == MATCHER_AUTOMATON:
+        typecode = _typecode(max(values, default=0))
+        return typecode, "B", [_array_bytes(typecode, values)]
+
+    # buffers: a table of distinct keys, each buffer's end offset into the
+    # flattened keys, and the table index of every key
+    table = {key: index for index, key in enumerate(dict.fromkeys(chain.from_iterable(values)))}
+    indices = list(map(table.__getitem__, chain.from_iterable(values)))
+    ends = list(accumulate(map(len, values)))
+    end_typecode = _typecode(ends[-1] if ends else 0)
+    index_typecode = _typecode(len(table))
+    return (
+        end_typecode,
+        index_typecode,
+        [
+            _array_bytes(end_typecode, ends),
+            SNAPSHOT_SEPARATOR.join(table).encode(),
+            _array_bytes(index_typecode, indices),
+        ],
+    )
+
+
+def _decoder(matcher: str, typecodes: str, sections: List[bytes], count: int, spell_length: int):
+    if matcher == MATCHER_AUTOMATON:
+        states = _array_from(typecodes[0], sections[0])
+        if len(states) != count or max(states, default=0) > spell_length:
+            raise ValueError("automaton states do not match the session count or spell")
+        return states.__getitem__
+
+    ends = _array_from(typecodes[0], sections[0])
+    indices = _array_from(typecodes[1], sections[2])
+    table = sections[1].decode().split(SNAPSHOT_SEPARATOR) if indices else []
+    if len(ends) != count or (ends and ends[-1] != len(indices)):
+        raise ValueError("buffer offsets do not match the session count")
+
+    def decode(index: int) -> List[str]:
+        start = ends[index - 1] if index else 0
+        return [table[key] for key in indices[start : ends[index]]]
+
+    return decode
+
+
+def write_snapshot(manager, path: str) -> int:
+    """
+    Writes the manager's in-flight sessions to `path` and returns how many
+    were saved.
+
+    Sessions are sorted by UUID; UUIDs are stored as one NUL-separated
+    string and values as packed arrays (automaton states, or buffer
+    offsets plus indexes into a table of distinct keys), so loading is a
+    split and a few copies rather than per-session parsing. Sessions whose
+    UUID or keys contain NUL are skipped. The file is written next to
+    `path` and renamed into place, so a crash never leaves a partial
+    snapshot.
+    """
+    uuids, values = manager.export_state()
+    is_automaton = manager.matcher == MATCHER_AUTOMATON
+    # later entries win, so live sessions replace restored ones
+    sessions = dict(zip(uuids, values))
+    if SNAPSHOT_SEPARATOR in "".join(sessions) or (
+        not is_automaton and SNAPSHOT_SEPARATOR in "".join(chain.from_iterable(values))
+    ):
+        sessions = {
+            uuid: value
+            for uuid, value in sessions.items()
+            if SNAPSHOT_SEPARATOR not in uuid
+            and (is_automaton or SNAPSHOT_SEPARATOR not in "".join(value))
+        }
+    uuids = sorted(sessions)
+    values = list(map(sessions.__getitem__, uuids))
+
+    first_typecode, second_typecode, sections = _encode(manager.matcher, values)
+    header = _SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        MATCHERS.index(manager.matcher),
+        spell_digest(manager.spell),
+        time.time(),
+        len(uuids),
+        (first_typecode + second_typecode).encode(),
+    )
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        for section in [SNAPSHOT_SEPARATOR.join(uuids).encode()] + sections:
+            f.write(_SNAPSHOT_SECTION_LENGTH.pack(len(section)))
+            f.write(section)
+    os.replace(temp_path, path)
+    return len(uuids)
+
+
+def _read_sections(data: bytes, offset: int) -> List[bytes]:
+    sections = []
+    while offset < len(data):
+        (length,) = _SNAPSHOT_SECTION_LENGTH.unpack_from(data, offset)
+        offset += _SNAPSHOT_SECTION_LENGTH.size
+        if offset + length > len(data):
+            raise ValueError("truncated snapshot")
+        sections.append(data[offset : offset + length])
+        offset += length
+    return sections
+
+
+def load_snapshot(manager, path: str, max_age: float = 0) -> Optional[int]:
+    """
+    Restores sessions saved by `write_snapshot` into `manager`.
+
+    Returns the number of sessions restored, or None when there is no
+    usable snapshot: missing, another format version, another matcher or
+    spell, older than `max_age` seconds (0 disables the age check), or
+    corrupt. Unusable snapshots are logged and ignored.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        header = _SNAPSHOT_HEADER.unpack_from(data)
+    except struct.error:
+        logger.warning("Ignoring key buffer snapshot %s: truncated header", path)
+        return None
+    magic, version, matcher_index, digest, written_at, count, typecodes = header
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        logger.warning("Ignoring key buffer snapshot %s: unsupported format version", path)
+        return None
+    if matcher_index >= len(MATCHERS) or MATCHERS[matcher_index] != manager.matcher:
+        logger.info("Ignoring key buffer snapshot %s: written for another matcher", path)
+        return None
+    if digest != spell_digest(manager.spell):
+        logger.info("Ignoring key buffer snapshot %s: written for another spell", path)
+        return None
+    age = time.time() - written_at
+    if max_age > 0 and age > max_age:
+        logger.info("Ignoring key buffer snapshot %s: %.0f seconds old", path, age)
+        return None
+
+    try:
+        sections = _read_sections(data, _SNAPSHOT_HEADER.size)
+        uuids = sections[0].decode().split(SNAPSHOT_SEPARATOR) if count else []
+        if len(uuids) != count:
+            raise ValueError("session count mismatch")
+        decode = _decoder(
+            manager.matcher, typecodes.decode(), sections[1:], count, len(manager.spell)
+        )
+    except (IndexError, ValueError, UnicodeDecodeError, struct.error) as exc:
+        logger.warning("Ignoring key buffer snapshot %s: %s", path, exc)
+        return None
+
+    if count:
+        manager.restore_state(RestoredSessions(uuids, decode))
+    return count
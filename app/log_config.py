@@ -0,0 +1,168 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterable, Optional
+
+_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line.
+
+    Attributes passed through `extra=` (e.g. `event`, `uuid`) become
+    top-level fields next to `ts`, `level`, `logger` and `message`.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class EventSampler(logging.Filter):
+    """
+    Keeps a `rate` fraction of records whose `event` attribute is in
+    `events`; every other record passes through.
+    """
+
+    def __init__(self, rate: float, events: Iterable[str] = ("keypress",)):
+        super().__init__()
+        self.rate = rate
+        self.events = frozenset(events)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "event", None) not in self.events:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class AccessLogPathFilter(logging.Filter):
+    """
+    Drops uvicorn access-log records for requests to `paths` (query
+    strings ignored), so hot routes do not pay for a log line per request.
+    """
+
+    def __init__(self, paths: Iterable[str] = ()):
+        super().__init__()
+        self.paths = frozenset(paths)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # uvicorn.access args: (client_addr, method, path, http_version, status_code)
+        args = record.args
+        if not isinstance(args, tuple) or len(args) < 3:
+            return True
+        return str(args[2]).split("?", 1)[0] not in self.paths
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the caller: when the bounded queue is
+    full the record is dropped and counted in `dropped`.
+
+    Records are queued with `msg` and `args` untouched, so interpolation
+    and formatting happen on the listener thread; only a traceback is
+    rendered up front, since it cannot be pickled or outlive its frames.
+    Arguments are therefore formatted as they are when the listener gets
+    to them, not as they were when logged.
+    """
+
+    _exception_formatter = logging.Formatter()
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if not record.exc_info:
+            return record
+        record = copy.copy(record)
+        record.exc_text = record.exc_text or self._exception_formatter.formatException(
+            record.exc_info
+        )
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(
+    level: str | int = logging.INFO,
+    fmt: Optional[str] = None,
+    json_lines: bool = False,
+    use_queue: bool = False,
+    queue_size: int = 10_000,
+    keypress_sample_rate: float = 1.0,
+    stream=None,
+    force: bool = False,
+) -> Optional[QueueListener]:
+    """
+    Configures the root logger, like `logging.basicConfig`.
+
+    With `use_queue` the root logger only enqueues records and a
+    `QueueListener` thread formats and writes them, so request handlers
+    never wait on log I/O; the listener is returned and `stop_logging`
+    runs at exit.
+    `keypress_sample_rate` keeps that fraction of `event="keypress"`
+    records. Does nothing but set the level when the root logger already
+    has handlers, unless `force` is set.
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    if root.handlers and not force:
+        return None
+    stop_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    if json_lines:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(fmt or logging.BASIC_FORMAT))
+    sampler = EventSampler(keypress_sample_rate)
+
+    if not use_queue:
+        output.addFilter(sampler)
+        root.addHandler(output)
+        return None
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.addFilter(sampler)
+    root.addHandler(queue_handler)
+    _listener = QueueListener(queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.unregister(stop_logging)
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
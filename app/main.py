@@ -1,27 +1,91 @@
+import asyncio
+import importlib.util
 import logging
+import math
 import os
-from contextlib import asynccontextmanager
+import time
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
+from typing import Annotated, Dict, List
+
+# start of the "import" phase of the startup timing report
+_IMPORT_STARTED = time.perf_counter()
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Request,
+    Depends,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from key_buffer_manager import KeyBufferManager
+from bloom import BloomFilter
+from cache import TTLCache
+from ip_index import IPPrefixIndex
+from log_config import AccessLogPathFilter, JsonFormatter, configure_logging
+from key_buffer_manager import (
+    KeyBufferManager,
+    ShardedKeyBufferManager,
+    SQLiteKeyBufferStore,
+    load_snapshot,
+    write_snapshot,
+)
+from page_cache import PageCache
+from rate_limit import (
+    KEY_IP,
+    KEY_UUID,
+    RateLimiter,
+    RateLimitMiddleware,
+    parse_limit,
+    scope_uuid,
+)
+from static_assets import HashedStaticFiles
+from metrics import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    RequestMetricsMiddleware,
+)
+from retention import ExpiryPurger
+from write_behind import SpellWriteBehind
 from database import (
     init_db,
     get_session,
+    get_async_session,
+    get_pool_stats,
+    dispose_async_engine,
     AccessStore,
     SpellIPStore,
+    AsyncStore,
+    AsyncAccessStore,
+    AsyncSpellIPStore,
+    load_spell_ip_filter,
+    set_store_observer,
 )
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# seconds spent in each startup phase, reported once the app is ready
+startup_timings: Dict[str, float] = {"import": time.perf_counter() - _IMPORT_STARTED}
+
+
+@contextmanager
+def startup_phase(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(SCRIPT_DIR, "static")
@@ -30,6 +94,24 @@ PARENT_DIR = os.path.dirname(SCRIPT_DIR)
 
 load_dotenv(dotenv_path=os.path.join(PARENT_DIR, ".env"))
 
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_JSON = os.getenv("LOG_FORMAT", "text") == "json"
+LOG_QUEUE = bool(int(os.getenv("LOG_QUEUE", 0)))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10_000))
+LOG_KEYPRESS_SAMPLE_RATE = float(os.getenv("LOG_KEYPRESS_SAMPLE_RATE", 1.0))
+# configured at import so every uvicorn worker process logs the same way
+LOG_TEXT_FORMAT = "%(levelname)s - %(name)s - %(message)s"
+if not bool(int(os.getenv("API_DEBUG", 0))):
+    LOG_TEXT_FORMAT = "%(asctime)s - " + LOG_TEXT_FORMAT
+configure_logging(
+    level=LOG_LEVEL,
+    fmt=LOG_TEXT_FORMAT,
+    json_lines=LOG_JSON,
+    use_queue=LOG_QUEUE,
+    queue_size=LOG_QUEUE_SIZE,
+    keypress_sample_rate=LOG_KEYPRESS_SAMPLE_RATE,
+)
+
 SECRET_SPELL_FROM_ENV = os.getenv("APP_SECRET_SPELL", "")
 PARSED_SECRET_SPELL = (
     [key.strip() for key in SECRET_SPELL_FROM_ENV.split(",") if key.strip()]
@@ -44,13 +126,199 @@ if not PARSED_SECRET_SPELL:
 else:
     logger.info(f"Loaded PARSED_SECRET_SPELL: {PARSED_SECRET_SPELL}")
 
+SPELL_MATCHER = os.getenv("APP_SPELL_MATCHER", "buffer")
+KEY_BUFFER_MAX_ENTRIES = int(os.getenv("KEY_BUFFER_MAX_ENTRIES", 100_000))
+KEY_BUFFER_IDLE_TTL = float(os.getenv("KEY_BUFFER_IDLE_TTL", 1800))
+KEY_BUFFER_BACKEND = os.getenv("KEY_BUFFER_BACKEND", "memory")
+KEY_BUFFER_SQLITE_PATH = os.getenv(
+    "KEY_BUFFER_SQLITE_PATH", os.path.join(PARENT_DIR, "key_buffers.db")
+)
+KEY_BUFFER_SHARDS = int(os.getenv("KEY_BUFFER_SHARDS", 0))
+KEY_BUFFER_SWEEP_INTERVAL = float(os.getenv("KEY_BUFFER_SWEEP_INTERVAL", 60))
+KEY_BUFFER_SNAPSHOT_PATH = os.getenv("KEY_BUFFER_SNAPSHOT_PATH", "")
+KEY_BUFFER_SNAPSHOT_MAX_AGE = float(
+    os.getenv("KEY_BUFFER_SNAPSHOT_MAX_AGE", KEY_BUFFER_IDLE_TTL)
+)
+
 API_DOMAIN = os.getenv("API_DOMAIN", "https://type-friend.com")
+DB_ASYNC = bool(int(os.getenv("DB_ASYNC", 0)))
+
+access_cache = TTLCache(
+    max_entries=int(os.getenv("ACCESS_CACHE_SIZE", 10_000)),
+    ttl=float(os.getenv("ACCESS_CACHE_TTL", 300)),
+    negative_ttl=float(os.getenv("ACCESS_CACHE_NEGATIVE_TTL", 5)),
+)
+
+SPELL_IP_FILTER_CAPACITY = int(os.getenv("SPELL_IP_FILTER_CAPACITY", 0))
+SPELL_IP_FILTER_ERROR_RATE = float(os.getenv("SPELL_IP_FILTER_ERROR_RATE", 0.001))
+SPELL_IP_INDEX = bool(int(os.getenv("SPELL_IP_INDEX", 0)))
+if SPELL_IP_INDEX:
+    spell_ip_filter = IPPrefixIndex()
+elif SPELL_IP_FILTER_CAPACITY > 0:
+    spell_ip_filter = BloomFilter(SPELL_IP_FILTER_CAPACITY, SPELL_IP_FILTER_ERROR_RATE)
+else:
+    spell_ip_filter = None
+# one cast per network of this prefix length (32 / 128: per address)
+SPELL_IP_PREFIX_V4 = int(os.getenv("SPELL_IP_PREFIX_V4", 32))
+SPELL_IP_PREFIX_V6 = int(os.getenv("SPELL_IP_PREFIX_V6", 128))
+
+spell_write_behind = (
+    SpellWriteBehind(
+        max_pending=int(os.getenv("SPELL_WRITE_BEHIND_MAX_PENDING", 10_000)),
+        batch_size=int(os.getenv("SPELL_WRITE_BEHIND_BATCH_SIZE", 500)),
+        flush_interval=float(os.getenv("SPELL_WRITE_BEHIND_INTERVAL", 0.5)),
+    )
+    if bool(int(os.getenv("SPELL_WRITE_BEHIND", 0)))
+    else None
+)
+
+ACCESS_TTL = float(os.getenv("ACCESS_TTL", 0))
+SPELL_IP_TTL = float(os.getenv("SPELL_IP_TTL", 0))
+expiry_purger = ExpiryPurger(
+    access_ttl=ACCESS_TTL,
+    spell_ip_ttl=SPELL_IP_TTL,
+    interval=float(os.getenv("EXPIRY_PURGE_INTERVAL", 300)),
+    batch_size=int(os.getenv("EXPIRY_PURGE_BATCH_SIZE", 1000)),
+)
+KEYPRESS_BATCH_MAX_KEYS = int(os.getenv("KEYPRESS_BATCH_MAX_KEYS", 256))
+KEYPRESS_BATCH_MAX_ENTRIES = int(os.getenv("KEYPRESS_BATCH_MAX_ENTRIES", 16))
+METRICS_ENABLED = bool(int(os.getenv("METRICS_ENABLED", 1)))
+RATE_LIMIT_ENABLED = bool(int(os.getenv("RATE_LIMIT_ENABLED", 1)))
+# "tokens per second:burst" per route and key; override e.g. RATE_LIMIT_KEYPRESS_UUID='20:40'
+RATE_LIMIT_DEFAULTS = {
+    ("/keypress", KEY_IP): "50:100",
+    ("/keypress", KEY_UUID): "20:40",
+    ("/keypress/batch", KEY_IP): "10:20",
+    ("/keypress/batch", KEY_UUID): "5:10",
+    ("/mines", KEY_IP): "5:20",
+    ("/mines", KEY_UUID): "1:5",
+    ("/ws/keypress", KEY_IP): "1:10",
+}
+
+metrics_registry = MetricsRegistry()
+http_request_duration = metrics_registry.register(
+    Histogram(
+        "typefriend_http_request_duration_seconds",
+        "HTTP request latency by route template, method and status.",
+        labelnames=("route", "method", "status"),
+    )
+)
+db_store_duration = metrics_registry.register(
+    Histogram(
+        "typefriend_db_store_duration_seconds",
+        "Latency of AccessStore / SpellIPStore operations.",
+        labelnames=("store", "operation"),
+    )
+)
+spell_attempts = metrics_registry.register(
+    Counter(
+        "typefriend_spell_attempts_total",
+        "Keypresses that completed the secret spell.",
+    )
+)
+spell_successes = metrics_registry.register(
+    Counter(
+        "typefriend_spell_successes_total",
+        "Spell casts that granted access.",
+    )
+)
+rate_limited = metrics_registry.register(
+    Counter(
+        "typefriend_rate_limited_total",
+        "Requests rejected by the rate limiter, by route and bucket key.",
+        labelnames=("route", "key"),
+    )
+)
+
+rate_limiter = RateLimiter(
+    max_keys=int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000)),
+    on_limited=rate_limited.inc,
+)
+for (_route, _key), _default in RATE_LIMIT_DEFAULTS.items():
+    _env_name = "RATE_LIMIT_" + _route.strip("/").replace("/", "_").upper() + "_" + _key.upper()
+    rate_limiter.add_rule(_route, _key, parse_limit(os.getenv(_env_name, _default)))
+
+
+async def sweep_key_buffers(interval: float) -> None:
+    """
+    Evicts idle key buffer sessions every `interval` seconds.
+
+    Stores otherwise evict only while handling writes, so sessions left
+    behind once traffic stops would stay resident indefinitely.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            get_key_buffer_manager().sweep()
+        except Exception:
+            logger.exception("Key buffer sweep failed")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
+    with startup_phase("schema"):
+        ensure_db_initialized()
+    with startup_phase("spell_ip_filter"):
+        ensure_spell_ip_filter_loaded()
+    with startup_phase("pages"):
+        page_cache.render("index.html", SITE_PAGE_CONTEXT)
+        page_cache.render("404.html", NOT_FOUND_PAGE_CONTEXT)
+        page_cache.render("mines.html", SITE_PAGE_CONTEXT)
+    with startup_phase("background_tasks"):
+        if spell_write_behind is not None:
+            spell_write_behind.start(get_session)
+        if expiry_purger:
+            expiry_purger.start(get_session)
+        key_buffer_sweeper = None
+        if KEY_BUFFER_IDLE_TTL > 0 and KEY_BUFFER_SWEEP_INTERVAL > 0:
+            key_buffer_sweeper = asyncio.create_task(
+                sweep_key_buffers(KEY_BUFFER_SWEEP_INTERVAL)
+            )
+    snapshot_enabled = bool(KEY_BUFFER_SNAPSHOT_PATH) and KEY_BUFFER_BACKEND == "memory"
+    if snapshot_enabled:
+        with startup_phase("key_buffer_snapshot"):
+            restored = load_snapshot(
+                get_key_buffer_manager(), KEY_BUFFER_SNAPSHOT_PATH, KEY_BUFFER_SNAPSHOT_MAX_AGE
+            )
+        if restored is not None:
+            logger.info(
+                "Restored %d key buffer sessions from %s in %.3fs",
+                restored,
+                KEY_BUFFER_SNAPSHOT_PATH,
+                startup_timings["key_buffer_snapshot"],
+            )
+    startup_timings["total"] = time.perf_counter() - _IMPORT_STARTED
+    logger.info(
+        "Startup timings: "
+        + ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in startup_timings.items())
+    )
     yield
+    if key_buffer_sweeper is not None:
+        key_buffer_sweeper.cancel()
+        try:
+            await key_buffer_sweeper
+        except asyncio.CancelledError:
+            pass
+    await expiry_purger.stop()
+    if snapshot_enabled:
+        start = time.perf_counter()
+        try:
+            saved = write_snapshot(get_key_buffer_manager(), KEY_BUFFER_SNAPSHOT_PATH)
+        except OSError as exc:
+            logger.error(f"Could not write key buffer snapshot: {exc}")
+        else:
+            logger.info(
+                "Saved %d key buffer sessions to %s in %.3fs",
+                saved,
+                KEY_BUFFER_SNAPSHOT_PATH,
+                time.perf_counter() - start,
+            )
+    if spell_write_behind is not None:
+        flushed = await spell_write_behind.stop(get_session)
+        logger.info(f"Write-behind flushed {flushed} rows at shutdown")
+    logger.info(f"Database pool stats at shutdown: {get_pool_stats()}")
+    if DB_ASYNC:
+        await dispose_async_engine()
 
 
 app = FastAPI(
@@ -59,15 +327,139 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
+static_files = HashedStaticFiles(directory=STATIC_DIR, url_prefix="/static")
+app.mount("/static", static_files, name="static")
 
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
+templates.env.globals["static_url"] = static_files.url
+page_cache = PageCache(templates)
+
+PAGE_CACHE_MAX_AGE = int(os.getenv("PAGE_CACHE_MAX_AGE", 300))
+PUBLIC_PAGE_CACHE_CONTROL = f"public, max-age={PAGE_CACHE_MAX_AGE}"
+PRIVATE_PAGE_CACHE_CONTROL = "private, no-cache"
+
+SITE_PAGE_CONTEXT = {
+    "api_domain": API_DOMAIN,
+    "og_title": "Mines of Chaumia",
+    "og_description": "The Mines of Chaumia are Open & filled with Treasures",
+    "og_image": "static/img/gandalf-at-door.jpg",
+}
+NOT_FOUND_PAGE_CONTEXT = {
+    "api_domain": API_DOMAIN,
+    "og_title": "404 - Page Not Found",
+    "og_description": "The page you are looking for does not exist.",
+    "og_image": "static/img/gandalf-at-door.jpg",
+}
 
 
 _key_buffer_manager_instance = None
-_db_session_instance = None
-_user_access_granted_instance = None
-_successful_spell_ips_instance = None
+_db_initialized = False
+_spell_ip_filter_loaded = False
+
+
+def _key_buffer_stats():
+    if _key_buffer_manager_instance is None:
+        return None
+    return _key_buffer_manager_instance.eviction_stats()
+
+
+def _pool_gauge(field: str):
+    def read():
+        return {
+            (engine,): stats[field]
+            for engine, stats in get_pool_stats().items()
+            if field in stats
+        }
+
+    return read
+
+
+metrics_registry.register(
+    Gauge(
+        "typefriend_key_buffer_sessions",
+        "Sessions currently held by the key buffer store.",
+        lambda: (_key_buffer_stats() or {}).get("entries"),
+    )
+)
+metrics_registry.register(
+    Gauge(
+        "typefriend_key_buffer_evictions",
+        "Sessions evicted from the key buffer store, by reason.",
+        lambda: {
+            (reason,): stats[f"{reason}_evictions"]
+            for stats in [_key_buffer_stats()]
+            if stats
+            for reason in ("lru", "idle")
+        },
+        labelnames=("reason",),
+    )
+)
+for _field in ("checkedout", "checkedin", "overflow"):
+    metrics_registry.register(
+        Gauge(
+            f"typefriend_db_pool_{_field}",
+            f"Connection pool '{_field}' count per engine.",
+            _pool_gauge(_field),
+            labelnames=("engine",),
+        )
+    )
+metrics_registry.register(
+    Gauge(
+        "typefriend_access_cache",
+        "Access cache entries and hit/miss/eviction counters.",
+        lambda: {(name,): value for name, value in access_cache.stats().items()},
+        labelnames=("stat",),
+    )
+)
+metrics_registry.register(
+    Gauge(
+        "typefriend_startup_seconds",
+        "Seconds spent in each startup phase of this worker.",
+        lambda: {(name,): value for name, value in startup_timings.items()},
+        labelnames=("phase",),
+    )
+)
+metrics_registry.register(
+    Gauge(
+        "typefriend_spell_ip_filter",
+        "Spell IP Bloom filter or prefix index size and load.",
+        lambda: None
+        if spell_ip_filter is None
+        else {(name,): value for name, value in spell_ip_filter.stats().items()},
+        labelnames=("stat",),
+    )
+)
+metrics_registry.register(
+    Gauge(
+        "typefriend_write_behind",
+        "Write-behind queue depth and flush counters.",
+        lambda: None
+        if spell_write_behind is None
+        else {(name,): value for name, value in spell_write_behind.stats().items()},
+        labelnames=("stat",),
+    )
+)
+metrics_registry.register(
+    Gauge(
+        "typefriend_expired_rows_purged",
+        "Expired rows deleted by the purge task since startup.",
+        lambda: {(table,): value for table, value in expiry_purger.stats().items()} or None,
+        labelnames=("table",),
+    )
+)
+
+if METRICS_ENABLED:
+    app.add_middleware(
+        RequestMetricsMiddleware,
+        histogram=http_request_duration,
+        mount_prefixes=("/static",),
+    )
+    set_store_observer(
+        lambda store, operation, seconds: db_store_duration.observe(seconds, store, operation)
+    )
 
 
 @app.exception_handler(404)
@@ -75,15 +467,14 @@ async def not_found_exception_handler(request: Request, exc: HTTPException):
     """
     Custom 404 Not Found handler.
     """
-    logger.info(f"Serving 404 page for path: {request.url.path}")
-    context = {
-        "request": request,
-        "api_domain": API_DOMAIN,
-        "og_title": "404 - Page Not Found",
-        "og_description": "The page you are looking for does not exist.",
-        "og_image": "static/img/gandalf-at-door.jpg",
-    }
-    return templates.TemplateResponse("404.html", context, status_code=404)
+    logger.info("Serving 404 page for path: %s", request.url.path)
+    return page_cache.response(
+        request,
+        "404.html",
+        NOT_FOUND_PAGE_CONTEXT,
+        cache_control=PUBLIC_PAGE_CACHE_CONTROL,
+        status_code=404,
+    )
 
 
 def get_key_buffer_manager() -> KeyBufferManager:
@@ -93,40 +484,209 @@ def get_key_buffer_manager() -> KeyBufferManager:
     """
     global _key_buffer_manager_instance
     if _key_buffer_manager_instance is None:
-        _key_buffer_manager_instance = KeyBufferManager(
-            parsed_secret_spell=PARSED_SECRET_SPELL
-        )
+        store = None
+        if KEY_BUFFER_BACKEND == "sqlite":
+            store = SQLiteKeyBufferStore(
+                KEY_BUFFER_SQLITE_PATH,
+                table=f"key_buffers_{SPELL_MATCHER}",
+                max_entries=KEY_BUFFER_MAX_ENTRIES,
+                idle_ttl=KEY_BUFFER_IDLE_TTL,
+            )
+        elif KEY_BUFFER_BACKEND != "memory":
+            raise ValueError(
+                f"Unknown KEY_BUFFER_BACKEND '{KEY_BUFFER_BACKEND}'; "
+                "expected 'memory' or 'sqlite'"
+            )
+        if KEY_BUFFER_SHARDS > 0:
+            if store is not None:
+                raise ValueError("KEY_BUFFER_SHARDS requires KEY_BUFFER_BACKEND='memory'")
+            _key_buffer_manager_instance = ShardedKeyBufferManager(
+                parsed_secret_spell=PARSED_SECRET_SPELL,
+                shards=KEY_BUFFER_SHARDS,
+                matcher=SPELL_MATCHER,
+                max_entries=KEY_BUFFER_MAX_ENTRIES,
+                idle_ttl=KEY_BUFFER_IDLE_TTL,
+            )
+        else:
+            _key_buffer_manager_instance = KeyBufferManager(
+                parsed_secret_spell=PARSED_SECRET_SPELL,
+                matcher=SPELL_MATCHER,
+                max_entries=KEY_BUFFER_MAX_ENTRIES,
+                idle_ttl=KEY_BUFFER_IDLE_TTL,
+                store=store,
+            )
     return _key_buffer_manager_instance
 
 
-def get_db_session():
-    global _db_session_instance
-    if _db_session_instance is None:
+def ensure_db_initialized():
+    global _db_initialized
+    if not _db_initialized:
         init_db()
-        _db_session_instance = get_session()
-    return _db_session_instance
+        _db_initialized = True
 
 
-def get_user_access_state() -> dict:
+def ensure_spell_ip_filter_loaded():
+    """
+    Bulk-loads recorded IPs into the spell IP filter once per process.
+    """
+    global _spell_ip_filter_loaded
+    if spell_ip_filter is None or _spell_ip_filter_loaded:
+        return
+    ensure_db_initialized()
+    session = get_session()
+    try:
+        loaded = load_spell_ip_filter(session, spell_ip_filter)
+    finally:
+        session.close()
+    _spell_ip_filter_loaded = True
+    logger.info(
+        f"Loaded {loaded} IPs into the spell IP filter: {spell_ip_filter.stats()}"
+    )
+    if (
+        isinstance(spell_ip_filter, BloomFilter)
+        and spell_ip_filter.items_added > spell_ip_filter.capacity
+    ):
+        logger.warning(
+            "Spell IP filter is over capacity; raise SPELL_IP_FILTER_CAPACITY "
+            "to keep the false-positive rate near its target."
+        )
+
+
+async def get_db_session():
+    """
+    Dependency that yields a request-scoped session drawn from the pool.
+
+    The session is an AsyncSession when DB_ASYNC is enabled. It is closed
+    after the response, returning its connection to the pool, so
+    concurrent requests never share session state.
+    """
+    ensure_db_initialized()
+    if DB_ASYNC:
+        async with get_async_session() as session:
+            yield session
+        return
+    session = get_session()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def get_user_access_state(session=Depends(get_db_session)) -> dict:
     """
     Dependency that provides the user access state dictionary.
     This allows for easy testing and state isolation.
     """
-    global _user_access_granted_instance
-    if _user_access_granted_instance is None:
-        _user_access_granted_instance = AccessStore(get_db_session())
-    return _user_access_granted_instance
+    if DB_ASYNC:
+        return AsyncAccessStore(
+            session, cache=access_cache, write_behind=spell_write_behind, ttl=ACCESS_TTL
+        )
+    return AccessStore(
+        session, cache=access_cache, write_behind=spell_write_behind, ttl=ACCESS_TTL
+    )
 
 
-def get_successful_spell_ips_state() -> dict:
+def get_successful_spell_ips_state(session=Depends(get_db_session)) -> dict:
     """
     Dependency that provides the successful spell IPs state dictionary.
     This allows for easy testing and state isolation.
     """
-    global _successful_spell_ips_instance
-    if _successful_spell_ips_instance is None:
-        _successful_spell_ips_instance = SpellIPStore(get_db_session())
-    return _successful_spell_ips_instance
+    ensure_spell_ip_filter_loaded()
+    if DB_ASYNC:
+        return AsyncSpellIPStore(
+            session,
+            ip_filter=spell_ip_filter,
+            write_behind=spell_write_behind,
+            ttl=SPELL_IP_TTL,
+            prefix_v4=SPELL_IP_PREFIX_V4,
+            prefix_v6=SPELL_IP_PREFIX_V6,
+        )
+    return SpellIPStore(
+        session,
+        ip_filter=spell_ip_filter,
+        write_behind=spell_write_behind,
+        ttl=SPELL_IP_TTL,
+        prefix_v4=SPELL_IP_PREFIX_V4,
+        prefix_v6=SPELL_IP_PREFIX_V6,
+    )
+
+
+@asynccontextmanager
+async def spell_claim_stores():
+    """
+    Yields `(access_state, successful_spell_ips)` backed by a short-lived
+    session, for connections that outlive a single request.
+
+    The WebSocket endpoint opens these per spell claim rather than holding
+    request-scoped stores for the whole connection, which would pin a
+    pooled connection (idle in transaction) for as long as the socket
+    stays open. Dependency overrides are honoured as `Depends` would.
+    """
+    access_override = app.dependency_overrides.get(get_user_access_state)
+    ips_override = app.dependency_overrides.get(get_successful_spell_ips_state)
+    sessions = None
+    if access_override is None or ips_override is None:
+        sessions = get_db_session()
+        session = await anext(sessions)
+    try:
+        yield (
+            access_override() if access_override else get_user_access_state(session),
+            ips_override() if ips_override else get_successful_spell_ips_state(session),
+        )
+    finally:
+        if sessions is not None:
+            await sessions.aclose()
+
+
+async def store_get(store, key: str, default=None):
+    """
+    Reads from a dict-like store, awaiting it when it is an AsyncStore.
+    """
+    if isinstance(store, AsyncStore):
+        return await store.get(key, default)
+    return store.get(key, default)
+
+
+async def store_contains(store, key: str) -> bool:
+    if isinstance(store, AsyncStore):
+        return await store.contains(key)
+    return key in store
+
+
+async def store_set(store, key: str, value) -> None:
+    if isinstance(store, AsyncStore):
+        await store.set(key, value)
+    else:
+        store[key] = value
+
+
+async def store_claim_spell(
+    successful_spell_ips, access_state, client_host: str, user_uuid: str
+) -> bool:
+    """
+    Records a spell cast for `client_host` and grants `user_uuid` access,
+    returning False if the IP has already cast the spell.
+
+    Database-backed stores do this as one atomic claim; other dict-like
+    stores (e.g. test overrides) fall back to check-then-set.
+    """
+    value = {"user_uuid": user_uuid, "cast_time": datetime.utcnow()}
+    if isinstance(successful_spell_ips, AsyncSpellIPStore) and isinstance(
+        access_state, AsyncAccessStore
+    ):
+        return await successful_spell_ips.claim(
+            client_host, value, access_cache=access_cache, access_ttl=ACCESS_TTL
+        )
+    if isinstance(successful_spell_ips, SpellIPStore) and isinstance(access_state, AccessStore):
+        return successful_spell_ips.claim(
+            client_host, value, access_cache=access_cache, access_ttl=ACCESS_TTL
+        )
+
+    if await store_contains(successful_spell_ips, client_host):
+        return False
+    await store_set(successful_spell_ips, client_host, value)
+    await store_set(access_state, user_uuid, True)
+    return True
 
 
 class KeyPressEvent(BaseModel):
@@ -139,23 +699,45 @@ class KeyPressResponse(BaseModel):
     spell_successful: bool
 
 
+class KeyPressBatchEvent(BaseModel):
+    uuid: str
+    keys: List[str] = Field(min_length=1, max_length=KEYPRESS_BATCH_MAX_KEYS)
+
+
+class KeyPressBatchResult(BaseModel):
+    uuid: str
+    keys_received: int
+    spell_index: int | None
+    spell_successful: bool
+    message: str
+
+
+class KeyPressBatchResponse(BaseModel):
+    results: List[KeyPressBatchResult]
+
+
 class ProtectedResourceResponse(BaseModel):
     message: str
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics():
+    """
+    Exposes this process's metrics in the Prometheus text format.
+    """
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404)
+    return PlainTextResponse(metrics_registry.render(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     """
     Serves the main HTML page.
     """
-    context = {
-        "request": request,
-        "api_domain": API_DOMAIN,
-        "og_title": "Mines of Chaumia",
-        "og_description": "The Mines of Chaumia are Open & filled with Treasures",
-        "og_image": "static/img/gandalf-at-door.jpg"
-    }
-    return templates.TemplateResponse("index.html", context)
+    return page_cache.response(
+        request, "index.html", SITE_PAGE_CONTEXT, cache_control=PUBLIC_PAGE_CACHE_CONTROL
+    )
 
 
 @app.get("/mines", response_class=HTMLResponse)
@@ -173,7 +755,7 @@ async def enter_mines(
         )
         raise HTTPException(status_code=401, detail="Session ID required")
 
-    has_access = access_state.get(session_id, False)
+    has_access = await store_get(access_state, session_id, False)
 
     if not has_access:
         logger.warning(
@@ -186,14 +768,120 @@ async def enter_mines(
     logger.info(
         f"Access granted to /mines for session_id: {session_id} from {request.client.host}"
     )
-    context = {
-        "request": request,
-        "api_domain": API_DOMAIN,
-        "og_title": "Mines of Chaumia",
-        "og_description": "The Mines of Chaumia are Open & filled with Treasures",
-        "og_image": "static/img/gandalf-at-door.jpg"
+    return page_cache.response(
+        request, "mines.html", SITE_PAGE_CONTEXT, cache_control=PRIVATE_PAGE_CACHE_CONTROL
+    )
+
+
+async def cast_spell(
+    client_host: str | None,
+    user_uuid: str,
+    key: str,
+    access_state: dict,
+    successful_spell_ips: dict,
+    ip_already_cast: bool = False,
+) -> dict:
+    """
+    Applies the one-cast-per-IP rule for a user whose buffer matched the spell.
+
+    Pass `ip_already_cast=True` when the caller already knows the IP has
+    cast the spell, which skips the store lookup and writes.
+    """
+    if not client_host:
+        logger.warning(
+            "Request.client cannot be identified for successful secret spell cast. "
+            f"UUID: {user_uuid}"
+        )
+        raise HTTPException(
+            status_code=403,
+            detail="Could not determine request IP; rejecting request.",
+        )
+
+    spell_attempts.inc()
+    if ip_already_cast or not await store_claim_spell(
+        successful_spell_ips, access_state, client_host, user_uuid
+    ):
+        logger.warning(
+            f"Spell sequence correct for UUID {user_uuid} from IP {client_host}, "
+            "but this IP has already cast the spell."
+        )
+        return {
+            "spell_successful": False,
+            "message": (
+                f"Key '{key}' received. Spell sequence correct, "
+                f"but IP {client_host} has already cast the spell. "
+                "Access not granted for this new session."
+            ),
+        }
+
+    spell_successes.inc()
+    logger.info(
+        f"Secret spell cast successfully by UUID: {user_uuid} "
+        f"from IP: {client_host}. Access granted."
+    )
+    return {
+        "spell_successful": True,
+        "message": f"Key '{key}' received. Spell cast successfully!",
     }
-    return templates.TemplateResponse("mines.html", context)
+
+
+async def process_keypress(
+    client_host: str | None,
+    user_uuid: str,
+    key: str,
+    key_buffer_manager: KeyBufferManager,
+    access_state: dict | None = None,
+    successful_spell_ips: dict | None = None,
+) -> dict:
+    """
+    Feeds one key into the user's buffer and handles a completed spell.
+
+    Shared by the POST and WebSocket keypress endpoints so both channels
+    apply the same spell and one-cast-per-IP rules. Without stores, a
+    completed spell is claimed through `spell_claim_stores`.
+    """
+    current_buffer = key_buffer_manager.add_key(user_uuid=user_uuid, key=key)
+
+    logger.info(
+        "Key pressed: %s from UUID: %s. Buffer: %s",
+        key,
+        user_uuid,
+        current_buffer,
+        extra={"event": "keypress", "uuid": user_uuid},
+    )
+
+    if key_buffer_manager.check_spell(user_uuid=user_uuid):
+        if access_state is None or successful_spell_ips is None:
+            async with spell_claim_stores() as (access_state, successful_spell_ips):
+                return await cast_spell(
+                    client_host=client_host,
+                    user_uuid=user_uuid,
+                    key=key,
+                    access_state=access_state,
+                    successful_spell_ips=successful_spell_ips,
+                )
+        return await cast_spell(
+            client_host=client_host,
+            user_uuid=user_uuid,
+            key=key,
+            access_state=access_state,
+            successful_spell_ips=successful_spell_ips,
+        )
+
+    return {"message": f"Key '{key}' received", "spell_successful": False}
+
+
+def raise_if_limited(retry_after: float) -> None:
+    """
+    Answers 429 with Retry-After, like `RateLimitMiddleware`, for limits
+    charged inside a handler.
+    """
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too Many Requests",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
 
 
 @app.post("/keypress", response_model=KeyPressResponse)
@@ -206,55 +894,213 @@ async def log_keypress(
 ):
     """
     Receives keypress events from the client and checks for the secret spell.
-    """
-    current_buffer = key_buffer_manager.add_key(user_uuid=event.uuid, key=event.key)
 
-    logger.info(
-        f"Key pressed: {event.key} from UUID: {event.uuid}. Buffer: {current_buffer}"
+    The middleware limits the UUID from `X-Session-Id`; when that header
+    is missing or names another session, the body's UUID is charged here,
+    so leaving it out does not escape the per-UUID limit.
+    """
+    if RATE_LIMIT_ENABLED and scope_uuid(request.scope) != event.uuid:
+        raise_if_limited(rate_limiter.charge(request.url.path, KEY_UUID, [event.uuid]))
+    return await process_keypress(
+        client_host=request.client.host if request.client else None,
+        user_uuid=event.uuid,
+        key=event.key,
+        key_buffer_manager=key_buffer_manager,
+        access_state=access_state,
+        successful_spell_ips=successful_spell_ips,
     )
 
-    response_message = {"message": f"Key '{event.key}' received"}
 
-    if key_buffer_manager.check_spell(user_uuid=event.uuid):
-        if not (request.client):
-            logger.warning(
-                "Request.client cannot be identified for successful secret spell cast. "
-                f"UUID: {event.uuid}"
-            )
-            raise HTTPException(
-                status_code=403,
-                detail="Could not determine request IP; rejecting request.",
+@app.post("/keypress/batch", response_model=KeyPressBatchResponse)
+async def log_keypress_batch(
+    request: Request,
+    batch: KeyPressBatchEvent
+    | Annotated[
+        List[KeyPressBatchEvent], Field(min_length=1, max_length=KEYPRESS_BATCH_MAX_ENTRIES)
+    ],
+    key_buffer_manager: KeyBufferManager = Depends(get_key_buffer_manager),
+    access_state: dict = Depends(get_user_access_state),
+    successful_spell_ips: dict = Depends(get_successful_spell_ips_state),
+):
+    """
+    Receives ordered bursts of keys for one or more UUIDs in a single request.
+
+    Keys are fed through the buffer in order and each UUID reports the
+    index of the key that first completed the spell. Since every key in
+    the request shares one client IP, the spell-success path runs at most
+    once; later completions in the same batch are denied without touching
+    the stores.
+
+    A request holds at most KEYPRESS_BATCH_MAX_ENTRIES entries and
+    KEYPRESS_BATCH_MAX_KEYS keys in total. Every key costs a token of the
+    `/keypress` IP and UUID rate limits, as if it had been posted on its
+    own, so batching never raises the key rate a client may send.
+    """
+    client_host = request.client.host if request.client else None
+    entries = batch if isinstance(batch, list) else [batch]
+    total_keys = sum(len(entry.keys) for entry in entries)
+    if total_keys > KEYPRESS_BATCH_MAX_KEYS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch carries at most {KEYPRESS_BATCH_MAX_KEYS} keys",
+        )
+    if RATE_LIMIT_ENABLED:
+        retry_after = max(
+            rate_limiter.charge(
+                "/keypress", KEY_UUID, [entry.uuid for entry in entries for _ in entry.keys]
+            ),
+            rate_limiter.charge("/keypress", KEY_IP, [client_host] * total_keys),
+        )
+        raise_if_limited(retry_after)
+    spell_cast_in_batch = False
+    results = []
+
+    for entry in entries:
+        spell_index = None
+        for index, key in enumerate(entry.keys):
+            key_buffer_manager.add_key(user_uuid=entry.uuid, key=key)
+            if spell_index is None and key_buffer_manager.check_spell(
+                user_uuid=entry.uuid
+            ):
+                spell_index = index
+
+        logger.info(
+            "Batch of %d keys from UUID: %s. Spell index: %s",
+            len(entry.keys),
+            entry.uuid,
+            spell_index,
+            extra={"event": "keypress", "uuid": entry.uuid},
+        )
+
+        if spell_index is None:
+            results.append(
+                {
+                    "uuid": entry.uuid,
+                    "keys_received": len(entry.keys),
+                    "spell_index": None,
+                    "spell_successful": False,
+                    "message": f"{len(entry.keys)} keys received",
+                }
             )
+            continue
 
-        if request.client.host in successful_spell_ips:
-            response_message["spell_successful"] = False
-            response_message["message"] = (
-                f"Key '{event.key}' received. Spell sequence correct, "
-                f"but IP {request.client.host} has already cast the spell. "
-                "Access not granted for this new session."
+        cast_result = await cast_spell(
+            client_host=client_host,
+            user_uuid=entry.uuid,
+            key=entry.keys[spell_index],
+            access_state=access_state,
+            successful_spell_ips=successful_spell_ips,
+            ip_already_cast=spell_cast_in_batch,
+        )
+        spell_cast_in_batch = True
+        results.append(
+            {
+                "uuid": entry.uuid,
+                "keys_received": len(entry.keys),
+                "spell_index": spell_index,
+                **cast_result,
+            }
+        )
+
+    return {"results": results}
+
+
+@app.websocket("/ws/keypress")
+async def keypress_websocket(
+    websocket: WebSocket,
+    uuid: str,
+    key_buffer_manager: KeyBufferManager = Depends(get_key_buffer_manager),
+):
+    """
+    Streams keypresses for one session UUID over a persistent connection.
+
+    The session is bound once by the `uuid` query parameter; each text
+    message is a single key and is answered with the same JSON payload
+    that `POST /keypress` returns. The connection holds no database
+    session; one is opened only while a completed spell is claimed.
+    """
+    await websocket.accept()
+    client_host = websocket.client.host if websocket.client else None
+    try:
+        while True:
+            key = await websocket.receive_text()
+            if not key:
+                continue
+            if RATE_LIMIT_ENABLED and rate_limiter.check("/keypress", client_host, uuid):
+                await websocket.send_json(
+                    {"message": "Too Many Requests", "spell_successful": False}
+                )
+                continue
+            try:
+                response_message = await process_keypress(
+                    client_host=client_host,
+                    user_uuid=uuid,
+                    key=key,
+                    key_buffer_manager=key_buffer_manager,
+                )
+            except HTTPException as exc:
+                await websocket.close(
+                    code=status.WS_1008_POLICY_VIOLATION, reason=exc.detail
+                )
+                return
+            await websocket.send_json(response_message)
+    except WebSocketDisconnect:
+        logger.info(f"Keypress websocket closed for UUID: {uuid}")
+
+
+def _server_implementation(name: str, choice: str, fast: str, fallback: str) -> str:
+    """
+    Resolves API_LOOP / API_HTTP: "auto" picks `fast` (uvloop, httptools)
+    when it is installed and `fallback` (asyncio, h11) otherwise.
+    """
+    if choice == "auto":
+        return fast if importlib.util.find_spec(fast) is not None else fallback
+    if choice not in (fast, fallback):
+        raise ValueError(f"Unknown {name} '{choice}'; expected 'auto', '{fast}' or '{fallback}'")
+    return choice
+
+
+def server_options() -> dict:
+    """
+    uvicorn.run settings from the API_* environment variables.
+
+    With API_WORKERS > 1 uvicorn binds the port once and pre-spawns that
+    many worker processes sharing the socket; it replaces workers that
+    die, restarts them all on SIGHUP, and on SIGTERM lets in-flight
+    requests finish for up to API_GRACEFUL_TIMEOUT seconds. Key buffers
+    of the memory backend live in one process, so several workers need
+    KEY_BUFFER_BACKEND='sqlite'. Rate-limit buckets and the access cache
+    stay per worker, so effective RATE_LIMIT_* limits scale with
+    API_WORKERS.
+    """
+    workers = int(os.getenv("API_WORKERS", 1))
+    if workers > 1:
+        if KEY_BUFFER_BACKEND == "memory":
+            raise ValueError(
+                "API_WORKERS > 1 requires KEY_BUFFER_BACKEND='sqlite'; in-memory key "
+                "buffers would split one user's keystrokes across workers"
             )
+        if spell_write_behind is not None or spell_ip_filter is not None:
             logger.warning(
-                f"Spell sequence correct for UUID {event.uuid} from IP {request.client.host}, "
-                "but this IP has already cast the spell."
-            )
-        else:
-            successful_spell_ips[request.client.host] = {
-                "user_uuid": event.uuid,
-                "cast_time": datetime.utcnow(),
-            }
-            access_state[event.uuid] = True
-            response_message["spell_successful"] = True
-            response_message["message"] = (
-                f"Key '{event.key}' received. Spell cast successfully!"
+                "SPELL_WRITE_BEHIND and the spell IP filter only see writes of their "
+                "own worker; with API_WORKERS > 1 prefer leaving them off."
             )
+        if RATE_LIMIT_ENABLED:
             logger.info(
-                f"Secret spell cast successfully by UUID: {event.uuid} "
-                f"from IP: {request.client.host}. Access granted."
+                f"Rate limits apply per worker; with {workers} workers a client can "
+                f"make up to {workers}x the configured RATE_LIMIT_* rates."
             )
-    else:
-        response_message["spell_successful"] = False
+    return {
+        "workers": workers,
+        "loop": _server_implementation("API_LOOP", os.getenv("API_LOOP", "auto"), "uvloop", "asyncio"),
+        "http": _server_implementation("API_HTTP", os.getenv("API_HTTP", "auto"), "httptools", "h11"),
+        "access_log": bool(int(os.getenv("API_ACCESS_LOG", 1))),
+        "timeout_graceful_shutdown": int(os.getenv("API_GRACEFUL_TIMEOUT", 30)),
+    }
 
-    return response_message
+
+# app, routes and module-level collaborators built after the imports
+startup_timings["module"] = time.perf_counter() - _IMPORT_STARTED - startup_timings["import"]
 
 
 if __name__ == "__main__":
@@ -264,22 +1110,49 @@ if __name__ == "__main__":
     api_debug = bool(int(os.getenv("API_DEBUG", False)))
     api_port = int(os.getenv("API_PORT", 8000))
     forwarded_allow_ips = str(os.getenv("FORWARDED_ALLOW_IPS", "172.17.0.1"))
-
-    _app_log_format = "%(levelname)s - %(name)s - %(message)s"
-    if not api_debug:
-        _app_log_format = "%(asctime)s - " + _app_log_format
-    
-    logging.basicConfig(level=logging.INFO, format=_app_log_format, force=True)
+    # no access log line for these high-volume routes
+    access_log_skip_paths = [
+        path.strip()
+        for path in os.getenv(
+            "API_ACCESS_LOG_SKIP_PATHS", "/keypress,/keypress/batch,/ws/keypress,/metrics"
+        ).split(",")
+        if path.strip()
+    ]
+    options = server_options()
 
     uvicorn_log_config = LOGGING_CONFIG.copy()
-    if not api_debug:
+    if LOG_JSON:
+        uvicorn_log_config["formatters"]["default"] = {"()": JsonFormatter}
+        uvicorn_log_config["formatters"]["access"] = {"()": JsonFormatter}
+    elif not api_debug:
         uvicorn_log_config["formatters"]["default"]["fmt"] = "%(asctime)s - %(levelprefix)s %(message)s"
         uvicorn_log_config["formatters"]["access"]["fmt"] = '%(asctime)s - %(levelprefix)s %(client_addr)s - "%(request_line)s" %(status_code)s'
-    
+    if access_log_skip_paths:
+        uvicorn_log_config["filters"] = {
+            "skip_hot_routes": {"()": AccessLogPathFilter, "paths": access_log_skip_paths}
+        }
+        uvicorn_log_config["handlers"] = {
+            **uvicorn_log_config["handlers"],
+            "access": {**uvicorn_log_config["handlers"]["access"], "filters": ["skip_hot_routes"]},
+        }
+
+    # once in the parent, so workers starting together never race on the
+    # schema and each finds the version marker current
+    ensure_db_initialized()
+    logger.info(
+        "Serving on port %d with %d worker(s), loop=%s, http=%s",
+        api_port,
+        options["workers"],
+        options["loop"],
+        options["http"],
+    )
     uvicorn.run(
-        app, 
+        # spawned workers have already run this file as __mp_main__; naming
+        # it avoids importing the whole app a second time as "main"
+        "__mp_main__:app" if options["workers"] > 1 else app,
         host="0.0.0.0", 
         port=api_port,
         forwarded_allow_ips=(None if api_debug else forwarded_allow_ips),
         log_config=uvicorn_log_config,
+        **options,
     )
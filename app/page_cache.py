@@ -0,0 +1,101 @@
+import hashlib
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, NamedTuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+HTML_MEDIA_TYPE = "text/html; charset=utf-8"
+
+
+class RenderedPage(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: str
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+class PageCache:
+    """
+    Renders request-independent templates once and serves them as bytes.
+
+    Each template name maps to one fixed context, so the first render is
+    reused for every request. Responses carry a content-hash ETag and the
+    render time as Last-Modified; conditional GETs that match get an
+    empty 304. The render time rather than the templates' mtime is used
+    because the body also depends on the content-hashed static asset
+    URLs, which change on a deploy that leaves the templates alone.
+    Templates served this way must not depend on the request (no
+    `url_for`, no `request` in the context).
+    """
+
+    def __init__(self, templates):
+        self.env = templates.env
+        self._pages: Dict[str, RenderedPage] = {}
+        self._lock = threading.Lock()
+
+    def render(self, name: str, context: dict) -> RenderedPage:
+        page = self._pages.get(name)
+        if page is not None:
+            return page
+        with self._lock:
+            page = self._pages.get(name)
+            if page is None:
+                body = self.env.get_template(name).render(context).encode()
+                page = RenderedPage(
+                    body=body,
+                    etag=f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"',
+                    last_modified=formatdate(time.time(), usegmt=True),
+                )
+                self._pages[name] = page
+        return page
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+
+    def response(
+        self,
+        request: Request,
+        name: str,
+        context: dict,
+        cache_control: str,
+        status_code: int = 200,
+    ) -> Response:
+        page = self.render(name, context)
+        headers = {
+            "ETag": page.etag,
+            "Last-Modified": page.last_modified,
+            "Cache-Control": cache_control,
+        }
+        if status_code == 200 and self._not_modified(request, page):
+            return Response(status_code=304, headers=headers)
+        return Response(
+            content=page.body,
+            status_code=status_code,
+            media_type=HTML_MEDIA_TYPE,
+            headers=headers,
+        )
+
+    @staticmethod
+    def _not_modified(request: Request, page: RenderedPage) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, page.etag)
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None:
+            return False
+        try:
+            return parsedate_to_datetime(page.last_modified) <= parsedate_to_datetime(
+                if_modified_since
+            )
+        except (TypeError, ValueError):
+            return False
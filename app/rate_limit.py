@@ -0,0 +1,221 @@
+import json
+import math
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+KEY_IP = "ip"
+KEY_UUID = "uuid"
+UUID_HEADER = b"x-session-id"
+UUID_QUERY_PARAMS = ("uuid", "session_id")
+
+
+def parse_limit(spec: str) -> Optional[Tuple[float, float]]:
+    """
+    Parses "rate:burst" (tokens per second, bucket size); "0" or an empty
+    string disables the limit.
+    """
+    spec = spec.strip()
+    if not spec or spec == "0":
+        return None
+    rate, _, burst = spec.partition(":")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(1.0, rate)
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by string, refilled at `rate` tokens per second up
+    to `burst`.
+
+    Each bucket is a two-item list updated in place, so a check is a dict
+    lookup and some arithmetic. Buckets are kept in LRU order; inserting a
+    new key evicts from the front while over `max_keys` or idle longer
+    than `idle_ttl` (by default the time to refill a full bucket, after
+    which forgetting it changes nothing). Not thread-safe: it is driven
+    from the event loop.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000, idle_ttl: float = 0):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl or burst / rate
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self.limited = 0
+        self.evictions = 0
+
+    def consume(self, key: str, cost: int = 1) -> float:
+        """
+        Takes `cost` tokens for `key`; returns 0 if allowed, otherwise the
+        seconds until that many tokens are available. A refused request
+        takes nothing.
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._evict(now)
+            bucket = self._buckets[key] = [self.burst, now]
+        self._buckets.move_to_end(key)
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= cost:
+            bucket[0] = tokens - cost
+            return 0.0
+        bucket[0] = tokens
+        self.limited += 1
+        return (cost - tokens) / self.rate
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        while buckets and len(buckets) >= self.max_keys:
+            buckets.popitem(last=False)
+            self.evictions += 1
+        idle_before = now - self.idle_ttl
+        while buckets:
+            _, bucket = next(iter(buckets.items()))
+            if bucket[1] > idle_before:
+                break
+            buckets.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+
+class RateLimiter:
+    """
+    Per-route rules, each a token bucket keyed by client IP or session UUID.
+    """
+
+    def __init__(self, max_keys: int = 100_000, on_limited: Optional[Callable[[str, str], None]] = None):
+        self.max_keys = max_keys
+        self.on_limited = on_limited
+        self.rules: Dict[str, List[Tuple[str, TokenBucketLimiter]]] = {}
+
+    def add_rule(self, route: str, key: str, limit: Optional[Tuple[float, float]]) -> None:
+        if limit is None:
+            return
+        if key not in (KEY_IP, KEY_UUID):
+            raise ValueError(f"Unknown rate limit key '{key}'; expected '{KEY_IP}' or '{KEY_UUID}'")
+        rate, burst = limit
+        self.rules.setdefault(route, []).append(
+            (key, TokenBucketLimiter(rate, burst, max_keys=self.max_keys))
+        )
+
+    def needs_uuid(self, route: str) -> bool:
+        return any(key == KEY_UUID for key, _ in self.rules.get(route, ()))
+
+    def check(self, route: str, ip: Optional[str], uuid: Optional[str]) -> float:
+        """
+        Consumes a token from every bucket that applies; returns 0 if the
+        request is allowed, otherwise the largest retry-after in seconds.
+        """
+        retry_after = 0.0
+        for key, limiter in self.rules.get(route, ()):
+            value = ip if key == KEY_IP else uuid
+            if not value:
+                continue
+            wait = limiter.consume(value)
+            if wait:
+                retry_after = max(retry_after, wait)
+                if self.on_limited is not None:
+                    self.on_limited(route, key)
+        return retry_after
+
+    def charge(self, route: str, key: str, values: List[str]) -> float:
+        """
+        Consumes one token per item of `values` (repeats cost again) from
+        the route's `key` buckets, for requests carrying several UUIDs or
+        units of work; returns the largest retry-after, 0 if allowed.
+        """
+        retry_after = 0.0
+        costs = Counter(value for value in values if value)
+        for rule_key, limiter in self.rules.get(route, ()):
+            if rule_key != key:
+                continue
+            for value, cost in costs.items():
+                wait = limiter.consume(value, cost)
+                if wait:
+                    retry_after = max(retry_after, wait)
+                    if self.on_limited is not None:
+                        self.on_limited(route, key)
+        return retry_after
+
+    def clear(self) -> None:
+        for rules in self.rules.values():
+            for _, limiter in rules:
+                limiter.clear()
+
+    def stats(self) -> Dict[Tuple[str, str], int]:
+        return {
+            (route, key): len(limiter)
+            for route, rules in self.rules.items()
+            for key, limiter in rules
+        }
+
+
+def scope_uuid(scope) -> Optional[str]:
+    """
+    The session UUID the middleware keys on: `X-Session-Id` or the `uuid` /
+    `session_id` query parameter.
+    """
+    for name, value in scope["headers"]:
+        if name == UUID_HEADER:
+            return value.decode("latin-1")
+    query_string = scope.get("query_string")
+    if query_string:
+        for name, value in parse_qsl(query_string.decode("latin-1")):
+            if name in UUID_QUERY_PARAMS:
+                return value
+    return None
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware answering over-limit requests with 429 before routing.
+
+    The UUID comes from the `X-Session-Id` header or the `uuid` /
+    `session_id` query parameter, so the request body is never read.
+    Over-limit WebSocket handshakes are closed (uvicorn answers 403).
+    """
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or scope["path"] not in self.limiter.rules:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        client = scope.get("client")
+        uuid = scope_uuid(scope) if self.limiter.needs_uuid(path) else None
+        retry_after = self.limiter.check(path, client[0] if client else None, uuid)
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1008, "reason": "Too Many Requests"})
+            return
+        body = json.dumps({"detail": "Too Many Requests"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(math.ceil(retry_after)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
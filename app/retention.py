@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from typing import Callable, Dict
+
+from database import SuccessfulSpellIP, UserAccess, expiry_cutoff, purge_expired
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryPurger:
+    """
+    Background task deleting expired access grants and spell IP claims.
+
+    Every `interval` seconds it deletes `user_access` rows older than
+    `access_ttl` and `successful_spell_ips` rows older than `spell_ip_ttl`
+    (seconds; 0 keeps that table forever), `batch_size` rows per
+    transaction, until the backlog is gone. Each batch runs in a worker
+    thread and the loop yields between batches, so a large backlog never
+    holds long locks or blocks the event loop. Stores already treat
+    expired rows as absent; purging only keeps the tables and their
+    indexes small.
+    """
+
+    def __init__(
+        self,
+        access_ttl: float = 0,
+        spell_ip_ttl: float = 0,
+        interval: float = 300,
+        batch_size: int = 1000,
+    ):
+        self.targets = [
+            (name, column, ttl)
+            for name, column, ttl in (
+                ("user_access", UserAccess.created_at, access_ttl),
+                ("successful_spell_ips", SuccessfulSpellIP.cast_time, spell_ip_ttl),
+            )
+            if ttl > 0
+        ]
+        self.interval = interval
+        self.batch_size = batch_size
+        self.purged: Dict[str, int] = {name: 0 for name, _, _ in self.targets}
+        self.runs = 0
+        self._task: asyncio.Task | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.targets)
+
+    def _purge_batch(self, session_factory: Callable, column, ttl: float) -> int:
+        session = session_factory()
+        try:
+            return purge_expired(session, column, expiry_cutoff(ttl), self.batch_size)
+        finally:
+            session.close()
+
+    async def purge(self, session_factory: Callable) -> Dict[str, int]:
+        """
+        Deletes every expired row now; returns the count per table.
+        """
+        purged = {}
+        for name, column, ttl in self.targets:
+            total = 0
+            while True:
+                deleted = await asyncio.to_thread(
+                    self._purge_batch, session_factory, column, ttl
+                )
+                total += deleted
+                if deleted < self.batch_size:
+                    break
+            self.purged[name] += total
+            purged[name] = total
+        self.runs += 1
+        return purged
+
+    async def _run(self, session_factory: Callable) -> None:
+        while True:
+            try:
+                purged = await self.purge(session_factory)
+            except Exception:
+                logger.exception("Expiry purge failed")
+            else:
+                if any(purged.values()):
+                    logger.info("Purged expired rows: %s", purged)
+            await asyncio.sleep(self.interval)
+
+    def start(self, session_factory: Callable) -> None:
+        """
+        Starts the background purge task on the running event loop.
+        """
+        self._task = asyncio.create_task(self._run(session_factory))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.purged)
@@ -41,7 +41,136 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    async function processAndSendKey(keyToSend) {
+    // Keys stream over a single websocket bound to the session. Keys typed
+    // while it connects are queued and sent once it opens; while it is down,
+    // keys go to POST /keypress one at a time, so the server always sees them
+    // in the order they were typed. A dropped socket reconnects with backoff.
+    const RECONNECT_MIN_DELAY = 1000;
+    const RECONNECT_MAX_DELAY = 30000;
+    let keypressSocket = null;
+    let queuedSocketKeys = [];
+    let reconnectDelay = RECONNECT_MIN_DELAY;
+    let postQueue = Promise.resolve();
+    let postsInFlight = 0;
+
+    function openKeypressSocket() {
+        if (!('WebSocket' in window)) {
+            return;
+        }
+        const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const wsUrl = `${wsProtocol}//${window.location.host}/ws/keypress?uuid=${encodeURIComponent(userSessionId)}`;
+        try {
+            keypressSocket = new WebSocket(wsUrl);
+        } catch (error) {
+            console.error('Could not open keypress websocket:', error);
+            keypressSocket = null;
+            return;
+        }
+        keypressSocket.onopen = () => {
+            reconnectDelay = RECONNECT_MIN_DELAY;
+            const queued = queuedSocketKeys;
+            queuedSocketKeys = [];
+            queued.forEach((key) => keypressSocket.send(key));
+        };
+        keypressSocket.onmessage = (event) => {
+            handleKeypressResult(JSON.parse(event.data));
+        };
+        keypressSocket.onclose = (event) => {
+            keypressSocket = null;
+            const queued = queuedSocketKeys;
+            queuedSocketKeys = [];
+            queued.forEach(postKey);
+            if (event.code === 1008) {
+                // the server rejected this session; reconnecting would not help
+                console.log('Keypress websocket rejected; using POST /keypress');
+                return;
+            }
+            console.log(`Keypress websocket closed; using POST /keypress and reconnecting in ${reconnectDelay} ms`);
+            setTimeout(openKeypressSocket, reconnectDelay);
+            reconnectDelay = Math.min(reconnectDelay * 2, RECONNECT_MAX_DELAY);
+        };
+    }
+
+    function sendKey(key) {
+        // once POSTs are in flight, later keys follow them to keep the order
+        if (keypressSocket && postsInFlight === 0) {
+            if (keypressSocket.readyState === WebSocket.OPEN) {
+                keypressSocket.send(key);
+                return;
+            }
+            if (keypressSocket.readyState === WebSocket.CONNECTING) {
+                queuedSocketKeys.push(key);
+                return;
+            }
+        }
+        postKey(key);
+    }
+
+    function postKey(key) {
+        postsInFlight += 1;
+        postQueue = postQueue
+            .then(() => postKeypress(key))
+            .finally(() => {
+                postsInFlight -= 1;
+            });
+    }
+
+    async function postKeypress(keyToSend) {
+        try {
+            const response = await fetch('/keypress', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-Session-Id': userSessionId,
+                },
+                body: JSON.stringify({ key: keyToSend, uuid: userSessionId }),
+            });
+
+            if (!response.ok) {
+                console.error('Failed to send keypress event to server:', response.statusText);
+                return;
+            }
+
+            handleKeypressResult(await response.json());
+        } catch (error) {
+            console.error('Error sending keypress event:', error);
+        }
+    }
+
+    function handleKeypressResult(result) {
+        console.log('Server response:', result);
+
+        if (result.spell_successful) {
+            if (doorStatusElement) {
+                doorStatusElement.classList.add('is-fading-out');
+            }
+            setTimeout(() => {
+                const protectedButton = document.getElementById('protected-link');
+                if (protectedButton) {
+                    protectedButton.style.display = 'block';
+                    protectedButton.onclick = function() {
+                        window.location.href = `/mines?session_id=${userSessionId}`;
+                    };
+                }
+            }, 500);
+            // Hide error message if spell is successful
+            const errorElement = document.getElementById('error-message');
+            if (errorElement) {
+                errorElement.style.display = 'none';
+            }
+        } else if (result.message && result.message.includes('already cast the spell')) {
+            // Display IP blocking error message
+            const errorElement = document.getElementById('error-message');
+            if (errorElement) {
+                errorElement.textContent = result.message;
+                errorElement.style.display = 'block';
+            }
+        }
+    }
+
+    openKeypressSocket();
+
+    function processAndSendKey(keyToSend) {
         if (!keyToSend || keyToSend === "Unidentified") {
             return;
         }
@@ -64,50 +193,7 @@ document.addEventListener('DOMContentLoaded', () => {
             }, 3000); 
         }, 500);
 
-        try {
-            const response = await fetch('/keypress', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ key: keyToSend, uuid: userSessionId }),
-            });
-
-            if (!response.ok) {
-                console.error('Failed to send keypress event to server:', response.statusText);
-                return;
-            }
-
-            const result = await response.json();
-            console.log('Server response:', result);
-
-            if (result.spell_successful) {
-                if (doorStatusElement) {
-                    doorStatusElement.classList.add('is-fading-out');
-                }
-                setTimeout(() => {
-                    const protectedButton = document.getElementById('protected-link');
-                    if (protectedButton) {
-                        protectedButton.style.display = 'block';
-                        protectedButton.onclick = function() {
-                            window.location.href = `/mines?session_id=${userSessionId}`;
-                        };
-                    }
-                }, 500);
-                // Hide error message if spell is successful
-                const errorElement = document.getElementById('error-message');
-                if (errorElement) {
-                    errorElement.style.display = 'none';
-                }
-            } else if (result.message && result.message.includes('already cast the spell')) {
-                // Display IP blocking error message
-                const errorElement = document.getElementById('error-message');
-                if (errorElement) {
-                    errorElement.textContent = result.message;
-                    errorElement.style.display = 'block';
-                }
-            }
-        } catch (error) {
-            console.error('Error sending keypress event:', error);
-        }
+        sendKey(keyToSend);
     }
 
     if (isLikelyMobile) {
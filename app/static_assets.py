@@ -0,0 +1,162 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, NamedTuple
+
+from fastapi.staticfiles import StaticFiles
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".txt", ".svg", ".ttf", ".otf", ".ico", ".json", ".map"}
+MIN_COMPRESS_SIZE = 256
+
+_CSS_URL = re.compile(r"""url\((['"]?)/static/([^'")?#]+)\1\)""")
+
+
+class StaticAsset(NamedTuple):
+    path: str
+    hashed_path: str
+    media_type: str
+    etag: str
+    variants: Dict[str, bytes]
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token and q > 0:
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+class HashedStaticFiles(StaticFiles):
+    """
+    `StaticFiles` that serves every asset from memory under a
+    content-hashed name, with gzip (and brotli, when the `brotli` package
+    is installed) variants built once at startup.
+
+    `url("css/style.css")` returns the hashed URL, e.g.
+    `/static/css/style.1a2b3c4d5e.css`, which is served with an immutable
+    Cache-Control; the original name still works but must be revalidated.
+    `/static/...` references inside CSS files are rewritten to hashed
+    URLs before the CSS itself is hashed. The variant is chosen from
+    Accept-Encoding. Paths not found at startup fall back to disk.
+    """
+
+    def __init__(self, directory: str, url_prefix: str = "/static", **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.url_prefix = url_prefix
+        self.assets: Dict[str, StaticAsset] = {}
+        self._by_hashed_path: Dict[str, StaticAsset] = {}
+        self._build(directory)
+
+    def _build(self, directory: str) -> None:
+        paths = []
+        for root, _, files in os.walk(directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                paths.append(os.path.relpath(full_path, directory).replace(os.sep, "/"))
+        # CSS last, so its url() references can point at hashed names
+        for path in sorted(paths, key=lambda path: (path.endswith(".css"), path)):
+            with open(os.path.join(directory, path), "rb") as f:
+                content = f.read()
+            if path.endswith(".css"):
+                content = self._rewrite_css(content)
+            self._add(path, content)
+
+    def _rewrite_css(self, content: bytes) -> bytes:
+        def replace(match):
+            quote, path = match.group(1), match.group(2)
+            return f"url({quote}{self.url(path)}{quote})"
+
+        return _CSS_URL.sub(replace, content.decode()).encode()
+
+    def _add(self, path: str, content: bytes) -> None:
+        digest = hashlib.blake2b(content, digest_size=5).hexdigest()
+        stem, suffix = os.path.splitext(path)
+        variants = {"identity": content}
+        if suffix.lower() in COMPRESSIBLE_SUFFIXES and len(content) >= MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+            if len(compressed) < len(content):
+                variants["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(content, quality=11)
+                if len(compressed) < len(content):
+                    variants["br"] = compressed
+        asset = StaticAsset(
+            path=path,
+            hashed_path=f"{stem}.{digest}{suffix}",
+            media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+            etag=digest,
+            variants=variants,
+        )
+        self.assets[path] = asset
+        self._by_hashed_path[asset.hashed_path] = asset
+
+    def url(self, path: str) -> str:
+        """
+        Hashed URL for `path` (relative to the static directory); unknown
+        paths are returned unhashed.
+        """
+        path = path.lstrip("/")
+        asset = self.assets.get(path)
+        return f"{self.url_prefix}/{asset.hashed_path if asset else path}"
+
+    async def get_response(self, path: str, scope) -> Response:
+        path = path.replace(os.sep, "/")
+        asset = self._by_hashed_path.get(path)
+        cache_control = IMMUTABLE_CACHE_CONTROL
+        if asset is None:
+            asset = self.assets.get(path)
+            cache_control = REVALIDATE_CACHE_CONTROL
+        if asset is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+        return self.asset_response(asset, cache_control, scope)
+
+    @staticmethod
+    def asset_response(asset: StaticAsset, cache_control: str, scope) -> Response:
+        headers = {}
+        for name, value in scope["headers"]:
+            if name in (b"accept-encoding", b"if-none-match"):
+                headers[name.decode()] = value.decode("latin-1")
+        accepted = _accepted_encodings(headers.get("accept-encoding", ""))
+        encoding = next(
+            (name for name in ("br", "gzip") if name in asset.variants and name in accepted),
+            "identity",
+        )
+        body = asset.variants[encoding]
+        etag = f'"{asset.etag}"' if encoding == "identity" else f'"{asset.etag}-{encoding}"'
+        response_headers = {
+            "Cache-Control": cache_control,
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+            "Content-Length": str(len(body)),
+        }
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and etag in [
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        ]:
+            del response_headers["Content-Length"]
+            return Response(status_code=304, headers=response_headers)
+        if scope["method"] == "HEAD":
+            body = b""
+        return Response(content=body, media_type=asset.media_type, headers=response_headers)
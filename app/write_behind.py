@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from sqlalchemy import insert, select, update
+
+from database import SuccessfulSpellIP, UserAccess
+
+logger = logging.getLogger(__name__)
+
+_NOT_PENDING = object()
+
+
+def _chunks(items: List[dict], size: int):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class SpellWriteBehind:
+    """
+    Bounded in-memory queue for spell-success writes, flushed in batches.
+
+    `AccessStore` and `SpellIPStore` hand their writes to this queue
+    instead of committing them one by one. A background task flushes the
+    queue every `flush_interval` seconds, or sooner once `batch_size`
+    writes are waiting, using multi-row INSERT/UPDATE statements in one
+    transaction. Until a write is committed it stays visible through
+    `pending_access` / `pending_spell_ip`, so the queue is authoritative
+    for reads. When `max_pending` writes are queued, `enqueue_*` returns
+    False and the store falls back to a direct write.
+    """
+
+    def __init__(self, max_pending: int = 10_000, batch_size: int = 500, flush_interval: float = 0.5):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._access: Dict[str, bool] = {}
+        self._spell_ips: Dict[str, dict] = {}
+        self._inflight_access: Dict[str, bool] = {}
+        self._inflight_spell_ips: Dict[str, dict] = {}
+        self._flush_lock = threading.Lock()
+        self._wakeup: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self.flushed_rows = 0
+        self.flushes = 0
+
+    def __len__(self) -> int:
+        return len(self._access) + len(self._spell_ips)
+
+    def _enqueue(self, pending: Dict, key: str, value) -> bool:
+        with self._lock:
+            if key not in pending and len(self) >= self.max_pending:
+                return False
+            pending[key] = value
+            queued = len(self)
+        if queued >= self.batch_size:
+            self._signal_flush()
+        return True
+
+    def enqueue_access(self, uuid: str, granted: bool) -> bool:
+        return self._enqueue(self._access, uuid, granted)
+
+    def enqueue_spell_ip(self, ip: str, value: dict) -> bool:
+        return self._enqueue(
+            self._spell_ips,
+            ip,
+            {"user_uuid": value.get("user_uuid"), "cast_time": value.get("cast_time")},
+        )
+
+    def pending_access(self, uuid: str, default=_NOT_PENDING):
+        with self._lock:
+            value = self._access.get(uuid, _NOT_PENDING)
+            if value is _NOT_PENDING:
+                value = self._inflight_access.get(uuid, default)
+        return value
+
+    def pending_spell_ip(self, ip: str, default=_NOT_PENDING):
+        with self._lock:
+            value = self._spell_ips.get(ip, _NOT_PENDING)
+            if value is _NOT_PENDING:
+                value = self._inflight_spell_ips.get(ip, default)
+        return value
+
+    def _signal_flush(self) -> None:
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def flush(self, session) -> int:
+        """
+        Writes every queued row in one transaction; returns the row count.
+
+        On failure the rows go back on the queue unless a newer write for
+        the same key arrived meanwhile.
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._inflight_access, self._access = self._access, {}
+                self._inflight_spell_ips, self._spell_ips = self._spell_ips, {}
+                access = self._inflight_access
+                spell_ips = self._inflight_spell_ips
+            if not access and not spell_ips:
+                return 0
+            try:
+                self._write_rows(
+                    session,
+                    SuccessfulSpellIP,
+                    SuccessfulSpellIP.ip,
+                    "ip",
+                    [{"ip": ip, **value} for ip, value in spell_ips.items()],
+                )
+                granted_at = datetime.utcnow()
+                self._write_rows(
+                    session,
+                    UserAccess,
+                    UserAccess.uuid,
+                    "uuid",
+                    [
+                        {"uuid": uuid, "granted": granted, "created_at": granted_at}
+                        for uuid, granted in access.items()
+                    ],
+                )
+                session.commit()
+            except Exception:
+                session.rollback()
+                with self._lock:
+                    for uuid, granted in access.items():
+                        self._access.setdefault(uuid, granted)
+                    for ip, value in spell_ips.items():
+                        self._spell_ips.setdefault(ip, value)
+                    self._inflight_access, self._inflight_spell_ips = {}, {}
+                raise
+            with self._lock:
+                self._inflight_access, self._inflight_spell_ips = {}, {}
+            flushed = len(access) + len(spell_ips)
+            self.flushed_rows += flushed
+            self.flushes += 1
+            return flushed
+
+    def _write_rows(self, session, model, key_column, key_name: str, rows: List[dict]) -> None:
+        for chunk in _chunks(rows, self.batch_size):
+            keys = [row[key_name] for row in chunk]
+            existing = set(
+                session.execute(select(key_column).where(key_column.in_(keys))).scalars()
+            )
+            inserts = [row for row in chunk if row[key_name] not in existing]
+            updates = [row for row in chunk if row[key_name] in existing]
+            if inserts:
+                session.execute(insert(model), inserts)
+            if updates:
+                session.execute(update(model), updates)
+
+    def _flush_with(self, session_factory: Callable) -> int:
+        session = session_factory()
+        try:
+            return self.flush(session)
+        finally:
+            session.close()
+
+    async def _run(self, session_factory: Callable) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                flushed = await asyncio.to_thread(self._flush_with, session_factory)
+            except Exception:
+                logger.exception("Write-behind flush failed; rows re-queued")
+                continue
+            if flushed:
+                logger.debug("Write-behind flushed %d rows", flushed)
+
+    def start(self, session_factory: Callable) -> None:
+        """
+        Starts the background flush task on the running event loop.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(session_factory))
+
+    async def stop(self, session_factory: Callable) -> int:
+        """
+        Stops the background task and flushes everything still queued.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        self._wakeup = None
+        return await asyncio.to_thread(self._flush_with, session_factory)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+        }
@@ -8,7 +8,7 @@ load_env() {
   if [ -f .env ]; then
     . ./.env
   else
-    echo "WARNING: could not find .env file. Running with all default args"
+    echo "WARNING: could not find .env file. Running with all default args" >&2
   fi
 }
 
@@ -184,6 +184,36 @@ erase_ip() {
   python app/db_utils.py erase_ip "$1"
 }
 
+export_rows() {
+  # stream rows to CSV or JSON lines, e.g. export_rows --table user_access --format jsonl -o access.jsonl
+  load_env
+  if [[ "$(which python)" == "$PWD/.venv/bin/python" ]]; then
+      echo "Project virtualenv '.venv' appears to be active." >&2
+  else
+      echo "Project virtualenv '.venv' does not appear to be active." >&2
+      echo "Attempting to source it." >&2
+      source .venv/bin/activate
+  fi
+  python app/db_utils.py export "$@"
+}
+
+erase_rows() {
+  # erase all rows matching --ip/--ip-file/--cidr/--uuid/--since/--until in one DELETE
+  load_env
+  if [[ "$(which python)" == "$PWD/.venv/bin/python" ]]; then
+      echo "Project virtualenv '.venv' appears to be active." >&2
+  else
+      echo "Project virtualenv '.venv' does not appear to be active." >&2
+      echo "Attempting to source it." >&2
+      source .venv/bin/activate
+  fi
+  if [ -z "$1" ]; then
+    echo "Usage: ./devscripts.sh erase_rows [--table TABLE] [--dry-run] --ip/--cidr/--uuid/--since/--until ..." >&2
+    exit 1
+  fi
+  python app/db_utils.py erase "$@"
+}
+
 devscripts_help() {
   # script cli help
 
@@ -201,6 +231,8 @@ COMMANDS
   init_certbot            get certs via certbot for API_DOMAIN
   list_ips                list all IPs in the successful_spell_ips table
   erase_ip <ip_address>   erase an IP from the successful_spell_ips table
+  export_rows [filters]   stream a table to CSV or JSON lines (--format, -o)
+  erase_rows [filters]    erase rows by IP list, CIDR, UUID or time range (--dry-run)
   redeploy                (deprecated) build and run api container
   
 "
@@ -220,7 +252,7 @@ case $1 in help)
   ;;
 esac
 case $1 in
-start|redeploy|run_postgres|conn_sql|make_nginx|init_certbot|list_ips|erase_ip)
+start|redeploy|run_postgres|conn_sql|make_nginx|init_certbot|list_ips|erase_ip|export_rows|erase_rows)
   func=$1
   shift
   "$func" "$@"
@@ -0,0 +1,257 @@
+"""
+In-process ASGI load harness for the keypress and mines endpoints.
+
+Drives `app` from `app/main.py` through `httpx.ASGITransport` (no sockets),
+so the numbers measure the application, its stores and the database only.
+
+    python -m tests.benchmarks.asgi_load --concurrency 32 --uuids 500
+    python -m tests.benchmarks.asgi_load --database-url postgresql://... \\
+        --baseline tests/benchmarks/baselines/postgres.json
+
+Exits with status 1 when a route regresses past `--threshold` against the
+baseline; `--update-baseline` stores the current run instead, and is required
+when the baseline does not exist yet.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "app"))
+
+from tests.benchmarks.baseline import check_baseline  # noqa: E402
+
+PATTERNS = ("spell", "random", "mixed")
+ROUTES = ("/keypress", "/mines")
+NOISE_KEYS = ["a", "s", "d", "f", "ArrowUp", "ArrowDown", "Shift", "Enter"]
+
+
+@dataclass
+class LoadConfig:
+    concurrency: int = 16
+    uuids: int = 200
+    pattern: str = "mixed"
+    spell: List[str] = field(default_factory=lambda: ["ArrowUp", "ArrowDown", "b", "a", "Enter"])
+    noise_keys: int = 5
+    spell_ratio: float = 0.5
+    database_url: str | None = None
+    db_async: bool = False
+    seed: int = 1234
+    run_id: int = 0
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `samples` (which need not be sorted)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def build_sessions(config: LoadConfig) -> List[dict]:
+    """
+    Builds one keystroke script per UUID.
+
+    Spell sessions type noise followed by the spell from their own IP, so
+    every one of them is granted access; random sessions type noise only.
+    Each session then requests /mines. `run_id` keeps UUIDs and IPs
+    unique across runs against a database that is not reset in between.
+    """
+    if config.pattern not in PATTERNS:
+        raise ValueError(f"Unknown pattern '{config.pattern}'; expected one of {PATTERNS}")
+    rng = random.Random(config.seed)
+    sessions = []
+    for index in range(config.uuids):
+        if config.pattern == "mixed":
+            casts = rng.random() < config.spell_ratio
+        else:
+            casts = config.pattern == "spell"
+        keys = [rng.choice(NOISE_KEYS) for _ in range(config.noise_keys)]
+        if casts:
+            keys.extend(config.spell)
+        sessions.append(
+            {
+                "uuid": f"bench-{config.run_id:x}-{index}",
+                "ip": f"fd00::{config.run_id >> 16 & 0xFFFF:x}:{config.run_id & 0xFFFF:x}:{index:x}",
+                "keys": keys,
+                "casts": casts,
+            }
+        )
+    return sessions
+
+
+def _configure_app(config: LoadConfig, db_path: str):
+    import database
+    import main
+    from key_buffer_manager import KeyBufferManager
+    from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+    os.environ["DATABASE_URL"] = config.database_url or f"sqlite:///{db_path}"
+    database.reset_engine()
+    main.DB_ASYNC = config.db_async
+    main._db_initialized = False
+    main._spell_ip_filter_loaded = False
+    main.access_cache.clear()
+    manager = KeyBufferManager(parsed_secret_spell=config.spell)
+    main.app.dependency_overrides[main.get_key_buffer_manager] = lambda: manager
+    return main, ProxyHeadersMiddleware(main.app, trusted_hosts="*")
+
+
+async def _run_session(client, session: dict, latencies: Dict[str, List[float]], errors: List[str]):
+    headers = {"X-Forwarded-For": session["ip"]}
+    for key in session["keys"]:
+        start = time.perf_counter()
+        response = await client.post("/keypress", json={"key": key, "uuid": session["uuid"]}, headers=headers)
+        latencies["/keypress"].append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors.append(f"/keypress {response.status_code}")
+
+    start = time.perf_counter()
+    response = await client.get(f"/mines?session_id={session['uuid']}", headers=headers)
+    latencies["/mines"].append(time.perf_counter() - start)
+    if response.status_code != (200 if session["casts"] else 403):
+        errors.append(f"/mines {response.status_code} for casts={session['casts']}")
+
+
+async def run_load(config: LoadConfig, db_path: str = "bench.sqlite") -> dict:
+    """
+    Runs every session with `config.concurrency` workers and returns the report.
+    """
+    main, asgi_app = _configure_app(config, db_path)
+    sessions = build_sessions(config)
+    queue: asyncio.Queue = asyncio.Queue()
+    for session in sessions:
+        queue.put_nowait(session)
+    latencies: Dict[str, List[float]] = {route: [] for route in ROUTES}
+    errors: List[str] = []
+
+    transport = httpx.ASGITransport(app=asgi_app)
+    try:
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+                async def worker():
+                    while not queue.empty():
+                        await _run_session(client, queue.get_nowait(), latencies, errors)
+
+                start = time.perf_counter()
+                await asyncio.gather(*(worker() for _ in range(config.concurrency)))
+                elapsed = time.perf_counter() - start
+    finally:
+        main.app.dependency_overrides.clear()
+
+    routes = {}
+    for route, samples in latencies.items():
+        routes[route] = {
+            "requests": len(samples),
+            "rps": len(samples) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+        }
+    total = sum(len(samples) for samples in latencies.values())
+    config_report = asdict(config)
+    config_report["database_url"] = os.environ["DATABASE_URL"].split("@")[-1]
+    return {
+        "config": config_report,
+        "elapsed_s": elapsed,
+        "rps": total / elapsed if elapsed else 0.0,
+        "errors": errors,
+        "routes": routes,
+    }
+
+
+def compare_to_baseline(report: dict, baseline: dict, threshold: float = 0.3) -> List[str]:
+    """
+    Lists routes whose throughput dropped, or whose p95/p99 rose, by more
+    than `threshold` (a fraction) relative to `baseline`.
+    """
+    regressions = []
+    for route, current in report["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous:
+            continue
+        if current["rps"] < previous["rps"] * (1 - threshold):
+            regressions.append(f"{route} rps {current['rps']:.1f} < baseline {previous['rps']:.1f}")
+        for metric in ("p95_ms", "p99_ms"):
+            if current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(
+                    f"{route} {metric} {current[metric]:.2f} > baseline {previous[metric]:.2f}"
+                )
+    return regressions
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=LoadConfig.concurrency)
+    parser.add_argument("--uuids", type=int, default=LoadConfig.uuids)
+    parser.add_argument("--pattern", choices=PATTERNS, default=LoadConfig.pattern)
+    parser.add_argument("--spell", help="comma-separated spell (default: a 5-key spell)")
+    parser.add_argument("--noise-keys", type=int, default=LoadConfig.noise_keys)
+    parser.add_argument("--spell-ratio", type=float, default=LoadConfig.spell_ratio)
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--db-async", action="store_true")
+    parser.add_argument("--seed", type=int, default=LoadConfig.seed)
+    parser.add_argument("--sqlite-path", default="bench.sqlite")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="JSON baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--log-level", default="WARNING", help="app log level during the run")
+    args = parser.parse_args(argv)
+
+    config = LoadConfig(
+        concurrency=args.concurrency,
+        uuids=args.uuids,
+        pattern=args.pattern,
+        noise_keys=args.noise_keys,
+        spell_ratio=args.spell_ratio,
+        database_url=args.database_url,
+        db_async=args.db_async,
+        seed=args.seed,
+        run_id=time.time_ns() >> 20,
+    )
+    if args.spell:
+        config.spell = [key.strip() for key in args.spell.split(",") if key.strip()]
+
+    if not args.database_url and os.path.exists(args.sqlite_path):
+        os.remove(args.sqlite_path)
+    logging.getLogger().setLevel(args.log_level)
+    report = asyncio.run(run_load(config, db_path=args.sqlite_path))
+    print(json.dumps(report["routes"], indent=2))
+    print(f"total rps: {report['rps']:.1f}, errors: {len(report['errors'])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["errors"]:
+        print(f"errors: {report['errors'][:10]}", file=sys.stderr)
+        return 1
+    if args.baseline:
+        try:
+            regressions = check_baseline(
+                report, args.baseline, args.threshold, compare_to_baseline, args.update_baseline
+            )
+        except FileNotFoundError as exc:
+            print(f"ERROR: {exc}; record one with --update-baseline", file=sys.stderr)
+            return 1
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+import json
+import os
+from typing import Callable, List
+
+
+def check_baseline(
+    report: dict,
+    baseline_path: str,
+    threshold: float,
+    compare: Callable[[dict, dict, float], List[str]],
+    update: bool = False,
+) -> List[str]:
+    """
+    Compares `report` with the JSON baseline at `baseline_path` using
+    `compare`, or writes the report there instead when `update` is set.
+
+    A missing baseline raises FileNotFoundError rather than being
+    recorded, so a first run (or a mistyped path) never passes by
+    comparing against itself.
+    """
+    if update:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+        return []
+    if not os.path.exists(baseline_path):
+        raise FileNotFoundError(f"no baseline at {baseline_path}")
+    with open(baseline_path) as f:
+        return compare(report, json.load(f), threshold)
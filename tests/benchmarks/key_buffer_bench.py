@@ -0,0 +1,381 @@
+"""
+Micro-benchmarks for the `KeyBufferManager` hot paths.
+
+Measures ns/op and allocations per call of `add_key` and `check_spell`
+for each matcher across spell lengths, active-UUID counts and hit/miss
+mixes, plus resident memory per UUID, and the throughput of
+`ShardedKeyBufferManager` driven from 1 to N threads.
+
+    python -m tests.benchmarks.key_buffer_bench --output kbm.json
+    python -m tests.benchmarks.key_buffer_bench --uuids 1,1000,1000000 \\
+        --baseline tests/benchmarks/baselines/key_buffer.json
+    python -m tests.benchmarks.key_buffer_bench --threads 1,2,4,8
+
+Thread scaling only shows a speedup on a free-threaded build (3.13t);
+with the GIL it measures the cost of the striped locks.
+
+Exits with status 1 when a case is slower than the baseline by more than
+`--threshold`; `--update-baseline` stores the current run instead, and is
+required when the baseline does not exist yet.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import threading
+import tracemalloc
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "app"))
+
+from key_buffer_manager import MATCHERS, KeyBufferManager, ShardedKeyBufferManager  # noqa: E402
+from tests.benchmarks.baseline import check_baseline  # noqa: E402
+
+SPELL_LENGTHS = (1, 11, 64)
+UUID_COUNTS = (1, 1_000, 100_000)
+MIXES = ("miss", "mixed", "hit")
+THREAD_COUNTS = (1, 2, 4, 8)
+SPELL_KEYS = ["ArrowUp", "ArrowDown", "ArrowLeft", "ArrowRight", "b", "a", "Enter"]
+NOISE_KEYS = ["q", "w", "e", "r", "t", "y"]
+
+
+def make_spell(length: int) -> List[str]:
+    return [SPELL_KEYS[index % len(SPELL_KEYS)] for index in range(length)]
+
+
+def key_stream(spell: List[str], uuids: int, mix: str, ops: int) -> List[Tuple[str, str]]:
+    """
+    Builds `ops` (uuid, key) pairs visiting the UUIDs round-robin.
+
+    With the ``hit`` mix every UUID types the spell over and over, so each
+    UUID completes it once per `len(spell)` keys; ``miss`` types keys that
+    never occur in the spell; ``mixed`` splits the UUIDs between the two.
+    """
+    if mix not in MIXES:
+        raise ValueError(f"Unknown mix '{mix}'; expected one of {MIXES}")
+    stream = []
+    for index in range(ops):
+        user = index % uuids
+        position = index // uuids
+        types_spell = mix == "hit" or (mix == "mixed" and user % 2 == 0)
+        if types_spell:
+            key = spell[position % len(spell)]
+        else:
+            key = NOISE_KEYS[position % len(NOISE_KEYS)]
+        stream.append((f"uuid-{user}", key))
+    return stream
+
+
+def _populate(manager: KeyBufferManager, uuids: int, keys_per_uuid: int = 1) -> None:
+    for position in range(keys_per_uuid):
+        for user in range(uuids):
+            manager.add_key(f"uuid-{user}", NOISE_KEYS[position % len(NOISE_KEYS)])
+
+
+def _time_ns(func, args: List[tuple], repeat: int = 3) -> float:
+    """
+    Best-of-`repeat` mean ns per call, minus the bare loop overhead.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for call_args in args:
+            func(*call_args)
+        elapsed = time.perf_counter_ns() - start
+        start = time.perf_counter_ns()
+        for call_args in args:
+            pass
+        elapsed -= time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return max(0, best) / len(args)
+
+
+def _allocations(func, args: List[tuple]) -> Dict[str, float]:
+    """
+    Mean transient (peak) and retained bytes allocated per call.
+    """
+    peak_total = retained_total = 0
+    tracemalloc.start()
+    try:
+        for call_args in args:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            func(*call_args)
+            current, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - before
+            retained_total += current - before
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_peak_bytes_per_op": peak_total / len(args),
+        "retained_bytes_per_op": retained_total / len(args),
+    }
+
+
+def bench_case(
+    matcher: str,
+    spell_length: int,
+    uuids: int,
+    mix: str,
+    ops: int,
+    alloc_samples: int,
+    repeat: int = 3,
+) -> List[dict]:
+    """
+    Times `add_key` and `check_spell` for one configuration.
+    """
+    spell = make_spell(spell_length)
+    manager = KeyBufferManager(parsed_secret_spell=spell, matcher=matcher)
+    _populate(manager, uuids)
+    stream = key_stream(spell, uuids, mix, ops)
+    checks = [(user,) for user, _ in stream]
+
+    results = []
+    for op, func, args in (
+        ("add_key", manager.add_key, stream),
+        ("check_spell", manager.check_spell, checks),
+    ):
+        ns_per_op = _time_ns(func, args, repeat)
+        results.append(
+            {
+                "matcher": matcher,
+                "spell_length": spell_length,
+                "uuids": uuids,
+                "mix": mix,
+                "op": op,
+                "ops": len(args),
+                "ns_per_op": ns_per_op,
+                **_allocations(func, args[:alloc_samples]),
+            }
+        )
+    return results
+
+
+def memory_per_uuid(matcher: str, spell_length: int, uuids: int) -> dict:
+    """
+    Bytes held per UUID once every UUID has a full-length buffer.
+    """
+    spell = make_spell(spell_length)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        manager = KeyBufferManager(parsed_secret_spell=spell, matcher=matcher)
+        _populate(manager, uuids, keys_per_uuid=spell_length)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return {
+        "matcher": matcher,
+        "spell_length": spell_length,
+        "uuids": uuids,
+        "bytes_per_uuid": (after - before) / uuids,
+    }
+
+
+def _drive_threads(manager, streams: List[List[Tuple[str, str]]]) -> float:
+    """
+    Runs one thread per stream through `add_key_and_check`, all released
+    together; returns the wall time in seconds.
+    """
+    barrier = threading.Barrier(len(streams) + 1)
+
+    def worker(stream):
+        add_key_and_check = manager.add_key_and_check
+        barrier.wait()
+        for user, key in stream:
+            add_key_and_check(user, key)
+
+    threads = [threading.Thread(target=worker, args=(stream,)) for stream in streams]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def thread_scaling(
+    matcher: str,
+    spell_length: int = 11,
+    thread_counts=THREAD_COUNTS,
+    uuids_per_thread: int = 1_000,
+    ops_per_thread: int = 50_000,
+    shards: int = 16,
+    repeat: int = 3,
+) -> List[dict]:
+    """
+    Throughput of a `ShardedKeyBufferManager` with 1..N threads, each
+    typing for its own UUIDs, and the speedup over one thread. The first
+    entry is an unlocked `KeyBufferManager` on one thread, for the cost of
+    locking.
+    """
+    spell = make_spell(spell_length)
+    stream = key_stream(spell, uuids_per_thread, "mixed", ops_per_thread)
+    results = []
+    cases = [("unsharded", 1)] + [("sharded", threads) for threads in thread_counts]
+    single_thread = None
+    for variant, threads in cases:
+        streams = [
+            [(f"t{index}-{user}", key) for user, key in stream] for index in range(threads)
+        ]
+        best = None
+        for _ in range(repeat):
+            if variant == "sharded":
+                manager = ShardedKeyBufferManager(spell, shards=shards, matcher=matcher)
+            else:
+                manager = KeyBufferManager(spell, matcher=matcher)
+            elapsed = _drive_threads(manager, streams)
+            best = elapsed if best is None else min(best, elapsed)
+        ops_per_sec = threads * len(stream) / best
+        if variant == "sharded" and threads == 1:
+            single_thread = ops_per_sec
+        results.append(
+            {
+                "matcher": matcher,
+                "variant": variant,
+                "threads": threads,
+                "shards": shards if variant == "sharded" else 0,
+                "ops_per_sec": ops_per_sec,
+                "speedup": ops_per_sec / single_thread if single_thread else None,
+            }
+        )
+    return results
+
+
+def run_suite(
+    matchers=MATCHERS,
+    spell_lengths=SPELL_LENGTHS,
+    uuid_counts=UUID_COUNTS,
+    mixes=MIXES,
+    ops: int = 50_000,
+    alloc_samples: int = 1_000,
+    memory_uuids: int = 2_000,
+    repeat: int = 3,
+    thread_counts=(),
+) -> dict:
+    results = []
+    memory = []
+    scaling = []
+    for matcher in matchers:
+        for spell_length in spell_lengths:
+            memory.append(memory_per_uuid(matcher, spell_length, memory_uuids))
+            for uuids in uuid_counts:
+                for mix in mixes:
+                    results.extend(
+                        bench_case(
+                            matcher,
+                            spell_length,
+                            uuids,
+                            mix,
+                            max(ops, uuids),
+                            alloc_samples,
+                            repeat,
+                        )
+                    )
+        if thread_counts:
+            scaling.extend(thread_scaling(matcher, thread_counts=thread_counts, repeat=repeat))
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "gil_enabled": getattr(sys, "_is_gil_enabled", lambda: True)(),
+        "cpus": os.cpu_count(),
+        "results": results,
+        "memory": memory,
+        "scaling": scaling,
+    }
+
+
+def _case_key(result: dict) -> tuple:
+    return tuple(result[name] for name in ("matcher", "spell_length", "uuids", "mix", "op"))
+
+
+def compare_to_baseline(report: dict, baseline: dict, threshold: float = 0.3) -> List[str]:
+    """
+    Lists cases whose ns/op rose by more than `threshold` (a fraction) over
+    `baseline`, and matchers whose memory per UUID did.
+    """
+    regressions = []
+    previous = {_case_key(result): result for result in baseline.get("results", [])}
+    for result in report["results"]:
+        old = previous.get(_case_key(result))
+        if old and result["ns_per_op"] > old["ns_per_op"] * (1 + threshold):
+            regressions.append(
+                f"{_case_key(result)} {result['ns_per_op']:.0f} ns/op > baseline {old['ns_per_op']:.0f}"
+            )
+    previous_memory = {
+        (entry["matcher"], entry["spell_length"]): entry for entry in baseline.get("memory", [])
+    }
+    for entry in report["memory"]:
+        old = previous_memory.get((entry["matcher"], entry["spell_length"]))
+        if old and entry["bytes_per_uuid"] > old["bytes_per_uuid"] * (1 + threshold):
+            regressions.append(
+                f"{entry['matcher']} spell_length={entry['spell_length']} "
+                f"{entry['bytes_per_uuid']:.0f} B/uuid > baseline {old['bytes_per_uuid']:.0f}"
+            )
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--matchers", default=",".join(MATCHERS))
+    parser.add_argument("--spell-lengths", type=_int_list, default=list(SPELL_LENGTHS))
+    parser.add_argument("--uuids", type=_int_list, default=list(UUID_COUNTS))
+    parser.add_argument("--mixes", default=",".join(MIXES))
+    parser.add_argument("--ops", type=int, default=50_000)
+    parser.add_argument("--alloc-samples", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--memory-uuids", type=int, default=2_000)
+    parser.add_argument(
+        "--threads", type=_int_list, default=[], help="thread counts for the scaling run"
+    )
+    parser.add_argument("--output", help="write the report as JSON (default: stdout)")
+    parser.add_argument("--baseline", help="JSON baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = run_suite(
+        matchers=args.matchers.split(","),
+        spell_lengths=args.spell_lengths,
+        uuid_counts=args.uuids,
+        mixes=args.mixes.split(","),
+        ops=args.ops,
+        alloc_samples=args.alloc_samples,
+        memory_uuids=args.memory_uuids,
+        repeat=args.repeat,
+        thread_counts=args.threads,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        try:
+            regressions = check_baseline(
+                report, args.baseline, args.threshold, compare_to_baseline, args.update_baseline
+            )
+        except FileNotFoundError as exc:
+            print(f"ERROR: {exc}; record one with --update-baseline", file=sys.stderr)
+            return 1
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
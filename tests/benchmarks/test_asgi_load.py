@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from tests.benchmarks.baseline import check_baseline
+from tests.benchmarks.asgi_load import (
+    LoadConfig,
+    build_sessions,
+    compare_to_baseline,
+    percentile,
+    run_load,
+)
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+THRESHOLD = float(os.getenv("BENCH_THRESHOLD", 0.3))
+UPDATE_BASELINE = bool(int(os.getenv("BENCH_UPDATE_BASELINE", 0)))
+
+
+def assert_no_regressions(report, baseline_path):
+    try:
+        regressions = check_baseline(
+            report, baseline_path, THRESHOLD, compare_to_baseline, UPDATE_BASELINE
+        )
+    except FileNotFoundError as exc:
+        pytest.skip(f"{exc}; record one with BENCH_UPDATE_BASELINE=1")
+    assert regressions == []
+
+
+def _report(rps, p95, p99):
+    return {"routes": {"/keypress": {"rps": rps, "p95_ms": p95, "p99_ms": p99}}}
+
+
+def test_percentile_nearest_rank():
+    """Test percentiles use the nearest-rank definition."""
+    samples = [float(value) for value in range(1, 101)]
+
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 95) == 95.0
+    assert percentile(samples, 99) == 99.0
+    assert percentile([], 99) == 0.0
+
+
+def test_build_sessions_patterns():
+    """Test spell sessions end with the spell and use distinct IPs."""
+    config = LoadConfig(uuids=10, pattern="spell", noise_keys=2, spell=["a", "b"])
+    sessions = build_sessions(config)
+
+    assert all(session["keys"][-2:] == ["a", "b"] for session in sessions)
+    assert len({session["ip"] for session in sessions}) == 10
+    assert not any(build_sessions(LoadConfig(uuids=10, pattern="random"))[i]["casts"] for i in range(10))
+
+
+def test_compare_to_baseline_flags_regressions():
+    """Test throughput drops and tail-latency rises beyond the threshold are reported."""
+    baseline = _report(rps=1000, p95=10, p99=20)
+
+    assert compare_to_baseline(_report(900, 11, 21), baseline, threshold=0.2) == []
+    regressions = compare_to_baseline(_report(700, 13, 30), baseline, threshold=0.2)
+    assert len(regressions) == 3
+
+
+def test_check_baseline_requires_update_to_record(tmp_path):
+    """Test a missing baseline is an error unless the run is asked to record it."""
+    baseline_path = str(tmp_path / "baselines" / "run.json")
+    report = _report(rps=1000, p95=10, p99=20)
+
+    with pytest.raises(FileNotFoundError):
+        check_baseline(report, baseline_path, 0.2, compare_to_baseline)
+    assert not os.path.exists(baseline_path)
+    assert check_baseline(report, baseline_path, 0.2, compare_to_baseline, update=True) == []
+    assert check_baseline(_report(700, 13, 30), baseline_path, 0.2, compare_to_baseline) != []
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("db_async", [False, True], ids=["sync", "async"])
+def test_load_sqlite(tmp_path, db_async):
+    """Load /keypress and /mines against SQLite and compare with the stored baseline."""
+    config = LoadConfig(concurrency=16, uuids=400, db_async=db_async)
+    report = asyncio.run(run_load(config, db_path=str(tmp_path / "bench.sqlite")))
+
+    assert report["errors"] == []
+    name = "sqlite_async.json" if db_async else "sqlite.json"
+    baseline_path = os.path.join(BASELINE_DIR, name)
+    assert_no_regressions(report, baseline_path)
+
+
+@pytest.mark.bench
+@pytest.mark.skipif(
+    not os.getenv("BENCH_POSTGRES_URL"),
+    reason="set BENCH_POSTGRES_URL (e.g. ./devscripts.sh run_postgres) to benchmark Postgres",
+)
+def test_load_postgres():
+    """Load /keypress and /mines against a local Postgres and compare with the stored baseline."""
+    config = LoadConfig(
+        concurrency=16,
+        uuids=400,
+        database_url=os.environ["BENCH_POSTGRES_URL"],
+        run_id=time.time_ns() >> 20,
+    )
+    report = asyncio.run(run_load(config))
+
+    assert report["errors"] == []
+    baseline_path = os.path.join(BASELINE_DIR, "postgres.json")
+    assert_no_regressions(report, baseline_path)
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from tests.benchmarks.baseline import check_baseline
+from tests.benchmarks.key_buffer_bench import (
+    bench_case,
+    compare_to_baseline,
+    key_stream,
+    make_spell,
+    memory_per_uuid,
+    run_suite,
+    thread_scaling,
+)
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+THRESHOLD = float(os.getenv("BENCH_THRESHOLD", 0.3))
+UPDATE_BASELINE = bool(int(os.getenv("BENCH_UPDATE_BASELINE", 0)))
+
+
+def assert_no_regressions(report, baseline_path):
+    try:
+        regressions = check_baseline(
+            report, baseline_path, THRESHOLD, compare_to_baseline, UPDATE_BASELINE
+        )
+    except FileNotFoundError as exc:
+        pytest.skip(f"{exc}; record one with BENCH_UPDATE_BASELINE=1")
+    assert regressions == []
+
+
+def test_key_stream_mixes():
+    """Test hit UUIDs type the spell and miss UUIDs never touch it."""
+    spell = make_spell(3)
+    stream = key_stream(spell, uuids=2, mix="mixed", ops=6)
+
+    assert [key for user, key in stream if user == "uuid-0"] == spell
+    assert not any(key in spell for user, key in stream if user == "uuid-1")
+
+
+def test_bench_case_reports_both_ops():
+    """Test a case reports ns/op and allocation figures for add_key and check_spell."""
+    results = bench_case("buffer", 11, uuids=10, mix="hit", ops=200, alloc_samples=20, repeat=1)
+
+    assert [result["op"] for result in results] == ["add_key", "check_spell"]
+    for result in results:
+        assert result["ns_per_op"] > 0
+        assert result["alloc_peak_bytes_per_op"] >= 0
+    assert memory_per_uuid("automaton", 11, uuids=100)["bytes_per_uuid"] > 0
+
+
+def test_compare_to_baseline_flags_slower_cases():
+    """Test only cases slower than the threshold are reported."""
+    case = {"matcher": "buffer", "spell_length": 11, "uuids": 1, "mix": "hit", "op": "add_key"}
+    baseline = {"results": [{**case, "ns_per_op": 1000}], "memory": []}
+
+    assert compare_to_baseline({"results": [{**case, "ns_per_op": 1200}], "memory": []}, baseline) == []
+    assert len(compare_to_baseline({"results": [{**case, "ns_per_op": 1500}], "memory": []}, baseline)) == 1
+
+
+def test_thread_scaling_reports_each_thread_count():
+    """Test the scaling run reports the unlocked reference and each thread count."""
+    results = thread_scaling(
+        "automaton", thread_counts=(1, 2), uuids_per_thread=10, ops_per_thread=200, repeat=1
+    )
+
+    assert [(result["variant"], result["threads"]) for result in results] == [
+        ("unsharded", 1),
+        ("sharded", 1),
+        ("sharded", 2),
+    ]
+    assert results[1]["speedup"] == 1.0
+    assert all(result["ops_per_sec"] > 0 for result in results)
+
+
+@pytest.mark.bench
+def test_key_buffer_micro_benchmarks():
+    """Run the micro-benchmark matrix and compare with the stored baseline."""
+    report = run_suite(uuid_counts=(1, 10_000), ops=20_000)
+
+    baseline_path = os.path.join(BASELINE_DIR, "key_buffer.json")
+    assert_no_regressions(report, baseline_path)
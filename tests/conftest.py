@@ -11,6 +11,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "..", "app"))
 
 from main import (
     app,
+    access_cache,
+    rate_limiter,
     get_key_buffer_manager,
     get_user_access_state,
     get_successful_spell_ips_state,
@@ -177,12 +179,35 @@ def test_client_with_proxy_spell(simple_spell):
     app.dependency_overrides.clear()
 
 
+@pytest.fixture
+def test_client_with_async_db(simple_spell, tmp_path, monkeypatch):
+    """Create a test client whose stores use the async database layer."""
+    import main
+    import database
+
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path}/async.sqlite")
+    monkeypatch.setattr(main, "DB_ASYNC", True)
+    monkeypatch.setattr(main, "_db_initialized", False)
+    database.reset_engine()
+
+    test_manager_instance = KeyBufferManager(parsed_secret_spell=simple_spell)
+    app.dependency_overrides[get_key_buffer_manager] = lambda: test_manager_instance
+
+    with TestClient(app) as client:
+        yield client
+
+    app.dependency_overrides.clear()
+    database.reset_engine()
+
+
 @pytest.fixture(autouse=True)
 def reset_dependency_overrides():
     """Ensure dependency overrides are cleared between tests."""
     yield
     # Clean up any remaining dependency overrides
     app.dependency_overrides.clear()
+    access_cache.clear()
+    rate_limiter.clear()
 
 
 @pytest.fixture
@@ -15,6 +15,29 @@ class TestRootEndpoint:
         assert "THE DOORS APPEAR LOCKED" in response.text
         assert "protected-link" in response.text
 
+    def test_get_root_is_conditionally_cacheable(self, test_client):
+        """Test the root page carries validators and answers a matching ETag with 304."""
+        response = test_client.get("/")
+
+        assert response.headers["cache-control"].startswith("public")
+        assert "last-modified" in response.headers
+        not_modified = test_client.get("/", headers={"If-None-Match": response.headers["etag"]})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+
+    def test_root_references_hashed_static_assets(self, test_client):
+        """Test the page links content-hashed assets served with immutable caching."""
+        from main import static_files
+
+        script_url = static_files.url("js/script.js")
+        assert script_url != "/static/js/script.js"
+        assert f'src="{script_url}"' in test_client.get("/").text
+
+        response = test_client.get(script_url, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert "immutable" in response.headers["cache-control"]
+
 
 class TestKeypressEndpoint:
     """Tests for the keypress endpoint."""
@@ -232,6 +255,25 @@ class TestMinesEndpoint:
         assert response.status_code == 200
         assert response.headers["content-type"] == "text/html; charset=utf-8"
         assert "Welcome to the Mines" in response.text
+        assert response.headers["cache-control"] == "private, no-cache"
+
+    def test_mines_revalidation_still_checks_access(
+        self, test_client_with_custom_spell, test_uuid
+    ):
+        """Test a cached /mines ETag is only honoured after the access check."""
+        for key in ["x", "y", "z"]:
+            test_client_with_custom_spell.post("/keypress", json={"key": key, "uuid": test_uuid})
+        etag = test_client_with_custom_spell.get(f"/mines?session_id={test_uuid}").headers["etag"]
+
+        revalidated = test_client_with_custom_spell.get(
+            f"/mines?session_id={test_uuid}", headers={"If-None-Match": etag}
+        )
+        denied = test_client_with_custom_spell.get(
+            "/mines?session_id=someone-else", headers={"If-None-Match": etag}
+        )
+
+        assert revalidated.status_code == 304
+        assert denied.status_code == 403
 
 
 class TestEnvironmentConfiguration:
@@ -289,6 +331,58 @@ class TestEnvironmentConfiguration:
             # Clean up
             app.dependency_overrides.clear()
 
+    def test_server_options_from_env(self, monkeypatch):
+        """Test the runner settings come from API_* variables and fall back when unset."""
+        import main
+
+        monkeypatch.setattr(main, "KEY_BUFFER_BACKEND", "sqlite")
+        monkeypatch.setenv("API_WORKERS", "4")
+        monkeypatch.setenv("API_LOOP", "asyncio")
+        monkeypatch.setenv("API_HTTP", "auto")
+        monkeypatch.setenv("API_ACCESS_LOG", "0")
+
+        options = main.server_options()
+
+        assert options["workers"] == 4
+        assert options["loop"] == "asyncio"
+        assert options["http"] in ("httptools", "h11")
+        assert options["access_log"] is False
+        assert options["timeout_graceful_shutdown"] == 30
+
+        monkeypatch.setenv("API_LOOP", "trio")
+        with pytest.raises(ValueError):
+            main.server_options()
+
+    def test_multiple_workers_require_shared_key_buffers(self, monkeypatch):
+        """Test several workers are refused with per-process in-memory key buffers."""
+        import main
+
+        monkeypatch.setattr(main, "KEY_BUFFER_BACKEND", "memory")
+        monkeypatch.setenv("API_WORKERS", "2")
+
+        with pytest.raises(ValueError, match="KEY_BUFFER_BACKEND"):
+            main.server_options()
+
+    def test_idle_key_buffers_swept_in_background(self, monkeypatch):
+        """Test the lifespan sweeps key buffers periodically while the app runs."""
+        import time
+        import main
+
+        monkeypatch.setattr(main, "ensure_db_initialized", lambda: None)
+        monkeypatch.setattr(main, "KEY_BUFFER_SWEEP_INTERVAL", 0.01)
+        sweeps = []
+        manager = main.KeyBufferManager(parsed_secret_spell=["a"])
+        monkeypatch.setattr(manager, "sweep", lambda: sweeps.append(True))
+        monkeypatch.setattr(main, "_key_buffer_manager_instance", manager)
+
+        with TestClient(main.app):
+            time.sleep(0.2)
+        swept = len(sweeps)
+        time.sleep(0.05)
+
+        assert swept > 1
+        assert len(sweeps) == swept
+
 
 class TestEndToEndFlow:
     """End-to-end integration tests."""
@@ -353,3 +447,364 @@ class Test404NotFound:
         assert "404 - Page Not Found" in response.text
         assert "wrong turn in the dark mines" in response.text
         assert "Go back to the entrance" in response.text
+        assert response.headers["cache-control"].startswith("public")
+
+
+class TestKeypressWebSocket:
+    """Tests for the /ws/keypress streaming endpoint."""
+
+    def test_websocket_single_key(self, test_client_with_spell, test_uuid):
+        """Test that a key sent over the websocket is acknowledged."""
+        with test_client_with_spell.websocket_connect(
+            f"/ws/keypress?uuid={test_uuid}"
+        ) as websocket:
+            websocket.send_text("a")
+            data = websocket.receive_json()
+
+        assert data["message"] == "Key 'a' received"
+        assert data["spell_successful"] is False
+
+    def test_websocket_complete_spell_grants_access(
+        self, test_client_with_spell, test_uuid, simple_spell
+    ):
+        """Test casting the spell over the websocket grants /mines access."""
+        responses = []
+        with test_client_with_spell.websocket_connect(
+            f"/ws/keypress?uuid={test_uuid}"
+        ) as websocket:
+            for key in simple_spell:
+                websocket.send_text(key)
+                responses.append(websocket.receive_json())
+
+        assert all(r["spell_successful"] is False for r in responses[:-1])
+        assert responses[-1]["spell_successful"] is True
+        assert "Spell cast successfully!" in responses[-1]["message"]
+
+        mines_response = test_client_with_spell.get(f"/mines?session_id={test_uuid}")
+        assert mines_response.status_code == 200
+
+    def test_websocket_shares_buffer_with_post(
+        self, test_client_with_spell, test_uuid
+    ):
+        """Test that keys from POST and websocket feed the same buffer."""
+        test_client_with_spell.post("/keypress", json={"key": "a", "uuid": test_uuid})
+        test_client_with_spell.post("/keypress", json={"key": "b", "uuid": test_uuid})
+
+        with test_client_with_spell.websocket_connect(
+            f"/ws/keypress?uuid={test_uuid}"
+        ) as websocket:
+            websocket.send_text("Enter")
+            data = websocket.receive_json()
+
+        assert data["spell_successful"] is True
+
+    def test_websocket_same_ip_already_cast(
+        self, test_client_with_spell, simple_spell
+    ):
+        """Test the one-cast-per-IP rule also applies to the websocket channel."""
+        with test_client_with_spell.websocket_connect(
+            "/ws/keypress?uuid=ws-uuid-1"
+        ) as websocket:
+            for key in simple_spell:
+                websocket.send_text(key)
+                first = websocket.receive_json()
+
+        with test_client_with_spell.websocket_connect(
+            "/ws/keypress?uuid=ws-uuid-2"
+        ) as websocket:
+            for key in simple_spell:
+                websocket.send_text(key)
+                second = websocket.receive_json()
+
+        assert first["spell_successful"] is True
+        assert second["spell_successful"] is False
+        assert "already cast the spell" in second["message"]
+
+    def test_websocket_opens_session_only_to_claim(
+        self, simple_spell, test_uuid, tmp_path, monkeypatch
+    ):
+        """Test an open socket holds no DB session; one is opened per spell claim."""
+        import main
+        import database
+        from key_buffer_manager import KeyBufferManager
+
+        monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path}/ws.sqlite")
+        monkeypatch.setattr(main, "_db_initialized", False)
+        database.reset_engine()
+        manager = KeyBufferManager(parsed_secret_spell=simple_spell)
+        main.app.dependency_overrides[main.get_key_buffer_manager] = lambda: manager
+
+        open_sessions = []
+        opened = []
+        real_get_db_session = main.get_db_session
+
+        async def counting_get_db_session():
+            opened.append(True)
+            open_sessions.append(True)
+            try:
+                async for session in real_get_db_session():
+                    yield session
+            finally:
+                open_sessions.pop()
+
+        monkeypatch.setattr(main, "get_db_session", counting_get_db_session)
+
+        try:
+            with TestClient(main.app).websocket_connect(
+                f"/ws/keypress?uuid={test_uuid}"
+            ) as websocket:
+                for key in simple_spell[:-1]:
+                    websocket.send_text(key)
+                    websocket.receive_json()
+                assert opened == []
+                websocket.send_text(simple_spell[-1])
+                data = websocket.receive_json()
+                assert data["spell_successful"] is True
+                assert len(opened) == 1
+                assert open_sessions == []
+        finally:
+            database.reset_engine()
+
+
+class TestKeypressBatchEndpoint:
+    """Tests for the /keypress/batch endpoint."""
+
+    def test_batch_without_spell(self, test_client_with_spell, test_uuid):
+        """Test a batch that does not complete the spell."""
+        payload = {"uuid": test_uuid, "keys": ["x", "y", "z"]}
+        response = test_client_with_spell.post("/keypress/batch", json=payload)
+
+        assert response.status_code == 200
+        result = response.json()["results"][0]
+        assert result["uuid"] == test_uuid
+        assert result["keys_received"] == 3
+        assert result["spell_index"] is None
+        assert result["spell_successful"] is False
+
+    def test_batch_reports_first_spell_index(
+        self, test_client_with_spell, test_uuid
+    ):
+        """Test the index of the key that completed the spell is reported."""
+        payload = {"uuid": test_uuid, "keys": ["x", "a", "b", "Enter", "q"]}
+        response = test_client_with_spell.post("/keypress/batch", json=payload)
+
+        result = response.json()["results"][0]
+        assert result["spell_index"] == 3
+        assert result["spell_successful"] is True
+        assert "Spell cast successfully!" in result["message"]
+
+        mines_response = test_client_with_spell.get(f"/mines?session_id={test_uuid}")
+        assert mines_response.status_code == 200
+
+    def test_batch_continues_existing_buffer(
+        self, test_client_with_spell, test_uuid
+    ):
+        """Test batched keys continue the buffer built by single keypresses."""
+        test_client_with_spell.post("/keypress", json={"key": "a", "uuid": test_uuid})
+        payload = {"uuid": test_uuid, "keys": ["b", "Enter"]}
+        response = test_client_with_spell.post("/keypress/batch", json=payload)
+
+        result = response.json()["results"][0]
+        assert result["spell_index"] == 1
+        assert result["spell_successful"] is True
+
+    def test_batch_multiple_uuids_cast_once(self, test_client_with_spell):
+        """Test only the first UUID to complete the spell in a batch is granted."""
+        payload = [
+            {"uuid": "batch-uuid-1", "keys": ["a", "b"]},
+            {"uuid": "batch-uuid-2", "keys": ["a", "b", "Enter"]},
+            {"uuid": "batch-uuid-1", "keys": ["Enter"]},
+        ]
+        response = test_client_with_spell.post("/keypress/batch", json=payload)
+
+        results = response.json()["results"]
+        assert [r["uuid"] for r in results] == [
+            "batch-uuid-1",
+            "batch-uuid-2",
+            "batch-uuid-1",
+        ]
+        assert results[0]["spell_index"] is None
+        assert results[1]["spell_successful"] is True
+        assert results[2]["spell_index"] == 0
+        assert results[2]["spell_successful"] is False
+        assert "already cast the spell" in results[2]["message"]
+
+    def test_batch_empty_keys_rejected(self, test_client_with_spell, test_uuid):
+        """Test a batch without keys fails validation."""
+        payload = {"uuid": test_uuid, "keys": []}
+        response = test_client_with_spell.post("/keypress/batch", json=payload)
+
+        assert response.status_code == 422
+
+    def test_batch_total_keys_capped(self, test_client_with_spell):
+        """Test a batch whose entries add up to more than KEYPRESS_BATCH_MAX_KEYS is refused."""
+        import main
+
+        keys = ["x"] * (main.KEYPRESS_BATCH_MAX_KEYS // 2 + 1)
+        payload = [{"uuid": "u1", "keys": keys}, {"uuid": "u2", "keys": keys}]
+        response = test_client_with_spell.post("/keypress/batch", json=payload)
+
+        assert response.status_code == 413
+
+    def test_batch_entry_count_capped(self, test_client_with_spell):
+        """Test a batch with more entries than KEYPRESS_BATCH_MAX_ENTRIES fails validation."""
+        import main
+
+        payload = [
+            {"uuid": f"uuid-{index}", "keys": ["x"]}
+            for index in range(main.KEYPRESS_BATCH_MAX_ENTRIES + 1)
+        ]
+        response = test_client_with_spell.post("/keypress/batch", json=payload)
+
+        assert response.status_code == 422
+
+
+class TestAsyncDatabaseLayer:
+    """Tests for the endpoints running on the async store variants."""
+
+    def test_spell_cast_with_async_stores(
+        self, test_client_with_async_db, test_uuid, simple_spell
+    ):
+        """Test a successful cast is persisted and grants /mines access."""
+        for key in simple_spell:
+            response = test_client_with_async_db.post(
+                "/keypress", json={"key": key, "uuid": test_uuid}
+            )
+        assert response.json()["spell_successful"] is True
+
+        mines_response = test_client_with_async_db.get(f"/mines?session_id={test_uuid}")
+        assert mines_response.status_code == 200
+
+        for key in simple_spell:
+            response = test_client_with_async_db.post(
+                "/keypress", json={"key": key, "uuid": "second-uuid"}
+            )
+        assert response.json()["spell_successful"] is False
+        assert "already cast the spell" in response.json()["message"]
+
+
+class TestMetricsEndpoint:
+    """Tests for the Prometheus /metrics endpoint."""
+
+    def test_metrics_exposition(self, test_client_with_async_db, test_uuid, simple_spell):
+        """Test requests, spell outcomes and store latency show up in /metrics."""
+        import main
+
+        successes_before = main.spell_successes.value()
+        for key in simple_spell:
+            test_client_with_async_db.post("/keypress", json={"key": key, "uuid": test_uuid})
+        test_client_with_async_db.get("/no-such-page")
+
+        response = test_client_with_async_db.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert main.spell_successes.value() == successes_before + 1
+        body = response.text
+        assert "# TYPE typefriend_http_request_duration_seconds histogram" in body
+        assert (
+            'typefriend_http_request_duration_seconds_count{route="/keypress",method="POST",status="200"}'
+            in body
+        )
+        assert 'route="unmatched",method="GET",status="404"' in body
+        assert 'typefriend_db_store_duration_seconds_count{store="SpellIPStore",operation="claim"}' in body
+        assert "typefriend_spell_successes_total" in body
+        assert 'typefriend_db_pool_checkedout{engine="async"}' in body
+        for phase in ("import", "module", "schema", "pages", "total"):
+            assert f'typefriend_startup_seconds{{phase="{phase}"}}' in body
+
+    def test_metrics_disabled(self, test_client, monkeypatch):
+        """Test /metrics is hidden when METRICS_ENABLED is off."""
+        import main
+
+        monkeypatch.setattr(main, "METRICS_ENABLED", False)
+
+        response = test_client.get("/metrics")
+
+        assert response.status_code == 404
+
+
+class TestRateLimiting:
+    """Tests for the token-bucket rate limiting middleware."""
+
+    @pytest.fixture
+    def tight_limits(self, monkeypatch):
+        import main
+
+        monkeypatch.setattr(main.rate_limiter, "rules", {})
+        main.rate_limiter.add_rule("/keypress", "uuid", (0.001, 2))
+        main.rate_limiter.add_rule("/mines", "ip", (0.001, 1))
+        main.rate_limiter.add_rule("/ws/keypress", "ip", (0.001, 1))
+        return main.rate_limiter
+
+    def test_keypress_limited_per_uuid_before_body_parsing(
+        self, test_client_with_spell, tight_limits
+    ):
+        """Test over-limit requests get 429 with Retry-After, even with an invalid body."""
+        headers = {"X-Session-Id": "flooder"}
+        for _ in range(2):
+            response = test_client_with_spell.post(
+                "/keypress", json={"key": "a", "uuid": "flooder"}, headers=headers
+            )
+            assert response.status_code == 200
+
+        limited = test_client_with_spell.post("/keypress", content=b"not json", headers=headers)
+        other = test_client_with_spell.post(
+            "/keypress", json={"key": "a", "uuid": "other"}, headers={"X-Session-Id": "other"}
+        )
+
+        assert limited.status_code == 429
+        assert int(limited.headers["retry-after"]) >= 1
+        assert other.status_code == 200
+
+    def test_keypress_body_uuid_limited_without_header(self, test_client_with_spell, tight_limits):
+        """Test leaving out or faking X-Session-Id does not escape the per-UUID limit."""
+        payload = {"key": "a", "uuid": "headless"}
+        for _ in range(2):
+            assert test_client_with_spell.post("/keypress", json=payload).status_code == 200
+
+        response = test_client_with_spell.post("/keypress", json=payload)
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+        spoofed = test_client_with_spell.post(
+            "/keypress", json=payload, headers={"X-Session-Id": "someone-else"}
+        )
+        assert spoofed.status_code == 429
+
+    def test_batch_charged_per_key(self, test_client_with_spell, monkeypatch):
+        """Test every batched key costs a /keypress token, so batching cannot raise the key rate."""
+        import main
+
+        monkeypatch.setattr(main.rate_limiter, "rules", {})
+        main.rate_limiter.add_rule("/keypress", "ip", (0.001, 5))
+        main.rate_limiter.add_rule("/keypress", "uuid", (0.001, 2))
+
+        two_keys = {"uuid": "u1", "keys": ["x", "y"]}
+        assert test_client_with_spell.post("/keypress/batch", json=two_keys).status_code == 200
+        # u1 has no token left, even for a single key
+        single = {"uuid": "u1", "keys": ["x"]}
+        assert test_client_with_spell.post("/keypress/batch", json=single).status_code == 429
+        # like the middleware, each bucket is charged on its own: the refused
+        # request still spent an IP token, leaving 2
+        two_uuids = [{"uuid": f"v{index}", "keys": ["x"]} for index in range(2)]
+        assert test_client_with_spell.post("/keypress/batch", json=two_uuids).status_code == 200
+        response = test_client_with_spell.post(
+            "/keypress/batch", json={"uuid": "w", "keys": ["x"]}
+        )
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+
+    def test_mines_limited_per_ip(self, test_client_with_spell, tight_limits):
+        """Test /mines is limited per client IP."""
+        assert test_client_with_spell.get("/mines?session_id=a").status_code == 403
+        assert test_client_with_spell.get("/mines?session_id=b").status_code == 429
+
+    def test_websocket_handshake_limited(self, test_client_with_spell, tight_limits, test_uuid):
+        """Test over-limit WebSocket handshakes are rejected."""
+        from starlette.websockets import WebSocketDisconnect
+
+        with test_client_with_spell.websocket_connect(f"/ws/keypress?uuid={test_uuid}"):
+            pass
+        with pytest.raises(WebSocketDisconnect):
+            with test_client_with_spell.websocket_connect(f"/ws/keypress?uuid={test_uuid}"):
+                pass
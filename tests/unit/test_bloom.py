@@ -0,0 +1,46 @@
+import pytest
+from app.bloom import BloomFilter
+
+
+def test_added_items_are_members():
+    """Test a Bloom filter never reports a false negative."""
+    bloom = BloomFilter(capacity=1000)
+    ips = [f"10.0.{i // 256}.{i % 256}" for i in range(1000)]
+    for ip in ips:
+        bloom.add(ip)
+
+    assert all(ip in bloom for ip in ips)
+    assert bloom.items_added == 1000
+
+
+def test_false_positive_rate_near_target():
+    """Test the observed false-positive rate stays close to the configured one."""
+    bloom = BloomFilter(capacity=5000, error_rate=0.01)
+    for i in range(5000):
+        bloom.add(f"192.168.{i // 256}.{i % 256}")
+
+    false_positives = sum(f"172.16.{i // 256}.{i % 256}" in bloom for i in range(20000))
+
+    assert false_positives / 20000 < 0.03
+    assert bloom.false_positive_rate < 0.03
+
+
+def test_stats_report_fill_ratio():
+    """Test the reported fill ratio grows as items are added."""
+    bloom = BloomFilter(capacity=100)
+    assert bloom.stats()["fill_ratio"] == 0
+
+    bloom.add("127.0.0.1")
+    stats = bloom.stats()
+
+    assert 0 < stats["fill_ratio"] < 1
+    assert stats["hash_count"] >= 1
+    assert stats["size_bytes"] == (stats["bit_count"] + 7) // 8
+
+
+def test_invalid_sizing():
+    """Test capacity and error rate are validated."""
+    with pytest.raises(ValueError):
+        BloomFilter(capacity=0)
+    with pytest.raises(ValueError):
+        BloomFilter(capacity=10, error_rate=1.5)
@@ -0,0 +1,72 @@
+from unittest.mock import patch
+from app.cache import MISSING, TTLCache
+
+
+def test_get_missing_key():
+    """Test an uncached key returns the default."""
+    cache = TTLCache()
+
+    assert cache.get("uuid") is MISSING
+    assert cache.get("uuid", False) is False
+    assert cache.stats()["misses"] == 2
+
+
+def test_positive_and_negative_entries():
+    """Test None is cached as a negative result alongside positive values."""
+    cache = TTLCache()
+    cache.set("granted", True)
+    cache.set("unknown", None)
+
+    assert cache.get("granted") is True
+    assert cache.get("unknown") is None
+    assert cache.stats()["hits"] == 2
+
+
+def test_entries_expire_by_kind():
+    """Test negative entries use the shorter negative TTL."""
+    cache = TTLCache(ttl=300, negative_ttl=5)
+    with patch("app.cache.time.monotonic", return_value=100.0):
+        cache.set("granted", True)
+        cache.set("unknown", None)
+    with patch("app.cache.time.monotonic", return_value=110.0):
+        assert cache.get("granted") is True
+        assert cache.get("unknown") is MISSING
+    with patch("app.cache.time.monotonic", return_value=500.0):
+        assert cache.get("granted") is MISSING
+
+
+def test_entry_ttl_caps_default():
+    """Test a per-entry TTL shortens, but never extends, an entry's lifetime."""
+    cache = TTLCache(ttl=300)
+    with patch("app.cache.time.monotonic", return_value=100.0):
+        cache.set("short", True, ttl=10)
+        cache.set("long", True, ttl=1000)
+        cache.set("expired", True, ttl=-1)
+    with patch("app.cache.time.monotonic", return_value=120.0):
+        assert cache.get("short") is MISSING
+        assert cache.get("long") is True
+        assert cache.get("expired") is MISSING
+    with patch("app.cache.time.monotonic", return_value=500.0):
+        assert cache.get("long") is MISSING
+
+
+def test_lru_bound():
+    """Test the least recently used entry is evicted past max_entries."""
+    cache = TTLCache(max_entries=2)
+    cache.set("a", True)
+    cache.set("b", True)
+    cache.get("a")
+    cache.set("c", True)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") is True
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    """Test a zero-sized cache never holds entries."""
+    cache = TTLCache(max_entries=0)
+    cache.set("a", True)
+
+    assert cache.get("a") is MISSING
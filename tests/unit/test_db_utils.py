@@ -1,11 +1,17 @@
+import csv
+import io
+import json
+from datetime import datetime
+
 import pytest
 from unittest.mock import patch
-from app.db_utils import list_ips, erase_ip
-from app.database import get_session, SuccessfulSpellIP, init_db, reset_engine
+from app.db_utils import list_ips, erase_ip, erase_rows, export_rows, main
+from app.database import get_session, SuccessfulSpellIP, UserAccess, init_db, reset_engine
 
 @pytest.fixture(autouse=True)
 def setup_teardown_module(dburl_env):
     """Create the database and table for the tests and tear it down after."""
+    reset_engine()
     init_db()
     yield
     reset_engine()
@@ -54,3 +60,70 @@ def test_erase_ip_nonexistent_ip(capsys):
     erase_ip("192.168.1.4")
     captured = capsys.readouterr()
     assert "IP address not found: 192.168.1.4" in captured.out
+
+
+@pytest.fixture
+def spell_rows():
+    """Twelve spell IPs cast on consecutive days, plus one IPv6 address."""
+    session = get_session()
+    for index in range(12):
+        session.add(
+            SuccessfulSpellIP(
+                ip=f"10.0.{index // 6}.{index}",
+                user_uuid=f"uuid-{index}",
+                cast_time=datetime(2024, 1, index + 1),
+            )
+        )
+    session.add(SuccessfulSpellIP(ip="2001:db8::1", user_uuid="uuid-v6", cast_time=datetime(2024, 2, 1)))
+    session.add(UserAccess(uuid="uuid-1", created_at=datetime(2024, 1, 1)))
+    session.add(UserAccess(uuid="uuid-2", created_at=datetime(2024, 3, 1)))
+    session.commit()
+    session.close()
+
+
+def _remaining_ips():
+    session = get_session()
+    try:
+        return {row.ip for row in session.query(SuccessfulSpellIP)}
+    finally:
+        session.close()
+
+
+def test_export_streams_every_page(spell_rows):
+    """Test export walks all keyset pages, in CSV and JSON lines."""
+    out = io.StringIO()
+    assert export_rows(SuccessfulSpellIP, out, "csv", batch_size=5) == 13
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert len({row["ip"] for row in rows}) == 13
+
+    out = io.StringIO()
+    assert export_rows(UserAccess, out, "jsonl", batch_size=1, since=datetime(2024, 2, 1)) == 1
+    assert json.loads(out.getvalue()) == {
+        "uuid": "uuid-2",
+        "granted": True,
+        "created_at": "2024-03-01T00:00:00",
+    }
+
+
+def test_erase_by_cidr_ip_list_and_time_range(spell_rows):
+    """Test bulk erase by network, explicit IPs and cast_time range."""
+    assert erase_rows(SuccessfulSpellIP, dry_run=True, cidrs=["10.0.1.0/24"]) == 6
+    assert len(_remaining_ips()) == 13
+
+    assert erase_rows(SuccessfulSpellIP, cidrs=["10.0.1.0/24", "2001:db8::/32"]) == 7
+    assert erase_rows(SuccessfulSpellIP, ips=["10.0.0.0", "10.0.0.1", "10.9.9.9"]) == 2
+    assert erase_rows(
+        SuccessfulSpellIP, since=datetime(2024, 1, 3), until=datetime(2024, 1, 5)
+    ) == 2
+    assert _remaining_ips() == {"10.0.0.4", "10.0.0.5"}
+
+
+def test_erase_user_access_and_requires_a_filter(spell_rows, capsys):
+    """Test the erase command works on user_access and refuses unfiltered deletes."""
+    main(["erase", "--table", "user_access", "--uuid", "uuid-1,uuid-9"])
+    assert "Erased 1 rows from user_access" in capsys.readouterr().out
+
+    with pytest.raises(ValueError):
+        erase_rows(UserAccess)
+    with pytest.raises(ValueError):
+        erase_rows(UserAccess, cidrs=["10.0.0.0/8"])
@@ -0,0 +1,47 @@
+import ipaddress
+import random
+
+from app.ip_index import IPPrefixIndex
+
+
+def test_exact_membership_matches_a_set():
+    """Test exact lookups agree with a plain set of the added addresses."""
+    rng = random.Random(7)
+    added = {str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(2000)}
+    index = IPPrefixIndex()
+    for ip in added:
+        index.add(ip)
+    probes = [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(2000)]
+
+    assert all(ip in index for ip in added)
+    assert [ip in index for ip in probes] == [ip in added for ip in probes]
+    assert index.items_added == len(added)
+
+
+def test_network_membership():
+    """Test CIDR lookups find any stored address inside the range and nothing outside."""
+    index = IPPrefixIndex()
+    for ip in ("10.0.1.7", "10.0.3.200", "2001:db8:0:1::5"):
+        index.add(ip)
+
+    assert index.contains_network("10.0.1.0/24")
+    assert index.contains_network("10.0.0.0/22")
+    assert index.contains_network("0.0.0.0/0")
+    assert not index.contains_network("10.0.2.0/24")
+    assert not index.contains_network("10.0.1.8/29")
+    assert index.contains_network("2001:db8:0:1::/64")
+    assert not index.contains_network("2001:db8:0:2::/64")
+
+
+def test_versions_and_spellings():
+    """Test IPv4-mapped IPv6 matches its IPv4 form and non-IP strings are ignored."""
+    index = IPPrefixIndex()
+    index.add("::ffff:192.0.2.1")
+    index.add("testclient")
+    index.add("192.0.2.1")
+
+    assert "192.0.2.1" in index
+    assert "::ffff:192.0.2.1" in index
+    assert "::c000:201" not in index
+    assert "testclient" not in index
+    assert index.items_added == 1
@@ -1,5 +1,18 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
-from app.key_buffer_manager import KeyBufferManager
+from unittest.mock import patch
+from app.key_buffer_manager import (
+    InMemoryKeyBufferStore,
+    KeyBufferManager,
+    KeyBufferStore,
+    ShardedKeyBufferManager,
+    SQLiteKeyBufferStore,
+    build_spell_transitions,
+    load_snapshot,
+    write_snapshot,
+)
 
 
 class TestKeyBufferManager:
@@ -116,3 +129,461 @@ class TestKeyBufferManager:
         """Test getting buffer for user that doesn't exist."""
         result = clean_key_buffer_manager.get_buffer("nonexistent-uuid")
         assert result == []
+
+
+class TestKeyBufferManagerAutomaton:
+    """Unit tests for the KMP automaton spell matcher."""
+
+    def test_init_rejects_unknown_matcher(self, simple_spell):
+        """Test an unknown matcher name is rejected."""
+        with pytest.raises(ValueError):
+            KeyBufferManager(parsed_secret_spell=simple_spell, matcher="regex")
+
+    def test_transitions_follow_failure_links(self):
+        """Test the automaton falls back to the longest matching prefix."""
+        transitions = build_spell_transitions(["a", "a", "b"])
+
+        assert transitions[0] == {"a": 1}
+        assert transitions[1] == {"a": 2}
+        # "aaa" still ends in a two-key prefix of "aab"
+        assert transitions[2] == {"a": 2, "b": 3}
+        assert transitions[3] == {"a": 1}
+
+    def test_check_spell_exact_match(self, simple_spell, test_uuid):
+        """Test the spell matches after typing it exactly."""
+        manager = KeyBufferManager(parsed_secret_spell=simple_spell, matcher="automaton")
+
+        for key in simple_spell:
+            manager.add_key(test_uuid, key)
+
+        assert manager.check_spell(test_uuid) is True
+        assert manager.get_buffer(test_uuid) == simple_spell
+
+    def test_check_spell_case_insensitive(self, simple_spell, test_uuid):
+        """Test the automaton compares keys case-insensitively."""
+        manager = KeyBufferManager(parsed_secret_spell=simple_spell, matcher="automaton")
+
+        for key in ["A", "B", "ENTER"]:
+            manager.add_key(test_uuid, key)
+
+        assert manager.check_spell(test_uuid) is True
+
+    def test_check_spell_after_noise(self, konami_code_spell, test_uuid):
+        """Test a spell typed after a partial, overlapping attempt still matches."""
+        manager = KeyBufferManager(
+            parsed_secret_spell=konami_code_spell, matcher="automaton"
+        )
+
+        for key in ["ArrowUp", "ArrowUp", "ArrowUp"] + konami_code_spell[2:]:
+            manager.add_key(test_uuid, key)
+
+        assert manager.check_spell(test_uuid) is True
+
+    def test_add_key_does_not_store_buffers(self, simple_spell, test_uuid):
+        """Test the automaton keeps one integer state per user."""
+        manager = KeyBufferManager(parsed_secret_spell=simple_spell, matcher="automaton")
+
+        manager.add_key(test_uuid, "a")
+        manager.add_key(test_uuid, "b")
+
+        assert manager._user_key_buffers == {}
+        assert manager._user_match_states == {test_uuid: 2}
+
+    def test_empty_spell(self, test_uuid):
+        """Test the automaton never matches an empty spell."""
+        manager = KeyBufferManager(parsed_secret_spell=[], matcher="automaton")
+
+        assert manager.add_key(test_uuid, "a") == []
+        assert manager.check_spell(test_uuid) is False
+
+    @pytest.mark.parametrize(
+        "spell",
+        [["a"], ["a", "b", "Enter"], ["a", "a", "b", "a", "a"], ["x", "y", "x", "y", "z"]],
+    )
+    def test_matches_buffer_matcher(self, spell, test_uuid):
+        """Test both matchers agree on every key of a pseudo-random stream."""
+        buffer_manager = KeyBufferManager(parsed_secret_spell=spell)
+        automaton_manager = KeyBufferManager(parsed_secret_spell=spell, matcher="automaton")
+        alphabet = sorted(set(spell)) + ["q", "A", "ENTER"]
+
+        seed = 7
+        for _ in range(2000):
+            seed = (seed * 1103515245 + 12345) % (2**31)
+            key = alphabet[seed % len(alphabet)]
+            buffer_manager.add_key(test_uuid, key)
+            automaton_manager.add_key(test_uuid, key)
+            assert automaton_manager.check_spell(test_uuid) == buffer_manager.check_spell(
+                test_uuid
+            )
+
+
+class TestInMemoryKeyBufferStore:
+    """Unit tests for session eviction in InMemoryKeyBufferStore."""
+
+    def test_behaves_like_dict(self):
+        """Test the store supports the mapping operations the manager uses."""
+        store = InMemoryKeyBufferStore()
+        store["uuid-1"] = ["a"]
+
+        assert store == {"uuid-1": ["a"]}
+        assert store.get("uuid-2", []) == []
+        assert len(store) == 1
+
+    def test_max_entries_evicts_least_recently_written(self):
+        """Test the least recently written session is evicted first."""
+        store = InMemoryKeyBufferStore(max_entries=2)
+        store["uuid-1"] = 1
+        store["uuid-2"] = 2
+        store["uuid-1"] = 3
+        store["uuid-3"] = 4
+
+        assert list(store) == ["uuid-1", "uuid-3"]
+        assert store.lru_evictions == 1
+
+    def test_idle_ttl_evicts_idle_sessions(self):
+        """Test sessions idle past the TTL are dropped on the next write."""
+        store = InMemoryKeyBufferStore(idle_ttl=60)
+        with patch("app.key_buffer_manager.time.monotonic", return_value=100.0):
+            store["uuid-1"] = 1
+            store["uuid-2"] = 2
+        with patch("app.key_buffer_manager.time.monotonic", return_value=150.0):
+            store["uuid-2"] = 3
+        with patch("app.key_buffer_manager.time.monotonic", return_value=200.0):
+            store["uuid-3"] = 4
+
+        assert list(store) == ["uuid-2", "uuid-3"]
+        assert store.idle_evictions == 1
+
+    def test_sweep_without_writes(self):
+        """Test sweep evicts idle sessions on demand."""
+        store = InMemoryKeyBufferStore(idle_ttl=60)
+        with patch("app.key_buffer_manager.time.monotonic", return_value=100.0):
+            store["uuid-1"] = 1
+        with patch("app.key_buffer_manager.time.monotonic", return_value=500.0):
+            store.sweep()
+
+        assert len(store) == 0
+        assert store.eviction_stats() == {
+            "entries": 0,
+            "lru_evictions": 0,
+            "idle_evictions": 1,
+        }
+
+    def test_manager_bounds_sessions(self, simple_spell):
+        """Test the manager applies max_entries to both matchers."""
+        for matcher in ("buffer", "automaton"):
+            manager = KeyBufferManager(
+                parsed_secret_spell=simple_spell, matcher=matcher, max_entries=10
+            )
+            for index in range(25):
+                manager.add_key(f"uuid-{index}", "a")
+
+            stats = manager.eviction_stats()
+            assert stats["entries"] == 10
+            assert stats["lru_evictions"] == 15
+
+    @pytest.mark.parametrize("sharded", [False, True], ids=["plain", "sharded"])
+    def test_manager_sweep_evicts_idle_sessions(self, simple_spell, sharded):
+        """Test a manager sweep evicts idle sessions with no further keypresses."""
+        if sharded:
+            manager = ShardedKeyBufferManager(
+                parsed_secret_spell=simple_spell, shards=4, idle_ttl=60
+            )
+        else:
+            manager = KeyBufferManager(parsed_secret_spell=simple_spell, idle_ttl=60)
+        with patch("app.key_buffer_manager.time.monotonic", return_value=100.0):
+            for index in range(5):
+                manager.add_key(f"uuid-{index}", "a")
+        with patch("app.key_buffer_manager.time.monotonic", return_value=500.0):
+            manager.sweep()
+
+        stats = manager.eviction_stats()
+        assert stats["entries"] == 0
+        assert stats["idle_evictions"] == 5
+
+    def test_store_without_eviction_reports_zero_counters(self):
+        """Test a store that never evicts still reports eviction stats."""
+
+        class DictStore(KeyBufferStore):
+            def __init__(self):
+                self._data = {}
+
+            def __getitem__(self, key):
+                return self._data[key]
+
+            def __setitem__(self, key, value):
+                self._data[key] = value
+
+            def __delitem__(self, key):
+                del self._data[key]
+
+            def __iter__(self):
+                return iter(self._data)
+
+            def __len__(self):
+                return len(self._data)
+
+        store = DictStore()
+        store["uuid-1"] = ["a"]
+        store.sweep()
+
+        assert store.eviction_stats() == {"entries": 1, "lru_evictions": 0, "idle_evictions": 0}
+
+
+class TestShardedKeyBufferManager:
+    """Unit tests for the lock-striped ShardedKeyBufferManager."""
+
+    @pytest.mark.parametrize("matcher", ["buffer", "automaton"])
+    def test_matches_unsharded_manager(self, konami_code_spell, matcher):
+        """Test the sharded manager gives the same results as a plain one."""
+        plain = KeyBufferManager(parsed_secret_spell=konami_code_spell, matcher=matcher)
+        sharded = ShardedKeyBufferManager(
+            parsed_secret_spell=konami_code_spell, shards=4, matcher=matcher
+        )
+        keys = ["q"] + konami_code_spell + ["a"] + konami_code_spell
+
+        for index, key in enumerate(keys):
+            user = f"uuid-{index % 3}"
+            assert sharded.add_key(user, key) == plain.add_key(user, key)
+            assert sharded.check_spell(user) == plain.check_spell(user)
+            assert sharded.get_buffer(user) == plain.get_buffer(user)
+
+    def test_returned_buffer_is_a_copy(self, simple_spell, test_uuid):
+        """Test callers cannot see later updates through a returned buffer."""
+        manager = ShardedKeyBufferManager(parsed_secret_spell=simple_spell, shards=2)
+        buffer = manager.add_key(test_uuid, "a")
+        manager.add_key(test_uuid, "b")
+
+        assert buffer == ["a"]
+
+    def test_concurrent_sessions(self, simple_spell):
+        """Test every session completes the spell when driven from many threads."""
+        manager = ShardedKeyBufferManager(
+            parsed_secret_spell=simple_spell, shards=4, matcher="automaton"
+        )
+        casts = [0] * 8
+
+        def worker(thread_index):
+            for user in range(50):
+                for key in simple_spell:
+                    if manager.add_key_and_check(f"t{thread_index}-{user}", key):
+                        casts[thread_index] += 1
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert casts == [50] * 8
+        assert manager.eviction_stats()["entries"] == 400
+
+    def test_max_entries_split_between_shards(self, simple_spell):
+        """Test max_entries bounds the total session count across shards."""
+        manager = ShardedKeyBufferManager(
+            parsed_secret_spell=simple_spell, shards=4, max_entries=40
+        )
+        for index in range(1000):
+            manager.add_key(f"uuid-{index}", "a")
+
+        assert manager.eviction_stats()["entries"] <= 40
+        with pytest.raises(ValueError):
+            ShardedKeyBufferManager(parsed_secret_spell=simple_spell, shards=0)
+
+
+class TestSQLiteKeyBufferStore:
+    """Unit tests for the cross-process SQLiteKeyBufferStore."""
+
+    def test_roundtrip_values(self, tmp_path):
+        """Test buffers and automaton states survive a write and read."""
+        store = SQLiteKeyBufferStore(str(tmp_path / "kb.db"))
+        store["uuid-1"] = ["a", "Enter"]
+        store["uuid-2"] = 3
+
+        assert store["uuid-1"] == ["a", "Enter"]
+        assert store.get("uuid-2") == 3
+        assert store.get("missing", []) == []
+        assert len(store) == 2
+        store.close()
+
+    def test_state_shared_between_managers(self, tmp_path, simple_spell, test_uuid):
+        """Test two managers on one file behave like a single worker."""
+        path = str(tmp_path / "kb.db")
+        for matcher in ("buffer", "automaton"):
+            worker1 = KeyBufferManager(
+                parsed_secret_spell=simple_spell,
+                matcher=matcher,
+                store=SQLiteKeyBufferStore(path, table=f"kb_{matcher}"),
+            )
+            worker2 = KeyBufferManager(
+                parsed_secret_spell=simple_spell,
+                matcher=matcher,
+                store=SQLiteKeyBufferStore(path, table=f"kb_{matcher}"),
+            )
+
+            worker1.add_key(test_uuid, "a")
+            worker2.add_key(test_uuid, "b")
+            worker1.add_key(test_uuid, "Enter")
+
+            assert worker2.check_spell(test_uuid) is True
+
+    def test_sessions_of_another_spell_are_discarded(self, tmp_path, konami_code_spell, test_uuid):
+        """Test a changed spell drops saved states instead of indexing past its automaton."""
+        path = str(tmp_path / "kb.db")
+        old = KeyBufferManager(
+            parsed_secret_spell=konami_code_spell,
+            matcher="automaton",
+            store=SQLiteKeyBufferStore(path),
+        )
+        for key in konami_code_spell[:8]:
+            old.add_key(test_uuid, key)
+
+        new = KeyBufferManager(
+            parsed_secret_spell=["a", "b"], matcher="automaton", store=SQLiteKeyBufferStore(path)
+        )
+
+        assert new.get_buffer(test_uuid) == []
+        assert new.add_key(test_uuid, "a") == ["a"]
+
+    def test_out_of_range_states_restart_the_match(self, tmp_path, simple_spell, test_uuid):
+        """Test a state the automaton does not have reads as no progress."""
+        store = SQLiteKeyBufferStore(str(tmp_path / "kb.db"))
+        manager = KeyBufferManager(
+            parsed_secret_spell=simple_spell, matcher="automaton", store=store
+        )
+        store[test_uuid] = 42
+
+        assert manager.get_buffer(test_uuid) == []
+        assert manager.check_spell(test_uuid) is False
+        assert manager.add_key(test_uuid, "a") == ["a"]
+
+    def test_concurrent_writers_lose_no_keys(self, tmp_path, test_uuid):
+        """Test read-modify-write from several connections applies every key."""
+        path = str(tmp_path / "kb.db")
+        spell = [str(index % 10) for index in range(200)]
+        managers = [
+            KeyBufferManager(parsed_secret_spell=spell, store=SQLiteKeyBufferStore(path))
+            for _ in range(4)
+        ]
+
+        def type_keys(manager):
+            for _ in range(25):
+                manager.add_key(test_uuid, "k")
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(type_keys, managers))
+
+        assert len(managers[0].get_buffer(test_uuid)) == 100
+
+    def test_sweep_evicts_by_size_and_idle_time(self, tmp_path):
+        """Test eviction removes idle sessions and trims to max_entries."""
+        store = SQLiteKeyBufferStore(
+            str(tmp_path / "kb.db"), max_entries=2, idle_ttl=60, sweep_interval=1000
+        )
+        with patch("app.key_buffer_manager.time.time", return_value=100.0):
+            store["uuid-idle"] = 1
+        with patch("app.key_buffer_manager.time.time", return_value=200.0):
+            store["uuid-1"] = 1
+            store["uuid-2"] = 2
+            store["uuid-3"] = 3
+            store.sweep()
+
+        assert sorted(store) == ["uuid-2", "uuid-3"]
+        assert store.eviction_stats() == {
+            "entries": 2,
+            "lru_evictions": 1,
+            "idle_evictions": 1,
+        }
+        store.close()
+
+
+class TestKeyBufferSnapshot:
+    """Unit tests for writing and restoring key buffer snapshots."""
+
+    @pytest.mark.parametrize("matcher", ["buffer", "automaton"])
+    @pytest.mark.parametrize("sharded", [False, True])
+    def test_roundtrip(self, tmp_path, konami_code_spell, matcher, sharded):
+        """Test restored sessions continue exactly where they stopped."""
+
+        def make_manager():
+            if sharded:
+                return ShardedKeyBufferManager(konami_code_spell, shards=4, matcher=matcher)
+            return KeyBufferManager(konami_code_spell, matcher=matcher)
+
+        manager = make_manager()
+        for index in range(50):
+            for key in konami_code_spell[: index % 10 + 1]:
+                manager.add_key(f"uuid-{index}", key)
+        manager.add_key("uuid-\u00e9", "\u00e9")
+        path = str(tmp_path / "kb.snapshot")
+
+        assert write_snapshot(manager, path) == 51
+
+        restored = make_manager()
+        assert load_snapshot(restored, path) == 51
+        for index in range(50):
+            user = f"uuid-{index}"
+            assert restored.get_buffer(user) == manager.get_buffer(user)
+        assert restored.get_buffer("uuid-\u00e9") == manager.get_buffer("uuid-\u00e9")
+        assert restored.get_buffer("unknown") == []
+
+        for key in konami_code_spell[6:]:
+            restored.add_key("uuid-5", key)
+        assert restored.check_spell("uuid-5") is True
+
+    def test_live_sessions_win_and_untouched_sessions_are_saved_again(
+        self, tmp_path, simple_spell
+    ):
+        """Test restored sessions never overwrite live ones and survive the next snapshot."""
+        path = str(tmp_path / "kb.snapshot")
+        manager = KeyBufferManager(simple_spell)
+        manager.add_key("uuid-1", "a")
+        manager.add_key("uuid-2", "a")
+        write_snapshot(manager, path)
+
+        restarted = KeyBufferManager(simple_spell)
+        restarted.add_key("uuid-1", "x")
+        load_snapshot(restarted, path)
+        assert restarted.get_buffer("uuid-1") == ["x"]
+
+        assert write_snapshot(restarted, path) == 2
+        again = KeyBufferManager(simple_spell)
+        load_snapshot(again, path)
+        assert again.get_buffer("uuid-1") == ["x"]
+        assert again.get_buffer("uuid-2") == ["a"]
+
+    def test_restored_sessions_expire_with_idle_ttl(self, tmp_path, simple_spell):
+        """Test snapshot sessions are dropped once the idle TTL has passed."""
+        path = str(tmp_path / "kb.snapshot")
+        manager = KeyBufferManager(simple_spell)
+        manager.add_key("uuid-1", "a")
+        write_snapshot(manager, path)
+
+        with patch("app.key_buffer_manager.time.monotonic", return_value=100.0):
+            restored = KeyBufferManager(simple_spell, idle_ttl=60)
+            load_snapshot(restored, path)
+        with patch("app.key_buffer_manager.time.monotonic", return_value=200.0):
+            assert restored.get_buffer("uuid-1") == []
+            assert restored.export_state() == ([], [])
+
+    def test_ignores_stale_snapshots(self, tmp_path, simple_spell):
+        """Test snapshots for another spell, matcher or format, too old, or corrupt are ignored."""
+        path = str(tmp_path / "kb.snapshot")
+        manager = KeyBufferManager(simple_spell)
+        manager.add_key("uuid-1", "a")
+        write_snapshot(manager, path)
+
+        assert load_snapshot(KeyBufferManager(["x", "y"]), path) is None
+        assert load_snapshot(KeyBufferManager(simple_spell, matcher="automaton"), path) is None
+        with patch("app.key_buffer_manager.time.time", return_value=10**10):
+            assert load_snapshot(KeyBufferManager(simple_spell), path, max_age=60) is None
+        assert load_snapshot(KeyBufferManager(simple_spell), str(tmp_path / "missing")) is None
+
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:4] + b"\x09\x00" + data[6:])
+        assert load_snapshot(KeyBufferManager(simple_spell), path) is None
+        with open(path, "wb") as f:
+            f.write(data[:-3])
+        assert load_snapshot(KeyBufferManager(simple_spell), path) is None
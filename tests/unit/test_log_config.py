@@ -0,0 +1,115 @@
+import io
+import json
+import logging
+import queue
+import sys
+
+from app.log_config import (
+    AccessLogPathFilter,
+    DroppingQueueHandler,
+    EventSampler,
+    JsonFormatter,
+    configure_logging,
+    stop_logging,
+)
+
+
+def _record(msg="Key pressed: %s", args=("a",), **extra):
+    record = logging.makeLogRecord(
+        {"name": "main", "levelno": logging.INFO, "levelname": "INFO", "msg": msg, "args": args}
+    )
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extra_fields():
+    """Test records render as one JSON object with lazily merged args and extras."""
+    line = JsonFormatter().format(_record(event="keypress", uuid="u-1"))
+    entry = json.loads(line)
+
+    assert entry["message"] == "Key pressed: a"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "main"
+    assert entry["event"] == "keypress"
+    assert entry["uuid"] == "u-1"
+    assert "args" not in entry
+
+
+def test_event_sampler():
+    """Test only records for sampled events are dropped."""
+    assert EventSampler(0.0).filter(_record(event="keypress")) is False
+    assert EventSampler(0.0).filter(_record()) is True
+    assert EventSampler(1.0).filter(_record(event="keypress")) is True
+
+
+def test_dropping_queue_handler_never_blocks():
+    """Test a full queue drops records instead of blocking or raising."""
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(_record())
+    handler.handle(_record())
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+def test_dropping_queue_handler_defers_formatting():
+    """Test records are queued unformatted; only tracebacks are rendered up front."""
+    handler = DroppingQueueHandler(queue.Queue())
+    handler.setFormatter(JsonFormatter())
+    record = _record()
+    handler.handle(record)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        failed = _record(exc_info=sys.exc_info())
+    handler.handle(failed)
+
+    queued = handler.queue.get_nowait()
+    assert queued is record
+    assert (queued.msg, queued.args) == ("Key pressed: %s", ("a",))
+    assert not hasattr(queued, "message")
+    queued_failure = handler.queue.get_nowait()
+    assert queued_failure.exc_info is None
+    assert "ValueError: boom" in queued_failure.exc_text
+    assert failed.exc_info is not None
+    assert "ValueError: boom" in json.loads(JsonFormatter().format(queued_failure))["exc"]
+
+
+def test_configure_logging_queue_writes_json_lines():
+    """Test the queue listener writes sampled JSON lines off the caller thread."""
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    stream = io.StringIO()
+    try:
+        configure_logging(
+            json_lines=True,
+            use_queue=True,
+            keypress_sample_rate=0.0,
+            stream=stream,
+            force=True,
+        )
+        logger = logging.getLogger("main")
+        logger.info("Key pressed: %s", "a", extra={"event": "keypress"})
+        logger.info("Spell cast by %s", "u-1")
+        logger.debug("disabled %s", "level")
+        stop_logging()
+    finally:
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in saved_handlers:
+            root.addHandler(handler)
+        root.setLevel(saved_level)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["message"] for line in lines] == ["Spell cast by u-1"]
+
+
+def test_access_log_filter_drops_hot_paths():
+    """Test access records for listed paths are dropped, query string or not."""
+    access_filter = AccessLogPathFilter(["/keypress", "/metrics"])
+    access = '%s - "%s %s HTTP/%s" %d'
+
+    assert not access_filter.filter(_record(access, ("1.2.3.4:5", "POST", "/keypress", "1.1", 200)))
+    assert not access_filter.filter(_record(access, ("1.2.3.4:5", "GET", "/metrics?x=1", "1.1", 200)))
+    assert access_filter.filter(_record(access, ("1.2.3.4:5", "GET", "/mines", "1.1", 200)))
+    assert access_filter.filter(_record())
@@ -0,0 +1,61 @@
+from app.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_counter_render():
+    """Test counters accumulate per label set and render sorted samples."""
+    counter = Counter("casts_total", "Casts.", labelnames=("result",))
+    counter.inc("won")
+    counter.inc("lost", amount=2)
+    counter.inc("won")
+
+    assert counter.value("won") == 2
+    assert counter.render() == ['casts_total{result="lost"} 2', 'casts_total{result="won"} 2']
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test observations land in the first bucket whose bound is >= value."""
+    histogram = Histogram("latency_seconds", "Latency.", labelnames=("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/keypress")
+    histogram.observe(0.1, "/keypress")
+    histogram.observe(0.5, "/keypress")
+    histogram.observe(3.0, "/keypress")
+
+    assert histogram.render() == [
+        'latency_seconds_bucket{route="/keypress",le="0.1"} 2',
+        'latency_seconds_bucket{route="/keypress",le="1.0"} 3',
+        'latency_seconds_bucket{route="/keypress",le="+Inf"} 4',
+        'latency_seconds_sum{route="/keypress"} 3.65',
+        'latency_seconds_count{route="/keypress"} 4',
+    ]
+
+
+def test_gauge_reads_callback_at_render():
+    """Test gauges sample their callback and are omitted when it returns None."""
+    state = {"value": None}
+    gauge = Gauge("sessions", "Sessions.", lambda: state["value"])
+    assert gauge.render() == []
+
+    state["value"] = 3
+    assert gauge.render() == ["sessions 3"]
+
+
+def test_label_values_are_escaped():
+    """Test quotes, backslashes and newlines in label values are escaped."""
+    counter = Counter("c", "C.", labelnames=("path",))
+    counter.inc('a"b\\c\nd')
+
+    assert counter.render() == ['c{path="a\\"b\\\\c\\nd"} 1']
+
+
+def test_registry_render_includes_help_and_type():
+    """Test the registry emits HELP/TYPE headers and skips empty metrics."""
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("casts_total", "Spell casts."))
+    registry.register(Counter("unused_total", "Never incremented."))
+    counter.inc()
+
+    assert registry.render() == (
+        "# HELP casts_total Spell casts.\n"
+        "# TYPE casts_total counter\n"
+        "casts_total 1\n"
+    )
@@ -0,0 +1,81 @@
+import os
+from unittest.mock import patch
+
+from fastapi import FastAPI, Request
+from fastapi.templating import Jinja2Templates
+from fastapi.testclient import TestClient
+
+from app.page_cache import PageCache
+
+
+def _client(tmp_path, status_code=200):
+    (tmp_path / "page.html").write_text("<p>{{ greeting }}</p>")
+    templates = Jinja2Templates(directory=str(tmp_path))
+    page_cache = PageCache(templates)
+    app = FastAPI()
+
+    @app.get("/")
+    async def page(request: Request):
+        return page_cache.response(
+            request, "page.html", {"greeting": "hello"}, "public, max-age=60", status_code
+        )
+
+    return TestClient(app), page_cache
+
+
+def test_renders_once(tmp_path):
+    """Test the first render is reused even after the template changes."""
+    client, page_cache = _client(tmp_path)
+    first = client.get("/")
+    (tmp_path / "page.html").write_text("<p>changed</p>")
+    second = client.get("/")
+
+    assert first.text == second.text == "<p>hello</p>"
+    assert first.headers["etag"] == second.headers["etag"]
+    assert first.headers["cache-control"] == "public, max-age=60"
+
+    page_cache.clear()
+    assert client.get("/").text == "<p>changed</p>"
+
+
+def test_conditional_requests(tmp_path):
+    """Test matching If-None-Match / If-Modified-Since get an empty 304."""
+    client, _ = _client(tmp_path)
+    response = client.get("/")
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+
+    not_modified = client.get("/", headers={"If-None-Match": f'W/{etag}, "other"'})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+    assert client.get("/", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get("/", headers={"If-None-Match": '"stale"'}).status_code == 200
+    assert (
+        client.get(
+            "/", headers={"If-None-Match": '"stale"', "If-Modified-Since": last_modified}
+        ).status_code
+        == 200
+    )
+
+
+def test_last_modified_follows_render_not_template_mtime(tmp_path):
+    """Test a re-render with an unchanged template (e.g. new asset hashes) is not a 304."""
+    client, page_cache = _client(tmp_path)
+    os.utime(tmp_path / "page.html", (0, 0))
+    with patch("app.page_cache.time.time", return_value=1_000_000.0):
+        last_modified = client.get("/").headers["last-modified"]
+
+    page_cache.clear()
+    with patch("app.page_cache.time.time", return_value=2_000_000.0):
+        response = client.get("/", headers={"If-Modified-Since": last_modified})
+
+    assert response.status_code == 200
+
+
+def test_error_pages_are_never_304(tmp_path):
+    """Test conditional headers do not turn an error page into a 304."""
+    client, _ = _client(tmp_path, status_code=404)
+    etag = client.get("/").headers["etag"]
+
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 404
@@ -1,6 +1,12 @@
 import os
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy import text
 from app import database
+from app.bloom import BloomFilter
+from app.cache import TTLCache
+from app.ip_index import IPPrefixIndex
 
 
 def test_access_store_persistence(tmp_path):
@@ -36,3 +42,314 @@ def test_spell_ip_store_persistence(tmp_path):
     assert "127.0.0.1" in store2
     assert store2.get("127.0.0.1")["user_uuid"] == "u1"
     session2.close()
+
+
+async def test_async_access_store_persistence(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    database.init_db()
+
+    async with database.get_async_session() as session1:
+        store1 = database.AsyncAccessStore(session1)
+        await store1.set("test-uuid", True)
+
+    async with database.get_async_session() as session2:
+        store2 = database.AsyncAccessStore(session2)
+        assert await store2.get("test-uuid") is True
+        assert await store2.contains("test-uuid") is True
+        assert await store2.get("missing-uuid", False) is False
+
+    await database.dispose_async_engine()
+
+
+async def test_async_spell_ip_store_persistence(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    database.init_db()
+
+    async with database.get_async_session() as session1:
+        store1 = database.AsyncSpellIPStore(session1)
+        await store1.set("127.0.0.1", {"user_uuid": "u1", "cast_time": datetime.utcnow()})
+
+    session2 = database.get_session()
+    store2 = database.SpellIPStore(session2)
+    assert "127.0.0.1" in store2
+    assert store2.get("127.0.0.1")["user_uuid"] == "u1"
+    session2.close()
+
+    await database.dispose_async_engine()
+
+
+def test_async_database_url_drivers(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "sqlite:///./app.db")
+    assert database._build_async_database_url().drivername == "sqlite+aiosqlite"
+
+    monkeypatch.setenv("DATABASE_URL", "postgresql+psycopg2://u:p@db:5432/postgres")
+    assert database._build_async_database_url().drivername == "postgresql+asyncpg"
+
+
+def test_pool_options_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "12")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "3")
+    monkeypatch.setenv("DB_POOL_RECYCLE", "1800")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "0")
+
+    options = database._build_pool_options("postgresql+psycopg2://u:p@db/postgres")
+    assert options["pool_size"] == 12
+    assert options["max_overflow"] == 3
+    assert options["pool_recycle"] == 1800
+    assert options["pool_pre_ping"] is False
+
+    assert database._build_pool_options("sqlite://") == {}
+
+
+def test_pool_stats_track_checkouts(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path}/db.sqlite")
+    monkeypatch.setenv("DB_POOL_SIZE", "2")
+    database.reset_engine()
+    database.init_db()
+
+    session = database.get_session()
+    database.AccessStore(session).get("any-uuid")
+    checked_out = database.get_pool_stats()["sync"]["checkedout"]
+    session.close()
+
+    assert checked_out == 1
+    assert database.get_pool_stats()["sync"]["checkedout"] == 0
+    assert database.get_pool_stats()["sync"]["size"] == 2
+    database.reset_engine()
+
+
+def test_access_store_read_through_cache(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    database.init_db()
+    access_cache = TTLCache()
+
+    session = database.get_session()
+    store = database.AccessStore(session, cache=access_cache)
+    assert store.get("test-uuid", False) is False
+
+    # A row written behind the cache's back stays hidden by the negative entry
+    other_session = database.get_session()
+    other_session.add(database.UserAccess(uuid="test-uuid", granted=True))
+    other_session.commit()
+    other_session.close()
+    assert "test-uuid" not in store
+
+    # Writes through the store keep the cache coherent
+    store["test-uuid"] = True
+    assert store.get("test-uuid") is True
+    assert access_cache.get("test-uuid") is True
+    session.close()
+
+
+def test_cached_grants_expire_with_access_ttl(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    database.init_db()
+    access_cache = TTLCache(ttl=300)
+
+    session = database.get_session()
+    session.add(
+        database.UserAccess(
+            uuid="old-uuid", granted=True, created_at=datetime.utcnow() - timedelta(seconds=50)
+        )
+    )
+    session.commit()
+    store = database.AccessStore(session, cache=access_cache, ttl=60)
+    with patch("app.cache.time.monotonic", return_value=1000.0):
+        assert store.get("old-uuid") is True
+        database.SpellIPStore(session).claim(
+            "10.0.0.1", {"user_uuid": "new-uuid"}, access_cache=access_cache, access_ttl=60
+        )
+
+    # the cache keeps each grant only for what is left of its 60 s lifetime
+    with patch("app.cache.time.monotonic", return_value=1015.0):
+        assert access_cache.get("old-uuid", None) is None
+        assert access_cache.get("new-uuid") is True
+    with patch("app.cache.time.monotonic", return_value=1065.0):
+        assert access_cache.get("new-uuid", None) is None
+    session.close()
+
+
+def test_spell_ip_store_filter(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    database.init_db()
+
+    session = database.get_session()
+    session.add(database.SuccessfulSpellIP(ip="10.0.0.1", user_uuid="u1"))
+    session.commit()
+
+    ip_filter = BloomFilter(capacity=100)
+    assert database.load_spell_ip_filter(session, ip_filter) == 1
+
+    store = database.SpellIPStore(session, ip_filter=ip_filter)
+    assert "10.0.0.1" in store
+    assert "10.0.0.2" not in store
+    assert store.get("10.0.0.2") is None
+
+    store["10.0.0.2"] = {"user_uuid": "u2", "cast_time": datetime.utcnow()}
+    assert "10.0.0.2" in ip_filter
+    assert store.get("10.0.0.2")["user_uuid"] == "u2"
+    session.close()
+
+
+def test_spell_ip_store_claim_once(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    database.init_db()
+    access_cache = TTLCache()
+
+    session = database.get_session()
+    store = database.SpellIPStore(session)
+    assert store.claim("10.0.0.1", {"user_uuid": "u1"}, access_cache=access_cache) is True
+    assert store.claim("10.0.0.1", {"user_uuid": "u2"}, access_cache=access_cache) is False
+
+    assert store.get("10.0.0.1")["user_uuid"] == "u1"
+    assert database.AccessStore(session).get("u1") is True
+    assert database.AccessStore(session).get("u2") is None
+    assert access_cache.get("u1") is True
+    session.close()
+
+
+def test_spell_ip_store_concurrent_claims(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    database.init_db()
+
+    def claim(index):
+        session = database.get_session()
+        try:
+            return database.SpellIPStore(session).claim(
+                "10.0.0.1", {"user_uuid": f"u{index}"}
+            )
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(claim, range(16)))
+
+    assert results.count(True) == 1
+    session = database.get_session()
+    assert session.query(database.UserAccess).count() == 1
+    session.close()
+
+
+def test_store_writes_upsert(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    database.init_db()
+
+    session = database.get_session()
+    store = database.AccessStore(session)
+    store["test-uuid"] = True
+    store["test-uuid"] = False
+    assert store.get("test-uuid") is False
+    assert session.query(database.UserAccess).count() == 1
+    session.close()
+
+
+def test_spell_ips_are_stored_packed(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    database.init_db()
+
+    session = database.get_session()
+    store = database.SpellIPStore(session)
+    store["::ffff:10.0.0.1"] = {"user_uuid": "u1", "cast_time": datetime.utcnow()}
+    store["2001:DB8::1"] = {"user_uuid": "u2", "cast_time": datetime.utcnow()}
+    store["testclient"] = {"user_uuid": "u3", "cast_time": datetime.utcnow()}
+
+    raw = dict(session.execute(text("SELECT user_uuid, ip FROM successful_spell_ips")).all())
+    assert len(raw["u1"]) == 4 and len(raw["u2"]) == 16
+    assert store.get("10.0.0.1")["user_uuid"] == "u1"
+    assert "2001:db8::1" in store
+    assert "testclient" in store
+    assert sorted(ip for (ip,) in session.query(database.SuccessfulSpellIP.ip)) == [
+        "10.0.0.1",
+        "2001:db8::1",
+        "testclient",
+    ]
+    session.close()
+
+
+def test_spell_ip_prefix_rule(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    database.init_db()
+
+    session = database.get_session()
+    store = database.SpellIPStore(session, ip_filter=IPPrefixIndex(), prefix_v4=24, prefix_v6=64)
+    assert store.claim("10.0.1.7", {"user_uuid": "u1"}) is True
+    assert store.claim("2001:db8:0:1::5", {"user_uuid": "u2"}) is True
+
+    assert store.claim("10.0.1.8", {"user_uuid": "u3"}) is False
+    assert "10.0.1.200" in store
+    assert store.claim("2001:db8:0:1:ffff::1", {"user_uuid": "u4"}) is False
+    assert store.claim("10.0.2.1", {"user_uuid": "u5"}) is True
+    assert store.claim("2001:db8:0:2::1", {"user_uuid": "u6"}) is True
+    # the per-address default is unchanged, also without an index
+    assert database.SpellIPStore(session).claim("10.0.1.9", {"user_uuid": "u7"}) is True
+    session.close()
+
+
+def test_legacy_text_ips_are_packed_on_init(tmp_path):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+    engine = database.get_engine()
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE successful_spell_ips "
+                "(ip VARCHAR PRIMARY KEY, user_uuid VARCHAR, cast_time DATETIME)"
+            )
+        )
+        connection.execute(
+            text("INSERT INTO successful_spell_ips (ip, user_uuid) VALUES (:ip, :uuid)"),
+            [
+                {"ip": "10.0.0.1", "uuid": "u1"},
+                {"ip": "::ffff:10.0.0.1", "uuid": "u2"},
+                {"ip": "2001:db8::1:2:33", "uuid": "u3"},
+            ],
+        )
+
+    database.init_db()
+
+    session = database.get_session()
+    store = database.SpellIPStore(session)
+    assert store.get("10.0.0.1")["user_uuid"] in ("u1", "u2")
+    assert store.get("2001:db8::1:2:33")["user_uuid"] == "u3"
+    assert session.query(database.SuccessfulSpellIP).count() == 2
+    assert database.pack_legacy_ips(engine) == 0
+    session.close()
+
+
+def test_init_db_skips_schema_work_once_marked(tmp_path, monkeypatch):
+    db_url = f"sqlite:///{tmp_path}/db.sqlite"
+    os.environ["DATABASE_URL"] = db_url
+    database.reset_engine()
+
+    assert database.init_db() is True
+    assert database.init_db() is False
+
+    # a newer schema version runs the checks again and records itself
+    monkeypatch.setattr(database, "SCHEMA_VERSION", database.SCHEMA_VERSION + 1)
+    assert database.init_db() is True
+    assert database.init_db() is False
+    session = database.get_session()
+    assert session.query(database.SchemaVersion.version).scalar() == database.SCHEMA_VERSION
+    session.close()
+    database.reset_engine()
@@ -0,0 +1,69 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.rate_limit import KEY_IP, KEY_UUID, RateLimiter, TokenBucketLimiter, parse_limit
+
+
+def test_parse_limit():
+    """Test "rate:burst" specs, with "0" disabling the limit."""
+    assert parse_limit("20:40") == (20.0, 40.0)
+    assert parse_limit("5") == (5.0, 5.0)
+    assert parse_limit("0") is None
+    assert parse_limit("") is None
+
+
+def test_bucket_burst_and_refill():
+    """Test a bucket allows `burst` calls, then refills at `rate` per second."""
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    with patch("app.rate_limit.time.monotonic", return_value=100.0):
+        assert [limiter.consume("ip") for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert limiter.consume("ip") == pytest.approx(0.5)
+        assert limiter.consume("other") == 0.0
+    with patch("app.rate_limit.time.monotonic", return_value=100.5):
+        assert limiter.consume("ip") == 0.0
+        assert limiter.consume("ip") > 0
+    assert limiter.limited == 2
+
+
+def test_bucket_cost_is_all_or_nothing():
+    """Test a multi-token request takes its whole cost or, when refused, nothing."""
+    limiter = TokenBucketLimiter(rate=1, burst=5)
+    with patch("app.rate_limit.time.monotonic", return_value=100.0):
+        assert limiter.consume("ip", 3) == 0.0
+        assert limiter.consume("ip", 3) == pytest.approx(1.0)
+        assert limiter.consume("ip", 2) == 0.0
+        assert limiter.consume("ip") == pytest.approx(1.0)
+
+
+def test_bucket_eviction_bounds_memory():
+    """Test buckets are evicted by LRU size bound and once idle long enough to be full."""
+    limiter = TokenBucketLimiter(rate=1, burst=10, max_keys=2)
+    with patch("app.rate_limit.time.monotonic", return_value=100.0):
+        for key in ("a", "b", "c"):
+            limiter.consume(key)
+    assert len(limiter) == 2
+
+    with patch("app.rate_limit.time.monotonic", return_value=111.0):
+        limiter.consume("d")
+    assert len(limiter) == 1
+    assert limiter.evictions == 3
+
+
+def test_rate_limiter_rules_by_key():
+    """Test each rule consumes from the bucket for its key and skips missing keys."""
+    limited = []
+    limiter = RateLimiter(on_limited=lambda route, key: limited.append((route, key)))
+    limiter.add_rule("/keypress", KEY_IP, (1, 2))
+    limiter.add_rule("/keypress", KEY_UUID, (1, 1))
+    limiter.add_rule("/mines", KEY_UUID, None)
+
+    assert limiter.check("/keypress", "1.2.3.4", "u-1") == 0.0
+    assert limiter.check("/keypress", "1.2.3.4", "u-1") > 0
+    assert limiter.check("/keypress", "1.2.3.4", None) > 0
+    assert limiter.check("/mines", "1.2.3.4", "u-1") == 0.0
+    assert limited == [("/keypress", KEY_UUID), ("/keypress", KEY_IP)]
+    assert limiter.needs_uuid("/keypress") and not limiter.needs_uuid("/mines")
+
+    with pytest.raises(ValueError):
+        limiter.add_rule("/keypress", "cookie", (1, 1))
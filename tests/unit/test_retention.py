@@ -0,0 +1,99 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect
+
+import database
+from retention import ExpiryPurger
+
+
+@pytest.fixture
+def db(tmp_path):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_path}/db.sqlite"
+    database.reset_engine()
+    database.init_db()
+    yield
+    database.reset_engine()
+
+
+def _add_rows(count, age, prefix):
+    session = database.get_session()
+    cast_time = datetime.utcnow() - age
+    for index in range(count):
+        session.add(database.UserAccess(uuid=f"{prefix}-{index}", created_at=cast_time))
+        session.add(
+            database.SuccessfulSpellIP(
+                ip=f"{prefix}-{index}", user_uuid=f"{prefix}-{index}", cast_time=cast_time
+            )
+        )
+    session.commit()
+    session.close()
+
+
+def _count(model):
+    session = database.get_session()
+    try:
+        return session.query(model).count()
+    finally:
+        session.close()
+
+
+def test_timestamp_columns_are_indexed(db):
+    """Test init_db creates the created_at and cast_time indexes."""
+    inspector = inspect(database.get_engine())
+
+    assert ["created_at"] in [index["column_names"] for index in inspector.get_indexes("user_access")]
+    assert ["cast_time"] in [
+        index["column_names"] for index in inspector.get_indexes("successful_spell_ips")
+    ]
+
+
+def test_stores_treat_expired_rows_as_absent(db):
+    """Test expired grants and claims read as missing and a regrant revives access."""
+    _add_rows(1, timedelta(hours=2), "old")
+    session = database.get_session()
+    access = database.AccessStore(session, ttl=3600)
+    spell_ips = database.SpellIPStore(session, ttl=3600)
+
+    assert "old-0" not in access
+    assert spell_ips.get("old-0") is None
+    assert database.AccessStore(session).get("old-0") is True
+
+    access["old-0"] = True
+    assert access.get("old-0") is True
+    session.close()
+
+
+def test_claim_wins_over_expired_row(db):
+    """Test a new claim replaces an expired one but not a live one."""
+    _add_rows(1, timedelta(hours=2), "old")
+    session = database.get_session()
+    spell_ips = database.SpellIPStore(session, ttl=3600)
+    access = database.AccessStore(session, ttl=3600)
+
+    assert spell_ips.claim("old-0", {"user_uuid": "new-user"}) is True
+    assert spell_ips.get("old-0")["user_uuid"] == "new-user"
+    assert access.get("new-user") is True
+    assert spell_ips.claim("old-0", {"user_uuid": "third-user"}) is False
+    session.close()
+
+
+async def test_purge_deletes_expired_rows_in_batches(db):
+    """Test the purger drains the whole backlog in bounded batches."""
+    _add_rows(25, timedelta(days=2), "old")
+    _add_rows(3, timedelta(minutes=1), "new")
+    purger = ExpiryPurger(access_ttl=86400, spell_ip_ttl=86400, batch_size=10)
+
+    purged = await purger.purge(database.get_session)
+
+    assert purged == {"user_access": 25, "successful_spell_ips": 25}
+    assert _count(database.UserAccess) == 3
+    assert _count(database.SuccessfulSpellIP) == 3
+    assert purger.stats() == purged
+
+
+def test_purger_disabled_without_ttl():
+    """Test a purger without TTLs has nothing to do."""
+    assert not ExpiryPurger()
+    assert ExpiryPurger(spell_ip_ttl=60).stats() == {"successful_spell_ips": 0}
@@ -0,0 +1,60 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.static_assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, HashedStaticFiles
+
+
+def _client(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "font").mkdir()
+    (tmp_path / "font" / "runes.ttf").write_bytes(b"\x00\x01" * 300)
+    (tmp_path / "css" / "style.css").write_text(
+        "@font-face { src: url('/static/font/runes.ttf'); }\n" + "body { color: red; }\n" * 40
+    )
+    static_files = HashedStaticFiles(directory=str(tmp_path))
+    app = FastAPI()
+    app.mount("/static", static_files, name="static")
+    return TestClient(app), static_files
+
+
+def test_hashed_urls_and_css_rewrite(tmp_path):
+    """Test assets get content-hashed URLs and CSS references are rewritten."""
+    client, static_files = _client(tmp_path)
+    css_url = static_files.url("css/style.css")
+    font_url = static_files.url("font/runes.ttf")
+
+    assert css_url.startswith("/static/css/style.") and css_url.endswith(".css")
+    assert static_files.url("missing.txt") == "/static/missing.txt"
+    response = client.get(css_url, headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert f"url('{font_url}')" in response.text
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_precompressed_variant_negotiation(tmp_path):
+    """Test the gzip variant is served only when the client accepts it."""
+    client, static_files = _client(tmp_path)
+    css_url = static_files.url("css/style.css")
+
+    gzipped = client.get(css_url, headers={"Accept-Encoding": "gzip, br;q=0"})
+    plain = client.get(css_url, headers={"Accept-Encoding": "gzip;q=0"})
+
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.headers["vary"] == "Accept-Encoding"
+    assert gzipped.text == plain.text
+    assert int(gzipped.headers["content-length"]) < int(plain.headers["content-length"])
+    assert "content-encoding" not in plain.headers
+    assert gzipped.headers["etag"] != plain.headers["etag"]
+
+
+def test_original_names_revalidate(tmp_path):
+    """Test unhashed paths are served with revalidation and answer 304 on a matching ETag."""
+    client, _ = _client(tmp_path)
+
+    response = client.get("/static/font/runes.ttf")
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+    not_modified = client.get(
+        "/static/font/runes.ttf", headers={"If-None-Match": response.headers["etag"]}
+    )
+    assert not_modified.status_code == 304
+    assert client.get("/static/nope.css").status_code == 404
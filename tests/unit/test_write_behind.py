@@ -0,0 +1,129 @@
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+import database
+from write_behind import SpellWriteBehind
+
+
+@pytest.fixture
+def db(tmp_path):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_path}/db.sqlite"
+    database.reset_engine()
+    database.init_db()
+    yield
+    database.reset_engine()
+
+
+def _count(model):
+    session = database.get_session()
+    try:
+        return session.query(model).count()
+    finally:
+        session.close()
+
+
+def test_queued_writes_are_visible_before_flush(db):
+    """Test queued writes are read back from memory until flushed."""
+    queue = SpellWriteBehind()
+    session = database.get_session()
+    spell_ips = database.SpellIPStore(session, write_behind=queue)
+    access = database.AccessStore(session, write_behind=queue)
+
+    spell_ips["10.0.0.1"] = {"user_uuid": "u1", "cast_time": datetime.utcnow()}
+    access["u1"] = True
+
+    assert "10.0.0.1" in spell_ips
+    assert spell_ips.get("10.0.0.1")["user_uuid"] == "u1"
+    assert access.get("u1") is True
+    assert _count(database.SuccessfulSpellIP) == 0
+    assert len(queue) == 2
+    session.close()
+
+
+def test_flush_writes_batched_rows(db):
+    """Test a flush inserts new rows and updates existing ones in one pass."""
+    session = database.get_session()
+    session.add(database.UserAccess(uuid="existing", granted=False))
+    session.commit()
+
+    queue = SpellWriteBehind(batch_size=2)
+    access = database.AccessStore(session, write_behind=queue)
+    for index in range(5):
+        access[f"u{index}"] = True
+    access["existing"] = True
+
+    assert queue.flush(session) == 6
+    assert len(queue) == 0
+    assert _count(database.UserAccess) == 6
+    assert database.AccessStore(session).get("existing") is True
+    assert queue.stats() == {"pending": 0, "flushes": 1, "flushed_rows": 6}
+    session.close()
+
+
+def test_full_queue_falls_back_to_direct_write(db):
+    """Test writes bypass the queue once max_pending is reached."""
+    queue = SpellWriteBehind(max_pending=1)
+    session = database.get_session()
+    access = database.AccessStore(session, write_behind=queue)
+
+    access["queued"] = True
+    access["direct"] = True
+
+    assert len(queue) == 1
+    assert _count(database.UserAccess) == 1
+    session.close()
+
+
+def test_full_queue_claims_fall_back_to_direct_transaction(db):
+    """Test a claim the queue cannot take is committed directly, keeping one cast per IP."""
+    queue = SpellWriteBehind(max_pending=1)
+    session = database.get_session()
+    spell_ips = database.SpellIPStore(session, write_behind=queue)
+    access = database.AccessStore(session, write_behind=queue)
+
+    # the IP fills the queue, so its grant is written directly
+    assert spell_ips.claim("1.1.1.1", {"user_uuid": "u1"}) is True
+    assert spell_ips.claim("2.2.2.2", {"user_uuid": "u2"}) is True
+
+    assert "2.2.2.2" in spell_ips
+    assert access.get("u1") is True
+    assert access.get("u2") is True
+    assert _count(database.UserAccess) == 2
+    assert spell_ips.claim("1.1.1.1", {"user_uuid": "u3"}) is False
+    assert spell_ips.claim("2.2.2.2", {"user_uuid": "u4"}) is False
+    session.close()
+
+
+async def test_async_claims_bypass_the_queue(db):
+    """Test async claims use the atomic transaction, so concurrent casts have one winner."""
+    queue = SpellWriteBehind()
+
+    async def cast(user_uuid):
+        async with database.get_async_session() as session:
+            store = database.AsyncSpellIPStore(session, write_behind=queue)
+            return await store.claim("3.3.3.3", {"user_uuid": user_uuid})
+
+    results = await asyncio.gather(*(cast(f"u{index}") for index in range(5)))
+
+    assert results.count(True) == 1
+    assert len(queue) == 0
+    assert _count(database.SuccessfulSpellIP) == 1
+
+
+async def test_stop_flushes_pending_writes(db):
+    """Test shutting the background task down flushes the queue."""
+    queue = SpellWriteBehind(flush_interval=60)
+    queue.start(database.get_session)
+
+    session = database.get_session()
+    database.SpellIPStore(session, write_behind=queue)["10.0.0.9"] = {
+        "user_uuid": "u9",
+        "cast_time": datetime.utcnow(),
+    }
+    session.close()
+
+    assert await queue.stop(database.get_session) == 1
+    assert _count(database.SuccessfulSpellIP) == 1